@@ -1,8 +1,9 @@
-from .session import Session, init_db
+from .session import Session, AsyncSession, init_db
 from .models import User, File, Admin, SubscriptionLink, FileDelivery
 
 __all__ = [
     'Session', 
+    'AsyncSession',
     'init_db',
     'User', 
     'File', 
@@ -0,0 +1,200 @@
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, exists, inspect, literal, select, text, update
+from database.session import Base, engine
+from services.logger import bot_logger
+
+# Таблица примененных миграций (отдельно от моделей, чтобы не попадать в create_all)
+_meta = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _meta,
+    Column('version', Integer, primary_key=True),
+    Column('description', String),
+    Column('applied_at', DateTime, default=datetime.utcnow)
+)
+
+def add_column(conn, table: str, name: str):
+    """Добавляет колонку, объявленную в модели, если ее еще нет (ALTER TABLE ... ADD COLUMN).
+
+    Тип и значение по умолчанию берутся из модели и компилируются под диалект
+    соединения, поэтому миграция одинаково работает в SQLite и PostgreSQL.
+    """
+    if name in {column['name'] for column in inspect(conn).get_columns(table)}:
+        return
+
+    column = Base.metadata.tables[table].c[name]
+    preparer = conn.dialect.identifier_preparer
+    ddl = f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {preparer.quote(name)} {column.type.compile(dialect=conn.dialect)}"
+    if column.default is not None and column.default.is_scalar and column.default.arg is not None:
+        default = literal(column.default.arg, column.type).compile(
+            dialect=conn.dialect, compile_kwargs={'literal_binds': True}
+        )
+        ddl += f" DEFAULT {default}"
+    conn.execute(text(ddl))
+
+def create_indexes(conn, table: str, *names: str):
+    """Создает индексы, объявленные в модели, если их еще нет"""
+    for index in Base.metadata.tables[table].indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+def _001_hot_path_indexes(conn):
+    create_indexes(conn, 'users', 'ix_users_access_pending')
+    create_indexes(conn, 'files', 'ix_files_distributed', 'ix_files_upload_date')
+    create_indexes(conn, 'file_deliveries', 'ix_file_deliveries_user_id')
+    create_indexes(conn, 'user_activity', 'ix_user_activity_user_action_time', 'ix_user_activity_timestamp')
+
+def _002_file_telegram_id(conn):
+    add_column(conn, 'files', 'telegram_file_id')
+
+def _003_delivery_message_ref(conn):
+    add_column(conn, 'file_deliveries', 'message_id')
+    add_column(conn, 'file_deliveries', 'telegram_file_id')
+
+def _004_file_content_hash(conn):
+    """Колонка SHA-256 содержимого и ее заполнение для уже загруженных файлов.
+
+    Повторяющееся содержимое получает хэш только у первой записи — остальные
+    остаются без него, чтобы не нарушить уникальный индекс.
+    """
+    from services.backup_store import BackupStore
+    from services.file_layout import FileLayout
+
+    add_column(conn, 'files', 'sha256')
+
+    seen = set(conn.execute(text("SELECT sha256 FROM files WHERE sha256 IS NOT NULL")).scalars())
+    rows = conn.execute(text("SELECT id, file_path FROM files WHERE sha256 IS NULL ORDER BY id")).all()
+    duplicates = 0
+    for file_id, stored_path in rows:
+        file_path = FileLayout.resolve(stored_path)
+        if not file_path:
+            continue
+        sha256 = BackupStore.file_sha256(file_path)
+        if sha256 in seen:
+            duplicates += 1
+            continue
+        seen.add(sha256)
+        conn.execute(text("UPDATE files SET sha256 = :sha256 WHERE id = :id"), {'sha256': sha256, 'id': file_id})
+
+    if duplicates:
+        bot_logger.logger.warning(f"Найдено файлов с повторяющимся содержимым: {duplicates}")
+    create_indexes(conn, 'files', 'ix_files_sha256')
+
+def _005_file_path_indexes(conn):
+    create_indexes(conn, 'files', 'ix_files_file_path', 'ix_files_backup_path')
+
+def _006_file_archive_ref(conn):
+    add_column(conn, 'files', 'archive_id')
+    add_column(conn, 'files', 'archive_offset')
+    add_column(conn, 'files', 'archive_size')
+    create_indexes(conn, 'files', 'ix_files_archive_id')
+
+def _007_user_unreachable(conn):
+    add_column(conn, 'users', 'unreachable_at')
+    add_column(conn, 'broadcast_jobs', 'skipped')
+    create_indexes(conn, 'users', 'ix_users_targets')
+
+def _008_subscriber_page_indexes(conn):
+    create_indexes(
+        conn, 'users',
+        'ix_users_access_id', 'ix_users_pending_id', 'ix_users_blocked_id', 'ix_users_received_id'
+    )
+
+def _009_pending_flag_backfill(conn):
+    """pending_file стал резервом доставки: без него пользователь не получит билет.
+
+    Ставим флаг тем, у кого доступ есть, а файла нет (старые записи до миграции).
+    """
+    from database.models import File, User
+    conn.execute(
+        update(User)
+        .where(
+            User.has_access == True,
+            User.files_received == 0,
+            User.pending_file.is_not(True),
+            ~exists().where(File.distributed_to == User.user_id)
+        )
+        .values(pending_file=True)
+    )
+
+def _010_broadcast_lease(conn):
+    add_column(conn, 'broadcast_jobs', 'owner')
+    add_column(conn, 'broadcast_jobs', 'lease_until')
+
+# Каждая миграция должна быть идемпотентной: на новой БД create_all уже создал актуальную схему
+MIGRATIONS = [
+    (1, "Индексы для горячих запросов", _001_hot_path_indexes),
+    (2, "file_id загруженного в Telegram файла", _002_file_telegram_id),
+    (3, "message_id и file_id доставленного сообщения", _003_delivery_message_ref),
+    (4, "SHA-256 содержимого файлов", _004_file_content_hash),
+    (5, "Индексы путей к файлам для сверки с диском", _005_file_path_indexes),
+    (6, "Ссылка на пакет архива билетов", _006_file_archive_ref),
+    (7, "Отметка недоступных пользователей", _007_user_unreachable),
+    (8, "Индексы страниц списка подписчиков", _008_subscriber_page_indexes),
+    (9, "Флаг ожидания билета у пользователей без файлов", _009_pending_flag_backfill),
+    (10, "Аренда рассылок экземплярами бота", _010_broadcast_lease),
+]
+
+def run_migrations(bind=engine) -> int:
+    """Применяет недостающие миграции по порядку, каждую в своей транзакции"""
+    schema_migrations.create(bind, checkfirst=True)
+
+    with bind.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    applied_count = 0
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+
+        with bind.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+        applied_count += 1
+        bot_logger.logger.info(f"Применена миграция {version}: {description}")
+
+    return applied_count
+
+# Запросы горячего пути — каждый должен идти по индексу, а не полным сканом таблицы
+HOT_QUERIES = {
+    'free_file': "SELECT id FROM files WHERE distributed = 0 ORDER BY id LIMIT 1",
+    'pending_users': "SELECT id FROM users WHERE has_access = 1 AND files_received = 0 AND pending_file = 1",
+    'subscribers_page': "SELECT id FROM users WHERE has_access = 1 AND id > 0 ORDER BY id LIMIT 11",
+    'subscribers_pending_page': (
+        "SELECT id FROM users WHERE has_access = 1 AND files_received = 0 AND id > 0 ORDER BY id LIMIT 11"
+    ),
+    'subscribers_received_page': "SELECT id FROM users WHERE files_received > 0 AND id > 0 ORDER BY id LIMIT 11",
+    'subscribers_blocked_page': "SELECT id FROM users WHERE is_blocked = 1 AND id > 0 ORDER BY id LIMIT 11",
+    'broadcast_targets': "SELECT user_id FROM users WHERE has_access = 1 AND is_blocked = 0 AND unreachable_at IS NULL",
+    'user_by_telegram_id': "SELECT id FROM users WHERE user_id = 1",
+    'user_deliveries': "SELECT id FROM file_deliveries WHERE user_id = 1",
+    'user_activity': (
+        "SELECT count(*) FROM user_activity "
+        "WHERE user_id = 1 AND action_type = 'user_action' AND timestamp > '2000-01-01'"
+    ),
+    'old_files': "SELECT id FROM files WHERE upload_date < '2000-01-01'",
+    'file_by_sha256': "SELECT id FROM files WHERE sha256 = 'x'",
+    'file_by_path': "SELECT file_path FROM files WHERE file_path IN ('a', 'b')",
+    'file_by_backup_path': "SELECT backup_path FROM files WHERE backup_path IN ('a', 'b')",
+}
+
+def check_query_plans(bind=engine) -> dict:
+    """Возвращает запросы, которые SQLite выполняет полным сканом таблицы.
+
+    Ключ — имя запроса из HOT_QUERIES, значение — строки EXPLAIN QUERY PLAN со SCAN.
+    Для других СУБД проверка не выполняется.
+    """
+    if bind.dialect.name != 'sqlite':
+        return {}
+
+    regressions = {}
+    with bind.connect() as conn:
+        for name, query in HOT_QUERIES.items():
+            plan = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}"))]
+            scans = [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step]
+            if scans:
+                regressions[name] = scans
+    return regressions
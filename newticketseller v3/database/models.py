@@ -1,11 +1,11 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Float
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text, Float, Index, text
 from datetime import datetime
 from database.session import Base
 
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, unique=True)
+    user_id = Column(BigInteger, unique=True)
     username = Column(String)
     first_name = Column(String)
     has_access = Column(Boolean, default=False)
@@ -16,15 +16,30 @@ class User(Base):
     pending_file = Column(Boolean, default=False)
     is_blocked = Column(Boolean, default=False)
     blocked_at = Column(DateTime, default=None)
-    blocked_by = Column(Integer, default=None)
+    blocked_by = Column(BigInteger, default=None)
+    unreachable_at = Column(DateTime, default=None)  # бот заблокирован или чат не найден
+
+    __table_args__ = (
+        Index('ix_users_access_pending', 'has_access', 'files_received', 'pending_file'),
+        Index('ix_users_targets', 'has_access', 'is_blocked', 'unreachable_at'),
+        # Страницы браузера подписчиков: каждый фильтр читается по индексу в порядке id
+        Index('ix_users_access_id', 'has_access', 'id'),
+        Index('ix_users_pending_id', 'has_access', 'files_received', 'id'),
+        Index('ix_users_blocked_id', 'is_blocked', 'id'),
+        Index(
+            'ix_users_received_id', 'id',
+            sqlite_where=text('files_received > 0'),
+            postgresql_where=text('files_received > 0')
+        ),
+    )
 
 class SubscriptionLink(Base):
     __tablename__ = 'subscription_links'
     id = Column(Integer, primary_key=True)
     token = Column(String, unique=True)
-    created_by = Column(Integer)
+    created_by = Column(BigInteger)
     created_at = Column(DateTime, default=datetime.utcnow)
-    used_by = Column(Integer, default=None)
+    used_by = Column(BigInteger, default=None)
     used_at = Column(DateTime, default=None)
     is_used = Column(Boolean, default=False)
 
@@ -35,34 +50,119 @@ class File(Base):
     hash_name = Column(String, unique=True)
     file_path = Column(String)
     distributed = Column(Boolean, default=False)
-    distributed_to = Column(Integer, default=None)
+    distributed_to = Column(BigInteger, default=None)
     distributed_at = Column(DateTime, default=None)
     backup_path = Column(String)
+    telegram_file_id = Column(String, default=None)
+    sha256 = Column(String, default=None)
+    archive_id = Column(Integer, default=None)  # пакет в ticket_archives, если файл перенесен туда
+    archive_offset = Column(BigInteger, default=None)  # смещение локального заголовка в пакете
+    archive_size = Column(BigInteger, default=None)  # размер сжатых данных в пакете
     upload_date = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index('ix_files_distributed', 'distributed'),
+        Index('ix_files_upload_date', 'upload_date'),
+        Index('ix_files_sha256', 'sha256', unique=True),
+        Index('ix_files_file_path', 'file_path'),
+        Index('ix_files_backup_path', 'backup_path'),
+        Index('ix_files_archive_id', 'archive_id'),
+    )
+
+class TicketArchive(Base):
+    __tablename__ = 'ticket_archives'
+    id = Column(Integer, primary_key=True)
+    path = Column(String, unique=True)
+    member_count = Column(Integer, default=0)
+    size = Column(BigInteger)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class BackupBlob(Base):
+    __tablename__ = 'backup_blobs'
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String, unique=True)
+    path = Column(String, unique=True)
+    size = Column(BigInteger)
+    ref_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class FileDelivery(Base):
     __tablename__ = 'file_deliveries'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer)
+    user_id = Column(BigInteger)
     file_id = Column(Integer)
     sent_at = Column(DateTime, default=datetime.utcnow)
     delivery_status = Column(String, default='sent')
+    message_id = Column(BigInteger, default=None)
+    telegram_file_id = Column(String, default=None)
     error_message = Column(Text)
     recovery_attempts = Column(Integer, default=0)
     last_recovery_attempt = Column(DateTime)
 
+    __table_args__ = (
+        Index('ix_file_deliveries_user_id', 'user_id'),
+    )
+
+class BroadcastJob(Base):
+    """Рассылка /sent, которая продолжается после перезапуска бота"""
+    __tablename__ = 'broadcast_jobs'
+    id = Column(Integer, primary_key=True)
+    created_by = Column(BigInteger)
+    status = Column(String, default='running')  # running, paused, cancelled, done
+    payload = Column(Text)  # содержимое сообщения в JSON (BroadcastMessage)
+    status_chat_id = Column(BigInteger, default=None)  # сообщение с прогрессом у администратора
+    status_message_id = Column(BigInteger, default=None)
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    unreachable = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)  # недоступные пользователи, исключенные из рассылки
+    owner = Column(String, default=None)  # экземпляр бота, который ведет рассылку
+    lease_until = Column(DateTime, default=None)  # до какого момента owner держит рассылку
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, default=None)
+
+    __table_args__ = (
+        Index('ix_broadcast_jobs_status', 'status'),
+    )
+
+class BroadcastRecipient(Base):
+    __tablename__ = 'broadcast_recipients'
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer)
+    user_id = Column(BigInteger)
+    status = Column(String, default='pending')  # pending, sent, failed, unreachable
+
+    __table_args__ = (
+        Index('ix_broadcast_recipients_job_status', 'job_id', 'status', 'id'),
+    )
+
 class Admin(Base):
     __tablename__ = 'admins'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, unique=True)
+    user_id = Column(BigInteger, unique=True)
     username = Column(String)
     first_name = Column(String)
-    added_by = Column(Integer)
+    added_by = Column(BigInteger)
     added_at = Column(DateTime, default=datetime.utcnow)
 
+class JobState(Base):
+    """Прогресс фоновых задач (водяные знаки), переживающий перезапуск бота"""
+    __tablename__ = 'job_state'
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True)
+    value = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class UserActivity(Base):
     __tablename__ = 'user_activity'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer)
+    user_id = Column(BigInteger)
     action_type = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_user_activity_user_action_time', 'user_id', 'action_type', 'timestamp'),
+        Index('ix_user_activity_timestamp', 'timestamp'),
+    )
@@ -1,10 +1,79 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool
+from config import Config
 
 Base = declarative_base()
-engine = create_engine('sqlite:///subscription_bot.db', echo=False)
+
+# Асинхронные драйверы для синхронных URL из Config.DATABASE_URL
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+def _async_url(url):
+    """Строит URL асинхронного движка из синхронного"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Неподдерживаемая СУБД: {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+def _engine_options(url) -> dict:
+    """Параметры пула соединений (для SQLite используется пул по умолчанию)"""
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {}
+    if not Config.DB_POOL_SIZE:
+        # Без пула: соединение открывается на каждую сессию (например, за pgbouncer)
+        return {'poolclass': NullPool}
+    return {
+        'pool_size': Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_recycle': Config.DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+# Синхронный движок: инициализация схемы и работа из фоновых потоков
+engine = create_engine(Config.DATABASE_URL, echo=False, **_engine_options(Config.DATABASE_URL))
 Session = sessionmaker(bind=engine)
 
+# Асинхронный движок: все запросы из обработчиков и сервисов в event loop
+async_engine = create_async_engine(
+    _async_url(Config.DATABASE_URL), echo=False, **_engine_options(Config.DATABASE_URL)
+)
+AsyncSession = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Применяет настройки SQLite к каждому новому соединению"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={Config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT)}")
+        cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size={int(Config.SQLITE_CACHE_SIZE)}")
+        cursor.execute(f"PRAGMA mmap_size={int(Config.SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
+
+if engine.dialect.name == 'sqlite':
+    event.listen(engine, 'connect', _configure_sqlite)
+    event.listen(async_engine.sync_engine, 'connect', _configure_sqlite)
+
 def init_db():
-    """Инициализация базы данных"""
-    Base.metadata.create_all(engine)
\ No newline at end of file
+    """Инициализация базы данных: создание таблиц и применение миграций"""
+    import database.models  # регистрирует модели в Base.metadata
+    from database.migrations import run_migrations, check_query_plans
+    from services.logger import bot_logger
+    
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    
+    for name, scans in check_query_plans(engine).items():
+        bot_logger.logger.warning(f"Запрос {name} выполняется без индекса: {'; '.join(scans)}")
+
+async def dispose_db(application=None):
+    """Закрывает соединения движков при остановке бота"""
+    await async_engine.dispose()
+    engine.dispose()
@@ -0,0 +1,46 @@
+from database.session import AsyncSession
+from config import Config
+
+async def stream_keyset(statement, key_column, batch_size: int = None):
+    """Асинхронно отдает результаты запроса порциями по ``batch_size``.
+
+    Порции выбираются keyset-пагинацией по уникальной возрастающей колонке
+    ``key_column`` (``WHERE key > последний ORDER BY key LIMIT n``), каждая
+    в своей короткой сессии. В памяти одновременно находится не больше
+    одной порции, а между порциями соединение и транзакция не удерживаются —
+    в отличие от серверного курсора с ``yield_per``, который держал бы
+    читающую транзакцию все время медленной обработки (рассылки).
+
+    Запрос одной сущности или колонки отдает объекты (значения), иначе — строки.
+    Объекты отсоединены от сессии и годятся только для чтения.
+    """
+    batch_size = batch_size or Config.STREAM_BATCH_SIZE
+    descriptions = statement.column_descriptions
+    scalars = len(descriptions) == 1
+    entity = scalars and isinstance(descriptions[0]['expr'], type)
+    last_key = None
+
+    while True:
+        page = statement.order_by(key_column).limit(batch_size)
+        if last_key is not None:
+            page = page.where(key_column > last_key)
+
+        session = AsyncSession()
+        try:
+            result = await session.execute(page)
+            rows = result.scalars().all() if scalars else result.all()
+        finally:
+            await session.close()
+
+        for row in rows:
+            yield row
+        if len(rows) < batch_size:
+            return
+
+        last = rows[-1]
+        if entity:
+            last_key = getattr(last, key_column.key)
+        elif scalars:
+            last_key = last
+        else:
+            last_key = last._mapping[key_column]
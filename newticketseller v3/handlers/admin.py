@@ -1,9 +1,15 @@
+import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from services.auth import AuthService
+from services.request_context import RequestContext
 from services.logger import bot_logger
 from services.subscription import SubscriptionService
-from database.session import Session
+from utils.excel_generator import ReportExporter, REPORTS
+from config import Config
+from services.reachability import ReachabilityService
+from sqlalchemy import select, func
+from database.session import AsyncSession
 from database.models import User, File, Admin
 
 class AdminHandler:
@@ -14,14 +20,15 @@ class AdminHandler:
         """Панель администратора"""
         user = update.effective_user
         
-        if not AuthService.is_admin(user.id):
-            await update.message.reply_text("❌ Доступ запрещен")
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
+            await update.effective_message.reply_text("❌ Доступ запрещен")
             return
         
         bot_logger.log_admin_action(user, "Открытие панели администратора")
         
         # Получаем статистику
-        users_without_files, free_files = AdminHandler._get_stats()
+        users_without_files, free_files = await AdminHandler._get_stats()
         
         keyboard = [
             [InlineKeyboardButton("🔗 Создать ссылку подписки", callback_data="create_link")],
@@ -31,6 +38,7 @@ class AdminHandler:
             [InlineKeyboardButton(f"🚀 Отправить ожидающим ({users_without_files})", callback_data="send_pending")],
             [InlineKeyboardButton("📦 Архив свободных билетов", callback_data="free_tickets_archive")],
             [InlineKeyboardButton("👥 Список подписчиков", callback_data="subscribers_list")],
+            [InlineKeyboardButton("📑 Выгрузить отчет", callback_data="reports")],
             [InlineKeyboardButton("👑 Управление админами", callback_data="manage_admins")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -39,38 +47,139 @@ class AdminHandler:
         if users_without_files > 0:
             status_info = f"\n\n⚠️ *{users_without_files} пользователей ожидают файлы*\n🆓 Свободных файлов: {free_files}"
         
-        await update.message.reply_text(
-            f"👑 Панель управления{status_info}\n\n"
-            "Выберите действие:",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        text = f"👑 Панель управления{status_info}\n\nВыберите действие:"
+        if update.callback_query:
+            # Кнопка «В панель»: у callback нет update.message, меняем само сообщение
+            await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        else:
+            await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     
     @staticmethod
-    def _get_stats():
+    async def _get_stats():
         """Получает статистику для админ-панели"""
-        session = Session()
+        session = AsyncSession()
         try:
-            users_without_files = session.query(User).filter(
-                User.has_access == True,
-                User.files_received == 0
-            ).count()
+            users_without_files = await session.scalar(
+                select(func.count()).select_from(User).filter(
+                    User.has_access == True,
+                    User.files_received == 0,
+                    ReachabilityService.reachable()
+                )
+            )
             
-            free_files = session.query(File).filter_by(distributed=False).count()
+            free_files = await session.scalar(
+                select(func.count()).select_from(File).filter_by(distributed=False)
+            )
             return users_without_files, free_files
         except Exception as e:
             bot_logger.logger.error(f"Ошибка получения статистики: {e}")
             return 0, 0
         finally:
-            session.close()
+            await session.close()
+    
+    @staticmethod
+    async def export_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выгрузка отчета: /report [users|deliveries|links] [xlsx|csv]"""
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
+            await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+            return
+        
+        kind = context.args[0] if context.args else 'users'
+        fmt = context.args[1] if len(context.args or []) > 1 else None
+        if kind not in REPORTS or fmt not in (None, 'xlsx', 'csv'):
+            await update.message.reply_text(
+                "⚠️ Использование: /report [users|deliveries|links] [xlsx|csv]\n"
+                "Пример: /report deliveries csv"
+            )
+            return
+        
+        # Сборка идет в фоне, чтобы не задерживать остальные апдейты; повторные
+        # запросы того же отчета присоединяются к ней в ReportExporter.export
+        context.application.create_task(
+            AdminHandler.send_report(context.bot, update.effective_chat.id, update.effective_user, kind, fmt)
+        )
+    
+    @staticmethod
+    async def send_report(bot, chat_id: int, user, kind: str, fmt: str = None):
+        """Собирает отчет (или ждет уже идущую сборку) и отправляет файл администратору"""
+        bot_logger.log_admin_action(user, "Выгрузка отчета", kind)
+        status_message = await bot.send_message(
+            chat_id=chat_id, text=f"⏳ Готовлю отчет «{REPORTS[kind].title}»..."
+        )
+        
+        try:
+            report, joined = await ReportExporter.export(kind, fmt)
+        except Exception as e:
+            bot_logger.logger.error(f"Ошибка выгрузки отчета {kind}: {e}")
+            await status_message.edit_text(f"❌ Ошибка при выгрузке отчета: {e}")
+            return
+        
+        summary = (
+            f"📑 {REPORTS[kind].title}: {report.rows} строк, "
+            f"{report.size / 1024 / 1024:.1f} MB, {report.elapsed:.0f} с"
+        )
+        if joined:
+            summary += "\n♻️ Отчет уже собирался по другому запросу"
+        
+        if report.size > Config.EXPORT_MAX_UPLOAD:
+            await status_message.edit_text(
+                f"{summary}\n\n⚠️ Файл больше лимита Telegram, он сохранен на сервере:\n{report.path}"
+            )
+            return
+        
+        try:
+            with open(report.path, 'rb') as report_file:
+                await bot.send_document(
+                    chat_id=chat_id,
+                    document=report_file,
+                    filename=os.path.basename(report.path),
+                    caption=summary
+                )
+            await status_message.delete()
+        except Exception as e:
+            bot_logger.logger.error(f"Ошибка отправки отчета {report.path}: {e}")
+            await status_message.edit_text(f"{summary}\n\n❌ Не удалось отправить файл: {e}")
     
     @staticmethod
     async def add_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Добавление администратора"""
         user = update.effective_user
         
-        if not AuthService.is_admin(user.id):
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
             await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
             return
         
-        # ... остальная логика добавления админа
\ No newline at end of file
+        if not context.args:
+            await update.message.reply_text(
+                "⚠️ Использование: /addadmin USER_ID\n"
+                "Пример: /addadmin 123456789"
+            )
+            return
+        
+        try:
+            target_user_id = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("❌ Неверный формат USER_ID")
+            return
+        
+        session = AsyncSession()
+        try:
+            target_user = await session.scalar(select(User).filter_by(user_id=target_user_id))
+        finally:
+            await session.close()
+        
+        added = await AuthService.add_admin(
+            target_user_id,
+            added_by=user.id,
+            username=target_user.username if target_user else "",
+            first_name=target_user.first_name if target_user else ""
+        )
+        
+        if not added:
+            await update.message.reply_text(f"⚠️ Пользователь {target_user_id} уже является администратором.")
+            return
+        
+        bot_logger.log_admin_action(user, "Добавление администратора", f"user_id={target_user_id}")
+        await update.message.reply_text(f"✅ Пользователь {target_user_id} назначен администратором.")
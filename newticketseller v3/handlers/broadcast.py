@@ -1,10 +1,12 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from database.session import Session
+from sqlalchemy import select
+from database.session import AsyncSession
 from database.models import User
-from services.auth import AuthService
+from services.request_context import RequestContext
 from services.logger import bot_logger
 from services.antispam import AntiSpamService
+from services.broadcast import BroadcastJobService, BroadcastMessage
 
 class BroadcastHandler:
     
@@ -12,7 +14,8 @@ class BroadcastHandler:
     async def send_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         
-        if not AuthService.is_admin(user.id):
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
             await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
             return
         
@@ -30,101 +33,117 @@ class BroadcastHandler:
             )
             return
         
-        session = Session()
+        broadcast = BroadcastMessage.from_command(
+            text=" ".join(context.args) if context.args else None,
+            original=message.reply_to_message
+        )
+        if broadcast is None:
+            await message.reply_text("❌ Этот тип сообщения не поддерживается для рассылки.")
+            return
+        
         try:
-            users = session.query(User).filter(
-                User.has_access == True,
-                User.is_blocked == False
-            ).all()
+            status_message = await message.reply_text("📤 Готовлю рассылку...")
+            job = await BroadcastJobService.create(user.id, broadcast, status_message)
             
-            if not users:
-                await message.reply_text("❌ Нет активных пользователей для рассылки.")
+            if not job.total:
+                await status_message.edit_text("❌ Нет активных пользователей для рассылки.")
                 return
             
-            sent_count = 0
-            failed_count = 0
-            
-            status_message = await message.reply_text(
-                f"📤 Начинаю рассылку {len(users)} пользователям..."
-            )
-            
-            if message.reply_to_message:
-                original = message.reply_to_message
-                
-                for user_obj in users:
-                    try:
-                        if original.text:
-                            await context.bot.send_message(
-                                chat_id=user_obj.user_id,
-                                text=original.text
-                            )
-                        elif original.photo:
-                            await context.bot.send_photo(
-                                chat_id=user_obj.user_id,
-                                photo=original.photo[-1].file_id,
-                                caption=original.caption
-                            )
-                        elif original.video:
-                            await context.bot.send_video(
-                                chat_id=user_obj.user_id,
-                                video=original.video.file_id,
-                                caption=original.caption
-                            )
-                        elif original.location:
-                            await context.bot.send_location(
-                                chat_id=user_obj.user_id,
-                                latitude=original.location.latitude,
-                                longitude=original.location.longitude
-                            )
-                        elif original.document:
-                            await context.bot.send_document(
-                                chat_id=user_obj.user_id,
-                                document=original.document.file_id,
-                                caption=original.caption
-                            )
-                        
-                        sent_count += 1
-                    except Exception as e:
-                        failed_count += 1
-                        bot_logger.logger.error(f"Ошибка отправки user_id={user_obj.user_id}: {e}")
-            
-            else:
-                broadcast_text = " ".join(context.args)
-                
-                for user_obj in users:
-                    try:
-                        await context.bot.send_message(
-                            chat_id=user_obj.user_id,
-                            text=broadcast_text
-                        )
-                        sent_count += 1
-                    except Exception as e:
-                        failed_count += 1
-                        bot_logger.logger.error(f"Ошибка отправки user_id={user_obj.user_id}: {e}")
-            
             await status_message.edit_text(
-                f"✅ Рассылка завершена!\n\n"
-                f"📨 Отправлено: {sent_count}\n"
-                f"❌ Ошибок: {failed_count}"
+                f"📤 Рассылка #{job.id}: начинаю отправку {job.total} пользователям...\n\n"
+                f"⏸ /bpause {job.id} · ▶️ /bresume {job.id} · 🛑 /bcancel {job.id}"
             )
+            BroadcastJobService.start(context.application, job.id)
             
             bot_logger.log_admin_action(
                 user, 
                 f"Рассылка сообщений", 
-                f"Отправлено: {sent_count}, Ошибок: {failed_count}"
+                f"Задача #{job.id}, получателей: {job.total}"
             )
             
         except Exception as e:
             bot_logger.logger.error(f"Ошибка рассылки: {e}")
             await message.reply_text(f"❌ Ошибка при рассылке: {e}")
-        finally:
-            session.close()
+    
+    @staticmethod
+    async def list_broadcasts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
+            await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+            return
+        
+        jobs = await BroadcastJobService.get_active()
+        if not jobs:
+            await update.message.reply_text("📭 Нет незавершенных рассылок.")
+            return
+        
+        await update.message.reply_text(
+            "\n\n".join(BroadcastJobService.format_progress(job) for job in jobs)
+        )
+    
+    @staticmethod
+    async def _job_command(update: Update, context: ContextTypes.DEFAULT_TYPE, command: str):
+        """Общая часть /bpause, /bresume и /bcancel: проверка прав и номер задачи"""
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
+            await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+            return None
+        
+        if not context.args:
+            await update.message.reply_text(
+                f"⚠️ Использование: /{command} JOB_ID\n"
+                "Список рассылок: /broadcasts"
+            )
+            return None
+        
+        try:
+            return int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("❌ Неверный формат JOB_ID")
+            return None
+    
+    @staticmethod
+    async def pause_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        job_id = await BroadcastHandler._job_command(update, context, "bpause")
+        if job_id is None:
+            return
+        
+        if await BroadcastJobService.pause(job_id):
+            await update.message.reply_text(f"⏸ Рассылка #{job_id} приостановлена.")
+            bot_logger.log_admin_action(update.effective_user, "Пауза рассылки", f"Задача #{job_id}")
+        else:
+            await update.message.reply_text(f"⚠️ Рассылка #{job_id} не выполняется.")
+    
+    @staticmethod
+    async def resume_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        job_id = await BroadcastHandler._job_command(update, context, "bresume")
+        if job_id is None:
+            return
+        
+        if await BroadcastJobService.resume(context.application, job_id):
+            await update.message.reply_text(f"▶️ Рассылка #{job_id} продолжена.")
+            bot_logger.log_admin_action(update.effective_user, "Продолжение рассылки", f"Задача #{job_id}")
+        else:
+            await update.message.reply_text(f"⚠️ Рассылка #{job_id} не на паузе.")
+    
+    @staticmethod
+    async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        job_id = await BroadcastHandler._job_command(update, context, "bcancel")
+        if job_id is None:
+            return
+        
+        if await BroadcastJobService.cancel(job_id):
+            await update.message.reply_text(f"🛑 Рассылка #{job_id} отменена.")
+            bot_logger.log_admin_action(update.effective_user, "Отмена рассылки", f"Задача #{job_id}")
+        else:
+            await update.message.reply_text(f"⚠️ Рассылка #{job_id} уже завершена или не найдена.")
     
     @staticmethod
     async def block_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         
-        if not AuthService.is_admin(user.id):
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
             await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
             return
         
@@ -141,22 +160,22 @@ class BroadcastHandler:
             await update.message.reply_text("❌ Неверный формат USER_ID")
             return
         
-        session = Session()
+        session = AsyncSession()
         try:
             from datetime import datetime
             
-            target_user = session.query(User).filter_by(user_id=target_user_id).first()
+            target_user = await session.scalar(select(User).filter_by(user_id=target_user_id))
             
             if not target_user:
                 await update.message.reply_text("❌ Пользователь не найден в базе данных.")
-                session.close()
+                await session.close()
                 return
             
             if target_user.is_blocked:
                 await update.message.reply_text(
                     f"⚠️ Пользователь {target_user_id} уже заблокирован."
                 )
-                session.close()
+                await session.close()
                 return
             
             target_user.is_blocked = True
@@ -164,7 +183,7 @@ class BroadcastHandler:
             target_user.blocked_by = user.id
             target_user.has_access = False
             
-            session.commit()
+            await session.commit()
             
             await update.message.reply_text(
                 f"✅ Пользователь {target_user_id} успешно заблокирован.\n"
@@ -187,17 +206,18 @@ class BroadcastHandler:
                 pass
             
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             bot_logger.logger.error(f"Ошибка блокировки пользователя: {e}")
             await update.message.reply_text(f"❌ Ошибка: {e}")
         finally:
-            session.close()
+            await session.close()
     
     @staticmethod
     async def unblock_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         
-        if not AuthService.is_admin(user.id):
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
             await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
             return
         
@@ -214,20 +234,20 @@ class BroadcastHandler:
             await update.message.reply_text("❌ Неверный формат USER_ID")
             return
         
-        session = Session()
+        session = AsyncSession()
         try:
-            target_user = session.query(User).filter_by(user_id=target_user_id).first()
+            target_user = await session.scalar(select(User).filter_by(user_id=target_user_id))
             
             if not target_user:
                 await update.message.reply_text("❌ Пользователь не найден в базе данных.")
-                session.close()
+                await session.close()
                 return
             
             if not target_user.is_blocked:
                 await update.message.reply_text(
                     f"⚠️ Пользователь {target_user_id} не заблокирован."
                 )
-                session.close()
+                await session.close()
                 return
             
             target_user.is_blocked = False
@@ -235,7 +255,7 @@ class BroadcastHandler:
             target_user.blocked_by = None
             target_user.has_access = True
             
-            session.commit()
+            await session.commit()
             
             await update.message.reply_text(
                 f"✅ Пользователь {target_user_id} успешно разблокирован.\n"
@@ -258,8 +278,8 @@ class BroadcastHandler:
                 pass
             
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             bot_logger.logger.error(f"Ошибка разблокировки пользователя: {e}")
             await update.message.reply_text(f"❌ Ошибка: {e}")
         finally:
-            session.close()
+            await session.close()
@@ -1,14 +1,21 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from services.auth import AuthService
+from services.request_context import RequestContext
 from services.logger import bot_logger
 from services.subscription import SubscriptionService
-from database.session import Session
+from services.reachability import ReachabilityService
+from sqlalchemy import select, func
+from database.session import AsyncSession
+from database.streaming import stream_keyset
+from utils.excel_generator import ReportExporter, REPORTS
 from database.models import User, File, FileDelivery, SubscriptionLink, Admin
 
 class CallbackHandler:
     """Обработчик callback кнопок"""
     
+    _send_pending_task = None  # фоновая отправка файлов ожидающим
+    
     @staticmethod
     async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик нажатий на кнопки"""
@@ -24,9 +31,9 @@ class CallbackHandler:
             return
         
         elif query.data == "delivery_stats":
-            session = Session()
+            session = AsyncSession()
             try:
-                deliveries = session.query(FileDelivery).filter_by(user_id=user.id).all()
+                deliveries = (await session.scalars(select(FileDelivery).filter_by(user_id=user.id))).all()
                 
                 if not deliveries:
                     await query.edit_message_text("📊 У вас еще нет истории доставок.")
@@ -35,7 +42,7 @@ class CallbackHandler:
                 stats_text = "📊 Детальная статистика доставок:\n\n"
                 
                 for i, delivery in enumerate(deliveries[-10:], 1):
-                    file = session.query(File).filter_by(id=delivery.file_id).first()
+                    file = await session.get(File, delivery.file_id)
                     file_name = file.original_name if file else "Неизвестно"
                     
                     status_emoji = "✅" if delivery.delivery_status == 'sent' else "🔁" if delivery.delivery_status == 'recovered' else "❌"
@@ -60,11 +67,12 @@ class CallbackHandler:
                 bot_logger.logger.error(f"Ошибка при получении статистики доставок: {e}")
                 await query.edit_message_text("❌ Ошибка при получении статистики.")
             finally:
-                session.close()
+                await session.close()
             return
         
         # Проверяем права доступа для админ-функций
-        if not AuthService.is_admin(user.id):
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
             await query.edit_message_text("❌ Доступ запрещен")
             return
         
@@ -90,9 +98,32 @@ class CallbackHandler:
         elif query.data == "subscribers_list":
             await CallbackHandler._handle_subscribers_list(query, user)
         
+        elif query.data.startswith("subs:"):
+            await CallbackHandler._handle_subscribers_page(query, query.data)
+        
+        elif query.data == "reports":
+            await CallbackHandler._handle_reports(query)
+        
+        elif query.data.startswith("report:"):
+            from handlers.admin import AdminHandler
+            kind = query.data.split(":", 1)[1]
+            if kind in REPORTS:
+                context.application.create_task(
+                    AdminHandler.send_report(context.bot, query.message.chat_id, user, kind)
+                )
+        
         elif query.data == "manage_admins":
             await CallbackHandler._handle_manage_admins(query, user)
         
+        elif query.data == "add_admin_panel":
+            await CallbackHandler._handle_add_admin_panel(query, user)
+        
+        elif query.data == "remove_admin_panel":
+            await CallbackHandler._handle_remove_admin_panel(query, user)
+        
+        elif query.data.startswith("remove_admin:"):
+            await CallbackHandler._handle_remove_admin(query, user)
+        
         elif query.data == "back_to_admin":
             await CallbackHandler._handle_back_to_admin(update, context)
     
@@ -101,7 +132,7 @@ class CallbackHandler:
         """Обработка создания ссылки"""
         bot_logger.log_admin_action(user, "Создание ссылки подписки")
         
-        link = SubscriptionService.create_subscription_link(user.id)
+        link = await SubscriptionService.create_subscription_link(user.id)
         if link:
             await query.edit_message_text(
                 f"✅ Ссылка для подписки создана!\n\n"
@@ -118,15 +149,15 @@ class CallbackHandler:
         """Обработка показа статистики"""
         bot_logger.log_admin_action(user, "Просмотр статистики")
         
-        session = Session()
+        session = AsyncSession()
         try:
-            users_count = session.query(User).count()
-            active_users = session.query(User).filter_by(has_access=True).count()
-            files_count = session.query(File).count()
-            distributed_files = session.query(File).filter_by(distributed=True).count()
-            free_files = session.query(File).filter_by(distributed=False).count()
-            links_count = session.query(SubscriptionLink).count()
-            used_links = session.query(SubscriptionLink).filter_by(is_used=True).count()
+            users_count = await session.scalar(select(func.count()).select_from(User))
+            active_users = await session.scalar(select(func.count()).select_from(User).filter_by(has_access=True))
+            files_count = await session.scalar(select(func.count()).select_from(File))
+            distributed_files = await session.scalar(select(func.count()).select_from(File).filter_by(distributed=True))
+            free_files = await session.scalar(select(func.count()).select_from(File).filter_by(distributed=False))
+            links_count = await session.scalar(select(func.count()).select_from(SubscriptionLink))
+            used_links = await session.scalar(select(func.count()).select_from(SubscriptionLink).filter_by(is_used=True))
             
             stats_text = (
                 f"📊 Статистика бота:\n\n"
@@ -144,68 +175,89 @@ class CallbackHandler:
             bot_logger.logger.error(f"Ошибка при получении статистики: {e}")
             await query.edit_message_text("❌ Ошибка при получении статистики")
         finally:
-            session.close()
+            await session.close()
     
     @staticmethod
     async def _handle_send_pending(query, user, context):
         """Обработка отправки файлов ожидающим"""
         bot_logger.log_admin_action(user, "Автоматическая отправка файлов ожидающим")
         
+        running = CallbackHandler._send_pending_task
+        if running is not None and not running.done():
+            await query.edit_message_text("⏳ Отправка ожидающим уже идет, итог придет в ее сообщение")
+            return
+        
         await query.edit_message_text("🔍 Ищу пользователей без файлов...")
         
-        session = Session()
+        session = AsyncSession()
         try:
-            users_without_files = session.query(User).filter(
+            pending_filter = (
                 User.has_access == True,
-                User.files_received == 0
-            ).all()
+                User.files_received == 0,
+                User.pending_file == True,
+                ReachabilityService.reachable()
+            )
+            users_count = await session.scalar(
+                select(func.count()).select_from(User).filter(*pending_filter)
+            )
             
-            if not users_without_files:
+            if not users_count:
                 await query.edit_message_text("✅ Все пользователи уже получили свои файлы!")
                 return
             
-            free_files = session.query(File).filter_by(distributed=False).all()
+            free_files_count = await session.scalar(
+                select(func.count()).select_from(File).filter_by(distributed=False)
+            )
             
-            if not free_files:
+            if not free_files_count:
                 await query.edit_message_text("❌ Нет свободных файлов для отправки!")
                 return
             
-            if len(free_files) < len(users_without_files):
+            if free_files_count < users_count:
                 await query.edit_message_text(
                     f"⚠️ Недостаточно свободных файлов!\n"
-                    f"Пользователей без файлов: {len(users_without_files)}\n"
-                    f"Свободных файлов: {len(free_files)}"
+                    f"Пользователей без файлов: {users_count}\n"
+                    f"Свободных файлов: {free_files_count}"
                 )
                 return
             
             await query.edit_message_text(
-                f"🔄 Начинаю отправку файлов {len(users_without_files)} пользователям..."
+                f"🔄 Начинаю отправку файлов {users_count} пользователям..."
+            )
+            # Рассылка идет в фоне, итог появится в этом же сообщении
+            CallbackHandler._send_pending_task = context.application.create_task(
+                CallbackHandler._send_pending(context.application, query, pending_filter)
             )
             
-            # Импортируем FileManager локально, чтобы избежать циклического импорта
-            from services.file_manager import FileManager
-            
-            sent_count = 0
-            failed_users = []
+        except Exception as e:
+            bot_logger.logger.error(f"Ошибка в send_pending: {e}")
+            await query.edit_message_text("❌ Ошибка при отправке файлов")
+        finally:
+            await session.close()
+    
+    @staticmethod
+    async def _send_pending(application, query, pending_filter: tuple):
+        """Отправляет файлы ожидающим и пишет итог в сообщение ``query``"""
+        try:
+            # Импортируем DeliveryEngine локально, чтобы избежать циклического импорта
+            from services.delivery import DeliveryEngine
             
-            for user_obj, file in zip(users_without_files, free_files):
-                try:
-                    success = await FileManager.send_file_to_user(user_obj, file, context.application)
-                    if success:
-                        sent_count += 1
-                    else:
-                        failed_users.append(f"{user_obj.first_name} (@{user_obj.username})")
-                        
-                except Exception as e:
-                    bot_logger.logger.error(f"Ошибка отправки пользователю {user_obj.user_id}: {e}")
-                    failed_users.append(f"{user_obj.first_name} (@{user_obj.username})")
-                    continue
+            report = await DeliveryEngine(application).run(
+                stream_keyset(select(User).filter(*pending_filter), User.id)
+            )
+            failed_users = [
+                f"{user_obj.first_name} (@{user_obj.username})"
+                for user_obj in report.failed_users + report.no_file_users
+            ]
             
             result_message = (
                 f"✅ Автоматическая отправка завершена!\n\n"
-                f"📨 Успешно отправлено: {sent_count}/{len(users_without_files)}\n"
-                f"👥 Обработано пользователей: {len(users_without_files)}"
+                f"📨 Успешно отправлено: {report.sent}/{report.total}\n"
+                f"👥 Обработано пользователей: {report.total}\n"
+                f"⏱ Время: {report.elapsed:.1f} с ({report.rate:.1f} файлов/с)"
             )
+            if report.skipped_users:
+                result_message += f"\n♻️ Уже получили файл в другой рассылке: {len(report.skipped_users)}"
             
             if failed_users:
                 result_message += f"\n\n❌ Не удалось отправить {len(failed_users)} пользователям:\n"
@@ -217,9 +269,10 @@ class CallbackHandler:
             
         except Exception as e:
             bot_logger.logger.error(f"Ошибка в send_pending: {e}")
-            await query.edit_message_text("❌ Ошибка при отправке файлов")
-        finally:
-            session.close()
+            try:
+                await query.edit_message_text("❌ Ошибка при отправке файлов")
+            except Exception as edit_error:
+                bot_logger.logger.debug(f"Не удалось сообщить об ошибке отправки: {edit_error}")
     
     @staticmethod
     async def _handle_upload_zip(query, user):
@@ -248,44 +301,85 @@ class CallbackHandler:
     async def _handle_subscribers_list(query, user):
         """Обработка показа списка подписчиков"""
         bot_logger.log_admin_action(user, "Просмотр списка подписчиков")
+        await CallbackHandler._handle_subscribers_page(query, "subs:all:n:0")
+    
+    @staticmethod
+    async def _handle_subscribers_page(query, data: str):
+        """Страница списка подписчиков: callback_data вида subs:<фильтр>:<n|p>:<курсор>"""
+        try:
+            _, filter_name, direction, cursor = data.split(":")
+            cursor = int(cursor)
+        except ValueError:
+            filter_name, direction, cursor = "all", "n", 0
+        if filter_name not in SubscriptionService.SUBSCRIBER_FILTERS:
+            filter_name = "all"
         
-        session = Session()
         try:
-            subscribers = session.query(User).filter_by(has_access=True).all()
+            subscribers, has_prev, has_next = await SubscriptionService.get_subscribers_page(
+                filter_name, cursor, forward=direction != "p"
+            )
             
+            subscribers_text = f"👥 {SubscriptionService.SUBSCRIBER_FILTERS[filter_name]}:\n\n"
             if not subscribers:
-                await query.edit_message_text("👥 Нет активных подписчиков")
-                return
-            
-            subscribers_text = "👥 Активные подписчики:\n\n"
-            for i, sub in enumerate(subscribers, 1):
+                subscribers_text += "Нет подписчиков"
+            for sub in subscribers:
+                status = "🚫" if sub.is_blocked else "✅" if sub.files_received else "⏳"
                 sub_date = sub.subscription_date.strftime('%d.%m.%Y') if sub.subscription_date else "неизвестно"
-                subscribers_text += f"{i}. {sub.first_name} (@{sub.username})\n"
-                subscribers_text += f"   🆔 ID: {sub.file_hash}\n"
+                subscribers_text += f"{status} {sub.first_name} (@{sub.username})\n"
+                subscribers_text += f"   👤 {sub.user_id} · 🆔 {sub.file_hash}\n"
                 subscribers_text += f"   📅 Подписка с: {sub_date}\n\n"
             
-            if len(subscribers_text) > 4000:
-                subscribers_text = subscribers_text[:4000] + "\n..."
+            filters = [
+                InlineKeyboardButton(
+                    f"• {title}" if name == filter_name else title,
+                    callback_data=f"subs:{name}:n:0"
+                )
+                for name, title in SubscriptionService.SUBSCRIBER_FILTERS.items()
+            ]
+            keyboard = [filters[:2], filters[2:]]
+            navigation = []
+            if has_prev and subscribers:
+                navigation.append(InlineKeyboardButton(
+                    "⬅️ Назад", callback_data=f"subs:{filter_name}:p:{subscribers[0].id}"
+                ))
+            if has_next and subscribers:
+                navigation.append(InlineKeyboardButton(
+                    "Вперед ➡️", callback_data=f"subs:{filter_name}:n:{subscribers[-1].id}"
+                ))
+            if navigation:
+                keyboard.append(navigation)
+            keyboard.append([InlineKeyboardButton("🔙 В панель", callback_data="back_to_admin")])
             
-            await query.edit_message_text(subscribers_text)
+            await query.edit_message_text(subscribers_text, reply_markup=InlineKeyboardMarkup(keyboard))
         except Exception as e:
             bot_logger.logger.error(f"Ошибка при получении списка подписчиков: {e}")
             await query.edit_message_text("❌ Ошибка при получении списка")
-        finally:
-            session.close()
+    
+    @staticmethod
+    async def _handle_reports(query):
+        """Выбор отчета для выгрузки"""
+        keyboard = [
+            [InlineKeyboardButton(f"📑 {spec.title}", callback_data=f"report:{kind}")]
+            for kind, spec in REPORTS.items()
+        ]
+        keyboard.append([InlineKeyboardButton("🔙 В панель", callback_data="back_to_admin")])
+        await query.edit_message_text(
+            f"📑 Выберите отчет ({ReportExporter.default_format().upper()}):",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
     
     @staticmethod
     async def _handle_manage_admins(query, user):
         """Обработка управления администраторами"""
         bot_logger.log_admin_action(user, "Открытие управления администраторами")
         
-        session = Session()
+        session = AsyncSession()
         try:
-            admins = session.query(Admin).all()
+            admins = (await session.scalars(select(Admin))).all()
             
             admins_text = "👑 Список администраторов:\n\n"
             for i, admin in enumerate(admins, 1):
-                added_by_admin = session.query(Admin).filter_by(user_id=admin.added_by).first()
+                added_by_admin = await session.scalar(select(Admin).filter_by(user_id=admin.added_by))
                 added_by_name = added_by_admin.first_name if added_by_admin else "Система"
                 
                 admins_text += (
@@ -308,7 +402,65 @@ class CallbackHandler:
             bot_logger.logger.error(f"Ошибка при получении списка админов: {e}")
             await query.edit_message_text("❌ Ошибка при получении списка администраторов")
         finally:
-            session.close()
+            await session.close()
+    
+    @staticmethod
+    async def _handle_add_admin_panel(query, user):
+        """Подсказка по добавлению администратора"""
+        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="manage_admins")]]
+        await query.edit_message_text(
+            "➕ Чтобы добавить администратора, отправьте команду:\n\n"
+            "/addadmin USER_ID\n\n"
+            "Пример: /addadmin 123456789",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    
+    @staticmethod
+    async def _handle_remove_admin_panel(query, user):
+        """Выбор администратора для удаления"""
+        session = AsyncSession()
+        try:
+            admins = (await session.scalars(select(Admin))).all()
+            
+            keyboard = [
+                [InlineKeyboardButton(
+                    f"➖ {admin.first_name or admin.user_id} (@{admin.username})",
+                    callback_data=f"remove_admin:{admin.user_id}"
+                )]
+                for admin in admins if admin.user_id != user.id
+            ]
+            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="manage_admins")])
+            
+            text = "➖ Выберите администратора для удаления:" if len(keyboard) > 1 else "👑 Нет администраторов, которых можно удалить"
+            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        except Exception as e:
+            bot_logger.logger.error(f"Ошибка при получении списка админов: {e}")
+            await query.edit_message_text("❌ Ошибка при получении списка администраторов")
+        finally:
+            await session.close()
+    
+    @staticmethod
+    async def _handle_remove_admin(query, user):
+        """Удаление администратора"""
+        try:
+            target_user_id = int(query.data.split(":", 1)[1])
+        except ValueError:
+            await query.edit_message_text("❌ Неверный формат USER_ID")
+            return
+        
+        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="manage_admins")]]
+        
+        if await AuthService.remove_admin(target_user_id):
+            bot_logger.log_admin_action(user, "Удаление администратора", f"user_id={target_user_id}")
+            await query.edit_message_text(
+                f"✅ Администратор {target_user_id} удален",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+        else:
+            await query.edit_message_text(
+                f"❌ Не удалось удалить администратора {target_user_id}",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
     
     @staticmethod
     async def _handle_back_to_admin(update, context):
@@ -1,13 +1,11 @@
 import os
-import zipfile
-import uuid
-import hashlib
+import asyncio
+import time
 from telegram import Update
 from telegram.ext import ContextTypes
-from services.auth import AuthService
+from services.request_context import RequestContext
 from services.logger import bot_logger
-from database.session import Session
-from database.models import File
+from services.zip_ingest import ZipIngestService, IngestReport
 from config import Config
 
 class FileHandler:
@@ -18,7 +16,8 @@ class FileHandler:
         """Обработчик документов (ZIP архивов)"""
         user = update.effective_user
         
-        if not AuthService.is_admin(user.id):
+        request = await RequestContext.resolve(update, context)
+        if not request.is_admin:
             await update.message.reply_text("❌ Только владелец может загружать файлы")
             return
         
@@ -29,71 +28,94 @@ class FileHandler:
             await update.message.reply_text("❌ Пожалуйста, загрузите ZIP архив")
             return
         
-        await update.message.reply_text("📦 Начинаю обработку ZIP архива...")
+        status_message = await update.message.reply_text("📦 Начинаю обработку ZIP архива...")
+        bot_logger.log_admin_action(
+            user, 
+            "Загрузка ZIP архива", 
+            f"Файл: {file_name}"
+        )
         
+        # Архив обрабатывается в фоне: апдейты обрабатываются по одному, и ожидание
+        # здесь задержало бы ответы всем остальным пользователям
+        context.application.create_task(
+            FileHandler.ingest_document(context.application, document, status_message)
+        )
+    
+    @staticmethod
+    async def ingest_document(application, document, status_message):
+        """Скачивает и загружает ZIP архив; прогресс и итог пишутся в ``status_message``"""
         try:
-            bot_logger.log_admin_action(
-                user, 
-                "Загрузка ZIP архива", 
-                f"Файл: {file_name}"
-            )
-            
             file = await document.get_file()
             zip_path = os.path.join(Config.ZIP_FOLDER, f"temp_{document.file_id}.zip")
             await file.download_to_drive(zip_path)
             
-            processed_count = await FileHandler.process_zip_archive(zip_path)
+            try:
+                report = await FileHandler.process_zip_archive(zip_path, status_message)
+            finally:
+                os.remove(zip_path)
             
-            os.remove(zip_path)
-            
-            await update.message.reply_text(
-                f"✅ ZIP архив обработан успешно!\n"
-                f"📄 Обработано файлов: {processed_count}\n"
+            text = (
+                f"✅ ZIP архив обработан!\n"
+                f"📄 Загружено файлов: {report.processed} из {report.total}\n"
+                f"⏱ Время: {report.elapsed:.1f} с\n"
                 f"🎯 Все файлы переименованы в уникальные хэши"
             )
+            if report.duplicates:
+                text += f"\n\n♻️ Пропущено дубликатов: {len(report.duplicates)}\n"
+                text += "\n".join(
+                    f"• {name} ({reason})"
+                    for name, reason in report.duplicates[:Config.INGEST_ERRORS_SHOWN]
+                )
+            if report.errors:
+                text += f"\n\n⚠️ Ошибок: {len(report.errors)}\n"
+                text += "\n".join(
+                    f"• {name}: {error}"
+                    for name, error in report.errors[:Config.INGEST_ERRORS_SHOWN]
+                )
+            await status_message.edit_text(text[:4000])
+            
+            if Config.STORAGE_CHAT_ID:
+                # Загружаем новые билеты в служебный чат в фоне, чтобы доставлять их по file_id
+                from services.file_manager import FileManager
+                application.create_task(FileManager.preupload_files(application))
             
         except Exception as e:
             bot_logger.logger.error(f"Ошибка при обработке ZIP архива: {e}")
-            await update.message.reply_text("❌ Ошибка при обработке ZIP архива")
+            try:
+                await status_message.edit_text("❌ Ошибка при обработке ZIP архива")
+            except Exception as edit_error:
+                bot_logger.logger.debug(f"Не удалось сообщить об ошибке загрузки: {edit_error}")
     
     @staticmethod
-    async def process_zip_archive(zip_path: str) -> int:
-        """Обрабатывает ZIP архив и сохраняет файлы с хэшированными именами"""
-        processed_count = 0
-        session = Session()
+    async def process_zip_archive(zip_path: str, status_message=None) -> IngestReport:
+        """Загружает билеты из ZIP архива в отдельном потоке.
+
+        Если передан ``status_message``, в нем периодически обновляется прогресс.
+        """
+        loop = asyncio.get_running_loop()
+        last_update = [time.monotonic()]
+        last_edit = [None]
         
+        def progress(report):
+            # Вызывается из рабочего потока — редактирование сообщения передаем в event loop
+            now = time.monotonic()
+            if status_message is None or now - last_update[0] < Config.INGEST_PROGRESS_INTERVAL:
+                return
+            last_update[0] = now
+            last_edit[0] = asyncio.run_coroutine_threadsafe(
+                FileHandler._show_progress(status_message, report.done, report.total),
+                loop
+            )
+        
+        report = await asyncio.to_thread(ZipIngestService.ingest, zip_path, progress)
+        if last_edit[0] is not None:
+            # Итог пишется в то же сообщение — прогресс не должен его перезаписать
+            await asyncio.wrap_future(last_edit[0])
+        return report
+    
+    @staticmethod
+    async def _show_progress(status_message, done: int, total: int):
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                for file_info in zip_ref.infolist():
-                    try:
-                        if file_info.filename.lower().endswith(('.pdf', '.txt', '.doc', '.docx')) and not file_info.is_dir():
-                            extracted_path = zip_ref.extract(file_info, Config.UPLOAD_FOLDER)
-                            
-                            file_hash = hashlib.sha256(f"{uuid.uuid4()}".encode()).hexdigest()[:16]
-                            original_ext = os.path.splitext(file_info.filename)[1]
-                            new_filename = f"{file_hash}{original_ext}"
-                            new_file_path = os.path.join(Config.UPLOAD_FOLDER, new_filename)
-                            
-                            os.rename(extracted_path, new_file_path)
-                            
-                            file_record = File(
-                                original_name=os.path.basename(file_info.filename),
-                                hash_name=file_hash,
-                                file_path=new_file_path
-                            )
-                            session.add(file_record)
-                            processed_count += 1
-                            
-                    except Exception as e:
-                        bot_logger.logger.error(f"Ошибка при обработке файла {file_info.filename}: {e}")
-                        continue
-            
-            session.commit()
-            
+            await status_message.edit_text(f"📦 Обработка ZIP архива: {done}/{total} файлов...")
         except Exception as e:
-            bot_logger.logger.error(f"Ошибка при обработке архива: {e}")
-            session.rollback()
-        finally:
-            session.close()
-        
-        return processed_count
\ No newline at end of file
+            bot_logger.logger.debug(f"Не удалось обновить прогресс загрузки: {e}")
@@ -1,9 +1,8 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from services.auth import AuthService
 from services.logger import bot_logger
-from database.session import Session
-from database.models import User, FileDelivery, File
+from services.request_context import RequestContext
+from services.recovery import RecoveryService
 from datetime import datetime, timedelta
 import os
 
@@ -13,62 +12,57 @@ class UserHandler:
     @staticmethod
     async def my_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Информация о подписке пользователя"""
-        user = update.effective_user
+        request = await RequestContext.resolve(update, context)
         
-        if not AuthService.check_user_access(user.id):
+        if not request.has_access:
             await update.message.reply_text("❌ У вас нет активной подписки.")
             return
         
-        session = Session()
         try:
-            user_data = session.query(User).filter_by(user_id=user.id).first()
-            if user_data:
-                sub_date = user_data.subscription_date.strftime('%d.%m.%Y %H:%M') if user_data.subscription_date else "неизвестно"
-                
-                await update.message.reply_text(
-                    f"✅ Ваша подписка активна\n\n"
-                    f"🆔 Ваш ID: `{user_data.file_hash}`\n"
-                    f"📅 Активирована: {sub_date}\n"
-                    f"👤 Имя: {user_data.first_name}\n"
-                    f"📨 Получено файлов: {user_data.files_received}\n\n"
-                    f"Используйте /myticket для проверки статуса билетов."
-                )
+            user_data = request.user
+            sub_date = user_data.subscription_date.strftime('%d.%m.%Y %H:%M') if user_data.subscription_date else "неизвестно"
+            
+            await update.message.reply_text(
+                f"✅ Ваша подписка активна\n\n"
+                f"🆔 Ваш ID: `{user_data.file_hash}`\n"
+                f"📅 Активирована: {sub_date}\n"
+                f"👤 Имя: {user_data.first_name}\n"
+                f"📨 Получено файлов: {user_data.files_received}\n\n"
+                f"Используйте /myticket для проверки статуса билетов."
+            )
         except Exception as e:
             bot_logger.logger.error(f"Ошибка в команде /mysub: {e}")
             await update.message.reply_text("❌ Ошибка при проверке подписки")
-        finally:
-            session.close()
     
     @staticmethod
     async def my_ticket(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Проверка статуса билета пользователя"""
-        user = update.effective_user
+        request = await RequestContext.resolve(update, context)
         
-        if not AuthService.check_user_access(user.id):
+        if not request.has_access:
             await update.message.reply_text("❌ У вас нет активной подписки.")
             return
         
-        session = Session()
-        try:
-            user_data = session.query(User).filter_by(user_id=user.id).first()
-            if not user_data:
-                await update.message.reply_text("❌ Пользователь не найден.")
-                return
-            
-            # ... остальная логика my_ticket
-        except Exception as e:
-            bot_logger.logger.error(f"Ошибка в my_ticket: {e}")
-            await update.message.reply_text("❌ Ошибка при проверке статуса.")
-        finally:
-            session.close()
+        # ... остальная логика my_ticket (запись пользователя — request.user)
     
     @staticmethod
     async def recover_ticket(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Восстановление билета"""
-        user = update.effective_user
+        request = await RequestContext.resolve(update, context)
+        # Команда /recover или кнопка recover_ticket
+        message = update.effective_message
         
-        if not AuthService.check_user_access(user.id):
-            await update.message.reply_text("❌ У вас нет активной подписки.")
+        if not request.has_access:
+            await message.reply_text("❌ У вас нет активной подписки.")
             return
         
-        # ... логика восстановления билета
\ No newline at end of file
+        result = await RecoveryService.recover_ticket(request.user, context.application)
+        
+        if result in ('copy', 'file_id', 'backup', 'archive'):
+            await message.reply_text("✅ Ваш билет отправлен повторно.")
+        elif result == 'not_found':
+            await message.reply_text("📭 У вас еще нет доставленных билетов.")
+        elif result == 'rate_limited':
+            await message.reply_text("⚠️ Слишком много запросов на восстановление. Попробуйте позже.")
+        else:
+            await message.reply_text("❌ Не удалось восстановить билет. Обратитесь к администратору.")
\ No newline at end of file
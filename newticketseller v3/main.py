@@ -1,35 +1,34 @@
+import asyncio
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, TypeHandler, ApplicationHandlerStop
 from telegram import Update
 from config import Config
-from database.session import init_db
-from database.session import Session
-from database.models import User
+from database.session import init_db, dispose_db
 from services.antispam import AntiSpamService
 from services.auth import AuthService
+from services.broadcast import BroadcastJobService
+from services.file_layout import FileLayout
+from services.request_context import RequestContext
+from services.update_processor import PerUserUpdateProcessor
 
 async def antispam_middleware(update: Update, context):
     if update.effective_user:
         user_id = update.effective_user.id
         
-        session = Session()
-        try:
-            user = session.query(User).filter_by(user_id=user_id).first()
-            if user and user.is_blocked:
-                if update.message:
-                    await update.message.reply_text(
-                        "🚫 Ваш доступ к боту заблокирован.\n"
-                        "Обратитесь к администратору для разъяснений."
-                    )
-                elif update.callback_query:
-                    await update.callback_query.answer(
-                        "🚫 Ваш доступ к боту заблокирован.",
-                        show_alert=True
-                    )
-                raise ApplicationHandlerStop
-        finally:
-            session.close()
+        request = await RequestContext.resolve(update, context)
+        if request.user and request.user.is_blocked:
+            if update.message:
+                await update.message.reply_text(
+                    "🚫 Ваш доступ к боту заблокирован.\n"
+                    "Обратитесь к администратору для разъяснений."
+                )
+            elif update.callback_query:
+                await update.callback_query.answer(
+                    "🚫 Ваш доступ к боту заблокирован.",
+                    show_alert=True
+                )
+            raise ApplicationHandlerStop
         
-        if not AuthService.is_admin(user_id):
+        if not request.is_admin:
             if AntiSpamService.check_spam(user_id, "user_action"):
                 if update.message:
                     await update.message.reply_text(
@@ -43,6 +42,14 @@ async def antispam_middleware(update: Update, context):
                     )
                 raise ApplicationHandlerStop
 
+async def post_init(application):
+    await AuthService.load_admins()
+    await BroadcastJobService.resume_all(application)
+    
+    if await asyncio.to_thread(FileLayout.needs_migration):
+        # Перенос файлов в подпапки идет в фоне, бот в это время работает
+        application.create_task(asyncio.to_thread(FileLayout.migrate))
+
 def setup_handlers(application):
     from handlers.start import StartHandler
     from handlers.admin import AdminHandler
@@ -59,8 +66,13 @@ def setup_handlers(application):
     application.add_handler(CommandHandler("myticket", UserHandler.my_ticket))
     application.add_handler(CommandHandler("recover", UserHandler.recover_ticket))
     application.add_handler(CommandHandler("addadmin", AdminHandler.add_admin))
+    application.add_handler(CommandHandler("report", AdminHandler.export_report))
     
     application.add_handler(CommandHandler("sent", BroadcastHandler.send_broadcast))
+    application.add_handler(CommandHandler("broadcasts", BroadcastHandler.list_broadcasts))
+    application.add_handler(CommandHandler("bpause", BroadcastHandler.pause_broadcast))
+    application.add_handler(CommandHandler("bresume", BroadcastHandler.resume_broadcast))
+    application.add_handler(CommandHandler("bcancel", BroadcastHandler.cancel_broadcast))
     application.add_handler(CommandHandler("block", BroadcastHandler.block_user))
     application.add_handler(CommandHandler("unblock", BroadcastHandler.unblock_user))
     
@@ -68,6 +80,9 @@ def setup_handlers(application):
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, StartHandler.handle_message))
     
     application.add_handler(CallbackQueryHandler(CallbackHandler.button_handler))
+    
+    if Config.REQUEST_STATS_ENABLED:
+        application.add_handler(TypeHandler(Update, RequestContext.log_stats), group=100)
 
 def main():
     if not Config.BOT_TOKEN:
@@ -76,12 +91,25 @@ def main():
     Config.create_folders()
     init_db()
     
-    application = Application.builder().token(Config.BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(Config.BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(Config.MAX_CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(dispose_db)
+        .build()
+    )
     
     setup_handlers(application)
     
     job_queue = application.job_queue
     from services.file_cleanup import FileCleanupService
+    from services.archive import ArchiveService
+    
+    job_queue.run_daily(
+        ArchiveService.archive_task,
+        time=__import__('datetime').time(hour=2, minute=0)
+    )
     
     job_queue.run_daily(
         FileCleanupService.schedule_cleanup_task,
@@ -89,13 +117,33 @@ def main():
     )
     
     job_queue.run_daily(
-        lambda context: AntiSpamService.cleanup_old_activity(),
+        AntiSpamService.cleanup_task,
         time=__import__('datetime').time(hour=4, minute=0)
     )
-    
+
+    from services.reconciliation import ReconciliationService
+    job_queue.run_repeating(
+        ReconciliationService.reconcile_task,
+        interval=Config.RECONCILE_INTERVAL,
+        first=Config.RECONCILE_INTERVAL
+    )
+
+    job_queue.run_repeating(
+        BroadcastJobService.resume_task,
+        interval=Config.BROADCAST_LEASE,
+        first=Config.BROADCAST_LEASE
+    )
+
+    if Config.ANTISPAM_AUDIT_ENABLED:
+        job_queue.run_repeating(
+            AntiSpamService.flush_audit_task,
+            interval=Config.ANTISPAM_AUDIT_FLUSH_INTERVAL
+        )
+
     from services.logger import bot_logger
     bot_logger.logger.info("Бот запускается...")
     bot_logger.logger.info("Защита от спама: макс. 5 действий в минуту для пользователей")
+    bot_logger.logger.info("Архивирование выданных билетов: каждый день в 02:00")
     bot_logger.logger.info("Автоматическая очистка файлов: каждый день в 03:00")
     bot_logger.logger.info("Автоматическая очистка активности: каждый день в 04:00")
     
@@ -1,58 +1,88 @@
+from collections import deque
 from datetime import datetime, timedelta
-from database.session import Session
+from sqlalchemy import delete, insert
+from database.session import AsyncSession
 from database.models import UserActivity
 from services.logger import bot_logger
+from services.rate_limiter import SlidingWindowRateLimiter
+from config import Config
 
 class AntiSpamService:
     SPAM_THRESHOLD = 5
     TIME_WINDOW = 60
-    
+
+    _limiter = SlidingWindowRateLimiter(
+        limit=SPAM_THRESHOLD,
+        window=TIME_WINDOW,
+        max_keys=Config.ANTISPAM_MAX_BUCKETS
+    )
+    # Буфер записей для таблицы user_activity (используется только при включенном аудите)
+    _audit_buffer = deque(maxlen=Config.ANTISPAM_AUDIT_BUFFER)
+
     @staticmethod
     def check_spam(user_id: int, action_type: str = "message") -> bool:
-        session = Session()
         try:
-            cutoff_time = datetime.utcnow() - timedelta(seconds=AntiSpamService.TIME_WINDOW)
-            
-            recent_actions = session.query(UserActivity).filter(
-                UserActivity.user_id == user_id,
-                UserActivity.action_type == action_type,
-                UserActivity.timestamp > cutoff_time
-            ).count()
-            
-            if recent_actions >= AntiSpamService.SPAM_THRESHOLD:
-                bot_logger.logger.warning(f"Спам обнаружен: user_id={user_id}, действий={recent_actions}")
+            if not AntiSpamService._limiter.hit((user_id, action_type)):
+                bot_logger.logger.warning(
+                    f"Спам обнаружен: user_id={user_id}, действий={AntiSpamService.SPAM_THRESHOLD}"
+                )
                 return True
-            
-            activity = UserActivity(
-                user_id=user_id,
-                action_type=action_type
-            )
-            session.add(activity)
-            session.commit()
-            
+
+            if Config.ANTISPAM_AUDIT_ENABLED:
+                AntiSpamService._audit_buffer.append((user_id, action_type, datetime.utcnow()))
+
             return False
-            
+
         except Exception as e:
-            session.rollback()
             bot_logger.logger.error(f"Ошибка проверки спама: {e}")
             return False
+
+    @staticmethod
+    async def flush_audit() -> int:
+        """Сбрасывает накопленные действия в user_activity одной транзакцией"""
+        if not AntiSpamService._audit_buffer:
+            return 0
+
+        rows = []
+        while AntiSpamService._audit_buffer:
+            user_id, action_type, timestamp = AntiSpamService._audit_buffer.popleft()
+            rows.append({'user_id': user_id, 'action_type': action_type, 'timestamp': timestamp})
+
+        session = AsyncSession()
+        try:
+            await session.execute(insert(UserActivity), rows)
+            await session.commit()
+            return len(rows)
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка записи аудита активности: {e}")
+            return 0
         finally:
-            session.close()
-    
+            await session.close()
+
     @staticmethod
-    def cleanup_old_activity(days=7):
-        session = Session()
+    async def flush_audit_task(context):
+        await AntiSpamService.flush_audit()
+
+    @staticmethod
+    async def cleanup_old_activity(days=7):
+        session = AsyncSession()
         try:
             cutoff_date = datetime.utcnow() - timedelta(days=days)
-            deleted = session.query(UserActivity).filter(
-                UserActivity.timestamp < cutoff_date
-            ).delete()
-            session.commit()
+            result = await session.execute(
+                delete(UserActivity).where(UserActivity.timestamp < cutoff_date)
+            )
+            await session.commit()
+            deleted = result.rowcount
             bot_logger.logger.info(f"Удалено {deleted} старых записей активности")
             return deleted
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             bot_logger.logger.error(f"Ошибка очистки активности: {e}")
             return 0
         finally:
-            session.close()
+            await session.close()
+
+    @staticmethod
+    async def cleanup_task(context):
+        await AntiSpamService.cleanup_old_activity()
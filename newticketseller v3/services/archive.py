@@ -0,0 +1,204 @@
+import asyncio
+import os
+import struct
+import time
+import zipfile
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from database.session import AsyncSession
+from database.models import File, TicketArchive
+from services.backup_store import BackupStore
+from services.file_layout import FileLayout
+from services.logger import bot_logger
+from config import Config
+
+# Локальный заголовок файла в ZIP: сигнатура, версия, флаги, метод сжатия, время, дата,
+# CRC-32, сжатый и исходный размер, длина имени, длина extra-поля
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+DATA_DESCRIPTOR_FLAG = 0x08
+
+class ArchiveReport:
+    """Итог архивирования выданных билетов"""
+
+    def __init__(self):
+        self.packs = 0
+        self.files = 0
+        self.bytes_before = 0  # исходный размер заархивированных билетов
+        self.bytes_after = 0  # размер пакетов
+        self.elapsed = 0.0
+
+class ArchiveService:
+    """Холодное хранение выданных билетов.
+
+    Билеты, выданные больше ``ARCHIVE_AFTER_DAYS`` дней назад, упаковываются
+    в ZIP пакеты в ``ticket_archives`` по ``ARCHIVE_PACK_SIZE`` штук. Для
+    каждого билета в File сохраняются пакет, смещение его локального
+    заголовка и размер сжатых данных — по ним ``read_member`` читает один
+    билет, не разбирая весь пакет. Исходные файлы и резервные копии после
+    упаковки удаляются.
+    """
+
+    @staticmethod
+    def _write_pack(rows: list, pack_path: str):
+        """Пишет пакет, возвращает ({id файла: (смещение, размер)}, исходный размер)"""
+        index = {}
+        source_bytes = 0
+        temp_path = f"{pack_path}.tmp"
+        try:
+            with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as pack:
+                for file_id, file_path, backup_path in rows:
+                    source = FileLayout.resolve(file_path) or FileLayout.resolve(backup_path)
+                    if not source:
+                        continue
+                    name = os.path.basename(file_path)
+                    pack.write(source, arcname=name)
+                    info = pack.getinfo(name)
+                    index[file_id] = (info.header_offset, info.compress_size)
+                    source_bytes += info.file_size
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        if index:
+            os.replace(temp_path, pack_path)
+        else:
+            os.remove(temp_path)
+        return index, source_bytes
+
+    @staticmethod
+    def read_member(pack_path: str, offset: int, size: int) -> bytes:
+        """Читает один билет из пакета по смещению локального заголовка"""
+        with open(pack_path, 'rb') as pack:
+            pack.seek(offset)
+            (signature, _, flags, method, _, _, crc, _, _,
+             name_length, extra_length) = LOCAL_HEADER.unpack(pack.read(LOCAL_HEADER.size))
+            if signature != LOCAL_HEADER_SIGNATURE:
+                raise ValueError(f"Неверное смещение {offset} в пакете {pack_path}")
+
+            pack.seek(name_length + extra_length, os.SEEK_CUR)
+            data = pack.read(size)
+
+        if method == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        elif method != zipfile.ZIP_STORED:
+            raise ValueError(f"Неподдерживаемый метод сжатия {method}")
+
+        if not flags & DATA_DESCRIPTOR_FLAG and zlib.crc32(data) != crc:
+            raise ValueError(f"Контрольная сумма не совпала: смещение {offset} в пакете {pack_path}")
+        return data
+
+    @staticmethod
+    async def read_ticket(file: File):
+        """Содержимое заархивированного билета или None, если билет не в архиве"""
+        if not file.archive_id:
+            return None
+
+        session = AsyncSession()
+        try:
+            archive = await session.get(TicketArchive, file.archive_id)
+        finally:
+            await session.close()
+        if archive is None:
+            return None
+
+        return await asyncio.to_thread(
+            ArchiveService.read_member, archive.path, file.archive_offset, file.archive_size
+        )
+
+    @staticmethod
+    async def pack_old_tickets() -> ArchiveReport:
+        report = ArchiveReport()
+        if not Config.ARCHIVE_AFTER_DAYS:
+            return report
+
+        started = time.monotonic()
+        cutoff_date = datetime.utcnow() - timedelta(days=Config.ARCHIVE_AFTER_DAYS)
+        last_id = 0
+
+        session = AsyncSession()
+        try:
+            while True:
+                rows = (await session.execute(
+                    select(File.id, File.file_path, File.backup_path)
+                    .where(
+                        File.id > last_id,
+                        File.distributed == True,
+                        File.distributed_at < cutoff_date,
+                        File.archive_id == None
+                    )
+                    .order_by(File.id)
+                    .limit(Config.ARCHIVE_PACK_SIZE)
+                )).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+
+                pack_path = os.path.join(
+                    Config.ARCHIVE_FOLDER,
+                    f"pack_{datetime.utcnow():%Y%m%d_%H%M%S}_{rows[0].id}.zip"
+                )
+                index, source_bytes = await asyncio.to_thread(ArchiveService._write_pack, rows, pack_path)
+                if not index:
+                    continue
+
+                try:
+                    pack_size = os.path.getsize(pack_path)
+                    archive = TicketArchive(path=pack_path, member_count=len(index), size=pack_size)
+                    session.add(archive)
+                    await session.flush()
+
+                    paths = []
+                    for file_id, file_path, backup_path in rows:
+                        if file_id not in index:
+                            continue
+                        offset, size = index[file_id]
+                        await session.execute(
+                            update(File)
+                            .where(File.id == file_id)
+                            .values(archive_id=archive.id, archive_offset=offset, archive_size=size, backup_path=None)
+                        )
+                        paths.append(file_path)
+                        paths.append(await BackupStore.release(session, backup_path))
+
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    os.remove(pack_path)
+                    raise
+
+                # Исходные файлы удаляются только после фиксации ссылок на пакет
+                await asyncio.to_thread(ArchiveService._remove_sources, [path for path in paths if path])
+
+                report.packs += 1
+                report.files += len(index)
+                report.bytes_before += source_bytes
+                report.bytes_after += pack_size
+
+        except Exception as e:
+            bot_logger.logger.error(f"Ошибка архивирования билетов: {e}")
+        finally:
+            await session.close()
+
+        report.elapsed = time.monotonic() - started
+        if report.files:
+            bot_logger.logger.info(
+                f"Заархивировано билетов: {report.files} в {report.packs} пакетов, "
+                f"{report.bytes_before / 1024 / 1024:.1f} МБ -> {report.bytes_after / 1024 / 1024:.1f} МБ, "
+                f"{report.elapsed:.1f} с"
+            )
+        return report
+
+    @staticmethod
+    def _remove_sources(paths: list):
+        for path in paths:
+            try:
+                FileLayout.remove(path)
+            except OSError as e:
+                bot_logger.logger.error(f"Ошибка удаления заархивированного файла {path}: {e}")
+
+    @staticmethod
+    async def archive_task(context):
+        await ArchiveService.pack_old_tickets()
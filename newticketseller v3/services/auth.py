@@ -1,32 +1,117 @@
-from database.session import Session
+import asyncio
+import time
+from sqlalchemy import select
+from database.session import AsyncSession
 from database.models import User, Admin
+from services.logger import bot_logger
 from config import Config
 
 class AuthService:
     """Сервис авторизации и проверки прав"""
-    
+
+    # Кэш множества ID администраторов (таблица admins + Config.ADMIN_IDS)
+    _admin_ids = None
+    _admin_ids_loaded_at = 0.0
+    _admin_lock = asyncio.Lock()
+
+    @staticmethod
+    async def load_admins() -> set:
+        """Загружает множество администраторов из БД в кэш"""
+        session = AsyncSession()
+        try:
+            db_admin_ids = (await session.scalars(select(Admin.user_id))).all()
+            AuthService._admin_ids = set(db_admin_ids) | set(Config.ADMIN_IDS)
+            AuthService._admin_ids_loaded_at = time.monotonic()
+            return AuthService._admin_ids
+        except Exception as e:
+            bot_logger.logger.error(f"Ошибка загрузки списка администраторов: {e}")
+            return AuthService._admin_ids or set(Config.ADMIN_IDS)
+        finally:
+            await session.close()
+
     @staticmethod
-    def is_admin(user_id: int) -> bool:
+    def invalidate_admins():
+        """Сбрасывает кэш администраторов — следующая проверка перечитает БД"""
+        AuthService._admin_ids = None
+
+    @staticmethod
+    async def _get_admin_ids() -> set:
+        expired = time.monotonic() - AuthService._admin_ids_loaded_at > Config.ADMIN_CACHE_TTL
+        if AuthService._admin_ids is not None and not expired:
+            return AuthService._admin_ids
+
+        async with AuthService._admin_lock:
+            expired = time.monotonic() - AuthService._admin_ids_loaded_at > Config.ADMIN_CACHE_TTL
+            if AuthService._admin_ids is None or expired:
+                await AuthService.load_admins()
+            return AuthService._admin_ids or set(Config.ADMIN_IDS)
+
+    @staticmethod
+    async def is_admin(user_id: int) -> bool:
         """Проверяет, является ли пользователь администратором"""
-        session = Session()
         try:
-            admins = session.query(Admin).all()
-            admin_ids = [admin.user_id for admin in admins]
-            admin_ids.extend(Config.ADMIN_IDS)
-            return user_id in list(set(admin_ids))
+            return user_id in await AuthService._get_admin_ids()
+        except Exception as e:
+            return False
+
+    @staticmethod
+    async def add_admin(user_id: int, added_by: int, username: str = "", first_name: str = "") -> bool:
+        """Добавляет администратора в БД и в кэш"""
+        session = AsyncSession()
+        try:
+            if await session.scalar(select(Admin).filter_by(user_id=user_id)):
+                return False
+
+            session.add(Admin(
+                user_id=user_id,
+                username=username,
+                first_name=first_name,
+                added_by=added_by
+            ))
+            await session.commit()
+
+            if AuthService._admin_ids is not None:
+                AuthService._admin_ids.add(user_id)
+            return True
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка добавления администратора {user_id}: {e}")
+            AuthService.invalidate_admins()
+            return False
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def remove_admin(user_id: int) -> bool:
+        """Удаляет администратора из БД и из кэша"""
+        session = AsyncSession()
+        try:
+            admin = await session.scalar(select(Admin).filter_by(user_id=user_id))
+            if not admin:
+                return False
+
+            await session.delete(admin)
+            await session.commit()
+
+            if AuthService._admin_ids is not None and user_id not in Config.ADMIN_IDS:
+                AuthService._admin_ids.discard(user_id)
+            return True
         except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка удаления администратора {user_id}: {e}")
+            AuthService.invalidate_admins()
             return False
         finally:
-            session.close()
-    
+            await session.close()
+
     @staticmethod
-    def check_user_access(user_id: int) -> bool:
+    async def check_user_access(user_id: int) -> bool:
         """Проверяет есть ли у пользователя доступ к боту"""
-        session = Session()
+        session = AsyncSession()
         try:
-            user = session.query(User).filter_by(user_id=user_id).first()
+            user = await session.scalar(select(User).filter_by(user_id=user_id))
             return user and user.has_access
         except Exception as e:
             return False
         finally:
-            session.close()
\ No newline at end of file
+            await session.close()
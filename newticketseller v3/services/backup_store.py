@@ -0,0 +1,137 @@
+import asyncio
+import errno
+import hashlib
+import os
+import shutil
+from datetime import datetime
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from database.models import BackupBlob
+from services.file_layout import FileLayout
+from services.logger import bot_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl FICLONE (Linux): копия-ссылка на те же блоки на btrfs/xfs
+FICLONE = 0x40049409
+HASH_CHUNK_SIZE = 1024 * 1024
+UPSERT_DIALECTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+class BackupStore:
+    """Резервные копии билетов, адресуемые по SHA-256 содержимого.
+
+    Одинаковое содержимое хранится в ``backup_files`` один раз, каждая ссылка
+    на него учитывается в ``backup_blobs.ref_count``. Копия создается жесткой
+    ссылкой на исходный файл, если это невозможно — reflink, и только потом
+    обычным копированием. Вся работа с диском выполняется в отдельном потоке.
+    """
+
+    @staticmethod
+    def file_sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _link_or_copy(source: str, target: str) -> str:
+        """Создает ``target`` с содержимым ``source``, возвращает способ"""
+        try:
+            os.link(source, target)
+            return 'hardlink'
+        except FileExistsError:
+            return 'exists'
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+                raise
+
+        if fcntl is not None:
+            try:
+                with open(source, 'rb') as src, open(target, 'xb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return 'reflink'
+            except FileExistsError:
+                return 'exists'
+            except OSError:
+                # Файловая система не поддерживает reflink — убираем пустой файл
+                if os.path.exists(target) and os.path.getsize(target) == 0:
+                    os.remove(target)
+
+        # Копируем во временный файл, чтобы не оставить недописанную копию
+        temp_path = f"{target}.tmp{os.getpid()}"
+        shutil.copy2(source, temp_path)
+        os.replace(temp_path, target)
+        return 'copy'
+
+    @staticmethod
+    def _materialize(file_path: str, sha256: str = None):
+        sha256 = sha256 or BackupStore.file_sha256(file_path)
+        target = FileLayout.backup_path(sha256, os.path.splitext(file_path)[1])
+        method = 'exists' if os.path.exists(target) else BackupStore._link_or_copy(file_path, target)
+        return sha256, target, os.path.getsize(target), method
+
+    @staticmethod
+    async def store(session, file_path: str, sha256: str = None) -> str:
+        """Добавляет ссылку на резервную копию файла и возвращает ее путь.
+
+        Счетчик ссылок увеличивается в переданной сессии и фиксируется вместе
+        с остальными изменениями вызывающего кода. Известный ``sha256``
+        (File.sha256) избавляет от повторного чтения файла.
+        """
+        sha256, backup_path, size, method = await asyncio.to_thread(BackupStore._materialize, file_path, sha256)
+
+        dialect = session.bind.dialect.name
+        if dialect in UPSERT_DIALECTS:
+            # INSERT ... ON CONFLICT: параллельные доставки одинакового содержимого не конфликтуют
+            statement = UPSERT_DIALECTS[dialect](BackupBlob).values(
+                sha256=sha256, path=backup_path, size=size, ref_count=1,
+                created_at=datetime.utcnow()
+            )
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=[BackupBlob.sha256],
+                set_={'ref_count': BackupBlob.ref_count + 1}
+            ))
+        else:
+            result = await session.execute(
+                update(BackupBlob)
+                .where(BackupBlob.sha256 == sha256)
+                .values(ref_count=BackupBlob.ref_count + 1)
+            )
+            if result.rowcount == 0:
+                session.add(BackupBlob(sha256=sha256, path=backup_path, size=size, ref_count=1))
+                await session.flush()
+
+        bot_logger.logger.debug(f"Резервная копия {backup_path} ({method})")
+        return backup_path
+
+    @staticmethod
+    async def release(session, backup_path: str):
+        """Снимает одну ссылку на резервную копию.
+
+        Когда ссылок не остается, удаляет запись и возвращает путь файла —
+        его нужно удалить после фиксации транзакции. Копии, созданные до
+        появления хранилища (без записи в backup_blobs), возвращаются сразу.
+        Если ссылки еще остались, возвращает None.
+        """
+        if not backup_path:
+            return None
+
+        blob = await session.scalar(select(BackupBlob).filter_by(path=backup_path))
+        if blob is not None:
+            await session.execute(
+                update(BackupBlob)
+                .where(BackupBlob.id == blob.id)
+                .values(ref_count=BackupBlob.ref_count - 1)
+            )
+            deleted = await session.execute(
+                delete(BackupBlob)
+                .where(BackupBlob.id == blob.id, BackupBlob.ref_count <= 0)
+            )
+            if deleted.rowcount == 0:
+                return None
+
+        return backup_path
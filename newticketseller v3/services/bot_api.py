@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import OrderedDict
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from services.logger import bot_logger
+from config import Config
+
+class AsyncTokenBucket:
+    """Асинхронное ведро токенов: не больше ``rate`` операций в секунду"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, delay: float):
+        """Останавливает выдачу токенов на ``delay`` секунд (после RetryAfter)"""
+        resume_at = time.monotonic() + delay
+        if resume_at > self._paused_until:
+            self._paused_until = resume_at
+            self._tokens = 0
+            self._updated = resume_at
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class BotApiLimiter:
+    """Ограничитель запросов к Bot API: общий лимит и интервал между сообщениями в один чат"""
+
+    def __init__(self, rate: float, per_chat_interval: float, max_chats: int = 100_000):
+        self.bucket = AsyncTokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_chats = max_chats
+        self._chat_next = OrderedDict()
+
+    async def wait(self, chat_id: int):
+        """Ждет, пока можно отправить сообщение в чат"""
+        now = time.monotonic()
+        next_allowed = self._chat_next.pop(chat_id, 0.0)
+        # Резервируем слот сразу, чтобы параллельные отправки в один чат шли по очереди
+        self._chat_next[chat_id] = max(now, next_allowed) + self.per_chat_interval
+        while len(self._chat_next) > self.max_chats:
+            self._chat_next.popitem(last=False)
+
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+        await self.bucket.acquire()
+
+    def pause(self, delay: float):
+        """Приостанавливает все отправки: flood limit Telegram действует на весь бот"""
+        self.bucket.pause(delay)
+
+# Общий ограничитель для всех отправок бота
+api_limiter = BotApiLimiter(
+    rate=Config.BOT_API_RATE,
+    per_chat_interval=Config.BOT_API_PER_CHAT_INTERVAL
+)
+
+# Ошибки BadRequest, после которых чат недоступен навсегда
+UNREACHABLE_MESSAGES = (
+    'chat not found',
+    'user is deactivated',
+    'bot was blocked by the user',
+    'peer_id_invalid',
+)
+
+def is_unreachable(error: Exception) -> bool:
+    """True, если повторная отправка в этот чат бессмысленна (бот заблокирован, аккаунт удален)"""
+    if isinstance(error, Forbidden):
+        return True
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        return any(text in message for text in UNREACHABLE_MESSAGES)
+    return False
+
+async def send_with_retry(chat_id: int, send, max_retries: int = None):
+    """Выполняет запрос к Bot API с учетом лимитов.
+
+    ``send`` — функция без аргументов, возвращающая корутину (вызывается заново
+    при каждой попытке). RetryAfter приостанавливает общий лимитер на
+    указанное сервером время, временные
+    сетевые ошибки повторяются с экспоненциальной задержкой, остальные
+    ошибки пробрасываются сразу.
+    """
+    if max_retries is None:
+        max_retries = Config.BOT_API_MAX_RETRIES
+
+    attempt = 0
+    while True:
+        await api_limiter.wait(chat_id)
+        try:
+            return await send()
+        except RetryAfter as e:
+            if attempt >= max_retries:
+                raise
+            bot_logger.logger.warning(f"Flood limit для chat_id={chat_id}, ждем {e.retry_after} с")
+            api_limiter.pause(e.retry_after)
+        except BadRequest:
+            raise
+        except NetworkError as e:
+            if attempt >= max_retries:
+                raise
+            delay = Config.BOT_API_RETRY_BACKOFF * (2 ** attempt)
+            bot_logger.logger.warning(f"Сетевая ошибка для chat_id={chat_id}: {e}, повтор через {delay} с")
+            await asyncio.sleep(delay)
+        attempt += 1
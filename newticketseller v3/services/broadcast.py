@@ -0,0 +1,462 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert, literal, func, or_
+from database.session import AsyncSession
+from database.models import BroadcastJob, BroadcastRecipient, User
+from services.bot_api import send_with_retry, is_unreachable
+from services.reachability import ReachabilityService
+from services.logger import bot_logger
+from config import Config
+
+class BroadcastMessage:
+    """Содержимое рассылки: текст команды или сообщение, на которое ответил администратор.
+
+    Хранит только то, что нужно для отправки (текст, file_id, подпись,
+    координаты), поэтому сериализуется в BroadcastJob.payload и
+    восстанавливается после перезапуска.
+    """
+
+    FIELDS = ('kind', 'text', 'file_id', 'caption', 'latitude', 'longitude')
+
+    def __init__(self, kind: str, text: str = None, file_id: str = None, caption: str = None,
+                 latitude: float = None, longitude: float = None):
+        self.kind = kind
+        self.text = text
+        self.file_id = file_id
+        self.caption = caption
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @classmethod
+    def from_command(cls, text: str = None, original=None):
+        """Строит рассылку из /sent; None, если тип сообщения не поддерживается"""
+        if original is None:
+            return cls('text', text=text) if text else None
+        if original.text:
+            return cls('text', text=original.text)
+        if original.photo:
+            return cls('photo', file_id=original.photo[-1].file_id, caption=original.caption)
+        if original.video:
+            return cls('video', file_id=original.video.file_id, caption=original.caption)
+        if original.location:
+            return cls('location', latitude=original.location.latitude, longitude=original.location.longitude)
+        if original.document:
+            return cls('document', file_id=original.document.file_id, caption=original.caption)
+        return None
+
+    def to_json(self) -> str:
+        return json.dumps({field: getattr(self, field) for field in self.FIELDS}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, payload: str):
+        return cls(**json.loads(payload))
+
+    async def send(self, bot, chat_id: int):
+        if self.kind == 'text':
+            return await bot.send_message(chat_id=chat_id, text=self.text)
+        if self.kind == 'photo':
+            return await bot.send_photo(chat_id=chat_id, photo=self.file_id, caption=self.caption)
+        if self.kind == 'video':
+            return await bot.send_video(chat_id=chat_id, video=self.file_id, caption=self.caption)
+        if self.kind == 'location':
+            return await bot.send_location(chat_id=chat_id, latitude=self.latitude, longitude=self.longitude)
+        if self.kind == 'document':
+            return await bot.send_document(chat_id=chat_id, document=self.file_id, caption=self.caption)
+        raise ValueError(f"Неизвестный тип рассылки: {self.kind}")
+
+class BroadcastReport:
+    """Итог рассылки сообщения"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent_users = []
+        self.failed_users = []
+        self.unreachable_users = []
+        self.elapsed = 0.0
+
+    @property
+    def sent(self) -> int:
+        return len(self.sent_users)
+
+    @property
+    def failed(self) -> int:
+        return len(self.failed_users)
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+class BroadcastEngine:
+    """Параллельная рассылка сообщения списку чатов.
+
+    Воркеры делят общий лимитер Bot API (send_with_retry): RetryAfter
+    приостанавливает все отправки на указанное сервером время, после чего
+    сообщение отправляется повторно. Чаты, в которые отправка невозможна
+    (бот заблокирован, чат не найден), попадают в unreachable_users.
+    """
+
+    def __init__(self, bot, concurrency: int = None):
+        self.bot = bot
+        self.concurrency = concurrency or Config.BROADCAST_CONCURRENCY
+
+    async def run(self, chat_ids, message: BroadcastMessage) -> BroadcastReport:
+        chat_ids = list(chat_ids)
+        report = BroadcastReport(len(chat_ids))
+        if not chat_ids:
+            return report
+
+        queue = asyncio.Queue()
+        for chat_id in chat_ids:
+            queue.put_nowait(chat_id)
+
+        started = time.monotonic()
+        workers = [
+            asyncio.create_task(self._worker(queue, message, report))
+            for _ in range(min(self.concurrency, len(chat_ids)))
+        ]
+        await asyncio.gather(*workers)
+        report.elapsed = time.monotonic() - started
+        return report
+
+    async def _worker(self, queue: asyncio.Queue, message: BroadcastMessage, report: BroadcastReport):
+        while not queue.empty():
+            chat_id = queue.get_nowait()
+            try:
+                await send_with_retry(chat_id, lambda: message.send(self.bot, chat_id))
+                report.sent_users.append(chat_id)
+            except Exception as e:
+                if is_unreachable(e):
+                    report.unreachable_users.append(chat_id)
+                else:
+                    report.failed_users.append(chat_id)
+                    bot_logger.logger.error(f"Ошибка отправки user_id={chat_id}: {e}")
+
+class BroadcastJobService:
+    """Рассылки, сохраненные в БД и продолжаемые после перезапуска.
+
+    Получатели записываются в broadcast_recipients при создании задачи.
+    Фоновый раннер берет их порциями по ``BROADCAST_BATCH_SIZE`` (keyset по
+    id), отправляет порцию через BroadcastEngine и одной транзакцией
+    фиксирует статусы получателей и счетчики задачи. После сбоя повторно
+    может уйти не больше одной порции.
+
+    Несколько экземпляров бота на одной БД не ведут одну рассылку вдвоем:
+    раннер арендует задачу (owner, lease_until) и продлевает аренду перед
+    каждой порцией. Задачу упавшего экземпляра другой подхватит, когда
+    истечет ``BROADCAST_LEASE``.
+    """
+
+    _tasks = {}  # id задачи -> asyncio.Task раннера в этом процессе
+    owner = f"{socket.gethostname()}:{os.getpid()}"  # этот экземпляр бота
+
+    @staticmethod
+    async def create(admin_id: int, message: BroadcastMessage, status_message=None) -> BroadcastJob:
+        session = AsyncSession()
+        try:
+            job = BroadcastJob(
+                created_by=admin_id,
+                status='running',
+                payload=message.to_json(),
+                status_chat_id=status_message.chat_id if status_message else None,
+                status_message_id=status_message.message_id if status_message else None
+            )
+            session.add(job)
+            await session.flush()
+
+            targets = (User.has_access == True, User.is_blocked == False)
+            result = await session.execute(
+                insert(BroadcastRecipient).from_select(
+                    ['job_id', 'user_id'],
+                    select(literal(job.id), User.user_id).filter(
+                        *targets, ReachabilityService.reachable()
+                    ).order_by(User.id)
+                )
+            )
+            job.total = result.rowcount
+            job.skipped = await session.scalar(
+                select(func.count()).select_from(User).filter(*targets, User.unreachable_at.is_not(None))
+            )
+            if not job.total:
+                job.status = 'done'
+                job.finished_at = datetime.utcnow()
+            await session.commit()
+            return job
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    def start(application, job_id: int):
+        """Запускает раннер задачи, если он еще не работает в этом процессе"""
+        if job_id in BroadcastJobService._tasks:
+            return
+        BroadcastJobService._tasks[job_id] = application.create_task(
+            BroadcastJobService._run(application, job_id)
+        )
+
+    @staticmethod
+    async def _claim(job_id: int = None) -> list:
+        """Арендует выполняемые рассылки, которые никто не держит, или продлевает свои.
+
+        Условный UPDATE ... RETURNING: из нескольких экземпляров задачу получает
+        только один. Возвращает id арендованных задач.
+        """
+        now = datetime.utcnow()
+        me = BroadcastJobService.owner
+        claim = (
+            update(BroadcastJob)
+            .where(
+                BroadcastJob.status == 'running',
+                or_(BroadcastJob.lease_until.is_(None), BroadcastJob.lease_until < now, BroadcastJob.owner == me)
+            )
+            .values(owner=me, lease_until=now + timedelta(seconds=Config.BROADCAST_LEASE))
+            .returning(BroadcastJob.id)
+            .execution_options(synchronize_session=False)
+        )
+        if job_id is not None:
+            claim = claim.where(BroadcastJob.id == job_id)
+
+        session = AsyncSession()
+        try:
+            job_ids = (await session.scalars(claim)).all()
+            await session.commit()
+            return sorted(job_ids)
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def _release(job_id: int):
+        """Снимает аренду, чтобы задачу сразу мог продолжить любой экземпляр"""
+        session = AsyncSession()
+        try:
+            await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id, BroadcastJob.owner == BroadcastJobService.owner)
+                .values(owner=None, lease_until=None)
+            )
+            await session.commit()
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def resume_all(application) -> int:
+        """Продолжает незавершенные рассылки, которые не ведет другой экземпляр.
+
+        Вызывается при запуске бота и периодически — так подхватываются задачи
+        упавших экземпляров.
+        """
+        job_ids = [
+            job_id for job_id in await BroadcastJobService._claim()
+            if job_id not in BroadcastJobService._tasks
+        ]
+
+        for job_id in job_ids:
+            BroadcastJobService.start(application, job_id)
+        if job_ids:
+            bot_logger.logger.info(f"Продолжены рассылки: {', '.join(map(str, job_ids))}")
+        return len(job_ids)
+
+    @staticmethod
+    async def resume_task(context):
+        await BroadcastJobService.resume_all(context.application)
+
+    @staticmethod
+    async def _set_status(job_id: int, from_statuses: tuple, status: str) -> bool:
+        session = AsyncSession()
+        try:
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id, BroadcastJob.status.in_(from_statuses))
+                .values(status=status, updated_at=datetime.utcnow())
+            )
+            await session.commit()
+            return result.rowcount > 0
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def _status(job_id: int):
+        session = AsyncSession()
+        try:
+            return await session.scalar(select(BroadcastJob.status).where(BroadcastJob.id == job_id))
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def pause(job_id: int) -> bool:
+        """Приостанавливает рассылку; раннер остановится после текущей порции"""
+        return await BroadcastJobService._set_status(job_id, ('running',), 'paused')
+
+    @staticmethod
+    async def resume(application, job_id: int) -> bool:
+        if not await BroadcastJobService._set_status(job_id, ('paused',), 'running'):
+            return False
+        BroadcastJobService.start(application, job_id)
+        return True
+
+    @staticmethod
+    async def cancel(job_id: int) -> bool:
+        return await BroadcastJobService._set_status(job_id, ('running', 'paused'), 'cancelled')
+
+    @staticmethod
+    async def get_active():
+        """Незавершенные рассылки (выполняются или на паузе)"""
+        session = AsyncSession()
+        try:
+            return (await session.scalars(
+                select(BroadcastJob)
+                .filter(BroadcastJob.status.in_(('running', 'paused')))
+                .order_by(BroadcastJob.id)
+            )).all()
+        finally:
+            await session.close()
+
+    @staticmethod
+    def format_progress(job: BroadcastJob) -> str:
+        done = job.sent + job.failed + job.unreachable
+        skipped = job.skipped or 0
+        titles = {
+            'running': "📤 Рассылка",
+            'paused': "⏸ Рассылка на паузе",
+            'cancelled': "🛑 Рассылка отменена",
+            'done': "✅ Рассылка завершена!",
+        }
+        return (
+            f"{titles.get(job.status, '📤 Рассылка')} #{job.id}: {done}/{job.total}\n\n"
+            f"📨 Отправлено: {job.sent}\n"
+            f"❌ Ошибок: {job.failed}\n"
+            f"🚫 Недоступно (бот заблокирован): {job.unreachable}\n"
+            f"⏭ Пропущено ранее недоступных: {skipped} "
+            f"(сэкономлено {skipped} запросов, ~{skipped / Config.BOT_API_RATE:.0f} с)"
+        )
+
+    @staticmethod
+    async def _show_progress(bot, job: BroadcastJob):
+        if not job.status_chat_id:
+            return
+        try:
+            await bot.edit_message_text(
+                chat_id=job.status_chat_id,
+                message_id=job.status_message_id,
+                text=BroadcastJobService.format_progress(job)
+            )
+        except Exception as e:
+            bot_logger.logger.warning(f"Не удалось обновить прогресс рассылки #{job.id}: {e}")
+
+    @staticmethod
+    async def _save_batch(session, job_id: int, recipient_ids: dict, report: BroadcastReport):
+        """Фиксирует статусы порции получателей и счетчики задачи одной транзакцией"""
+        for status, chat_ids in (
+            ('sent', report.sent_users),
+            ('failed', report.failed_users),
+            ('unreachable', report.unreachable_users),
+        ):
+            if chat_ids:
+                await session.execute(
+                    update(BroadcastRecipient)
+                    .where(BroadcastRecipient.id.in_([recipient_ids[chat_id] for chat_id in chat_ids]))
+                    .values(status=status)
+                )
+        await ReachabilityService.mark_unreachable(session, report.unreachable_users)
+        await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id)
+            .values(
+                sent=BroadcastJob.sent + report.sent,
+                failed=BroadcastJob.failed + report.failed,
+                unreachable=BroadcastJob.unreachable + len(report.unreachable_users),
+                updated_at=datetime.utcnow()
+            )
+        )
+        await session.commit()
+
+    @staticmethod
+    async def _run(application, job_id: int):
+        bot = application.bot
+        engine = BroadcastEngine(bot)
+        last_id = 0
+        sent = 0
+        started = time.monotonic()
+        last_progress = started
+        job = None
+        session = AsyncSession()
+        try:
+            while True:
+                # Аренда продлевается перед каждой порцией
+                claimed = await BroadcastJobService._claim(job_id)
+                job = await session.get(BroadcastJob, job_id, populate_existing=True)
+                if job is None or job.status != 'running':
+                    break
+                if not claimed:
+                    if job.owner == BroadcastJobService.owner:
+                        # Статус менялся между запросами (пауза и /bresume) — еще раз
+                        continue
+                    bot_logger.logger.info(f"Рассылку #{job_id} ведет другой экземпляр бота: {job.owner}")
+                    job = None
+                    break
+                message = BroadcastMessage.from_json(job.payload)
+
+                rows = (await session.execute(
+                    select(BroadcastRecipient.id, BroadcastRecipient.user_id)
+                    .filter(
+                        BroadcastRecipient.job_id == job_id,
+                        BroadcastRecipient.status == 'pending',
+                        BroadcastRecipient.id > last_id
+                    )
+                    .order_by(BroadcastRecipient.id)
+                    .limit(Config.BROADCAST_BATCH_SIZE)
+                )).all()
+                await session.commit()
+
+                if not rows:
+                    await session.execute(
+                        update(BroadcastJob)
+                        .where(BroadcastJob.id == job_id, BroadcastJob.status == 'running')
+                        .values(status='done', finished_at=datetime.utcnow(), updated_at=datetime.utcnow())
+                    )
+                    await session.commit()
+                    job = await session.get(BroadcastJob, job_id, populate_existing=True)
+                    break
+
+                recipient_ids = {user_id: recipient_id for recipient_id, user_id in rows}
+                report = await engine.run(recipient_ids.keys(), message)
+                await BroadcastJobService._save_batch(session, job_id, recipient_ids, report)
+                last_id = rows[-1].id
+                sent += report.sent
+
+                if time.monotonic() - last_progress >= Config.BROADCAST_PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    await BroadcastJobService._show_progress(
+                        bot, await session.get(BroadcastJob, job_id, populate_existing=True)
+                    )
+        except Exception as e:
+            bot_logger.logger.error(f"Ошибка рассылки #{job_id}: {e}")
+        finally:
+            # Снимаем раннер с учета до первого await: /bresume после этого запустит новый
+            BroadcastJobService._tasks.pop(job_id, None)
+            await session.close()
+        if job is not None:
+            await BroadcastJobService._release(job_id)
+
+        if job is not None and job.status == 'paused' and await BroadcastJobService._status(job_id) == 'running':
+            # /bresume пришел, пока раннер еще числился работающим, и ничего не запустил
+            BroadcastJobService.start(application, job_id)
+            return
+
+        if job is not None:
+            await BroadcastJobService._show_progress(bot, job)
+            elapsed = time.monotonic() - started
+            bot_logger.logger.info(
+                f"Рассылка #{job_id} ({job.status}): отправлено {job.sent}/{job.total}, "
+                f"ошибок {job.failed}, недоступно {job.unreachable}, пропущено {job.skipped or 0}; "
+                f"за этот запуск {sent} за {elapsed:.1f} с ({sent / elapsed if elapsed else 0:.1f} сообщений/с)"
+            )
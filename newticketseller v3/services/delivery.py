@@ -0,0 +1,101 @@
+import asyncio
+import time
+from services.file_manager import FileManager
+from services.logger import bot_logger
+from config import Config
+
+class DeliveryReport:
+    """Итог рассылки файлов"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed_users = []
+        self.no_file_users = []
+        self.skipped_users = []  # уже получили билет или обслуживаются другой рассылкой
+        self.elapsed = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+async def _iterate(users):
+    """Обходит список или асинхронный итератор одинаково"""
+    if hasattr(users, '__aiter__'):
+        async for user_obj in users:
+            yield user_obj
+    else:
+        for user_obj in users:
+            yield user_obj
+
+class DeliveryEngine:
+    """Параллельная рассылка файлов пользователям с ограниченным числом воркеров.
+
+    Пользователи принимаются списком или асинхронным итератором (например
+    stream_keyset) и передаются воркерам через ограниченную очередь, поэтому
+    первая отправка не ждет загрузки всей выборки.
+
+    Лимиты Bot API (общий и на чат) и повторы после RetryAfter обеспечивает
+    send_with_retry внутри FileManager.send_file_to_user.
+    """
+
+    def __init__(self, application, concurrency: int = None):
+        self.application = application
+        self.concurrency = concurrency or Config.DELIVERY_CONCURRENCY
+
+    async def run(self, users) -> DeliveryReport:
+        report = DeliveryReport(0)
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        started = time.monotonic()
+        workers = [
+            asyncio.create_task(self._worker(queue, report))
+            for _ in range(self.concurrency)
+        ]
+        try:
+            async for user_obj in _iterate(users):
+                report.total += 1
+                await queue.put(user_obj)
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        report.elapsed = time.monotonic() - started
+        if not report.total:
+            return report
+
+        bot_logger.logger.info(
+            f"Рассылка файлов: отправлено {report.sent}/{report.total}, "
+            f"ошибок {len(report.failed_users)}, без файла {len(report.no_file_users)}, "
+            f"пропущено {len(report.skipped_users)}, "
+            f"{report.elapsed:.1f} с ({report.rate:.1f} файлов/с); "
+            f"задержка отправки — {FileManager.latency_summary()}"
+        )
+        return report
+
+    async def _worker(self, queue: asyncio.Queue, report: DeliveryReport):
+        out_of_files = False
+        while True:
+            user_obj = await queue.get()
+            if user_obj is None:
+                return
+
+            if out_of_files:
+                report.no_file_users.append(user_obj)
+                continue
+
+            try:
+                success = await FileManager.deliver_next_file(user_obj, self.application)
+            except Exception as e:
+                bot_logger.logger.error(f"Ошибка отправки пользователю {user_obj.user_id}: {e}")
+                success = False
+
+            if success == FileManager.SKIPPED:
+                report.skipped_users.append(user_obj)
+            elif success is None:
+                out_of_files = True
+                report.no_file_users.append(user_obj)
+            elif success:
+                report.sent += 1
+            else:
+                report.failed_users.append(user_obj)
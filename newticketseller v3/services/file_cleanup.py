@@ -1,46 +1,133 @@
-import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from database.session import Session
-from database.models import File
+from sqlalchemy import delete, exists, or_, select
+from database.session import AsyncSession
+from database.models import File, TicketArchive
+from services.backup_store import BackupStore
+from services.file_layout import FileLayout
+from services.job_state import JobStateService
 from services.logger import bot_logger
 from config import Config
 
+# Потоки для удаления файлов с диска, чтобы не блокировать event loop
+_io_pool = ThreadPoolExecutor(max_workers=Config.CLEANUP_IO_WORKERS, thread_name_prefix='cleanup')
+
+class CleanupReport:
+    """Итог очистки старых файлов"""
+
+    def __init__(self):
+        self.deleted = 0  # удалено записей File
+        self.removed_files = 0  # удалено файлов с диска
+        self.bytes_freed = 0
+        self.chunks = 0
+        self.elapsed = 0.0
+
 class FileCleanupService:
+    # Водяной знак: id последней обработанной записи незавершенного прохода
+    WATERMARK = 'file_cleanup.last_id'
+
     @staticmethod
-    def delete_old_files(months=6):
-        session = Session()
+    async def delete_old_files(months=6) -> CleanupReport:
+        """Удаляет файлы старше ``months`` месяцев порциями по CLEANUP_CHUNK_SIZE.
+
+        Билеты, выданные меньше ``CLEANUP_GRACE_DAYS`` дней назад, не удаляются,
+        даже если загружены давно: владелец еще может их восстанавливать.
+        Каждая порция фиксируется отдельной транзакцией вместе с водяным
+        знаком, поэтому после сбоя очистка продолжается с места остановки.
+        Файлы удаляются с диска только после фиксации транзакции.
+        """
+        report = CleanupReport()
+        started = time.monotonic()
+        cutoff_date = datetime.utcnow() - timedelta(days=months * 30)
+        grace_date = datetime.utcnow() - timedelta(days=Config.CLEANUP_GRACE_DAYS)
+
+        session = AsyncSession()
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=months * 30)
-            old_files = session.query(File).filter(
-                File.upload_date < cutoff_date
-            ).all()
-            
-            deleted_count = 0
-            for file in old_files:
-                try:
-                    if file.file_path and os.path.exists(file.file_path):
-                        os.remove(file.file_path)
-                    
-                    if file.backup_path and os.path.exists(file.backup_path):
-                        os.remove(file.backup_path)
-                    
-                    session.delete(file)
-                    deleted_count += 1
-                    
-                except Exception as e:
-                    bot_logger.logger.error(f"Ошибка удаления файла {file.id}: {e}")
-            
-            session.commit()
-            bot_logger.logger.info(f"Удалено {deleted_count} старых файлов (старше {months} месяцев)")
-            return deleted_count
-            
+            last_id = int(await JobStateService.get(session, FileCleanupService.WATERMARK, 0))
+            if last_id:
+                bot_logger.logger.info(f"Очистка файлов продолжается с id > {last_id}")
+
+            while True:
+                rows = (await session.execute(
+                    select(File.id, File.file_path, File.backup_path, File.archive_id)
+                    .where(
+                        File.id > last_id,
+                        File.upload_date < cutoff_date,
+                        or_(File.distributed_at.is_(None), File.distributed_at < grace_date)
+                    )
+                    .order_by(File.id)
+                    .limit(Config.CLEANUP_CHUNK_SIZE)
+                )).all()
+                if not rows:
+                    break
+
+                paths = []
+                for file_id, file_path, backup_path, archive_id in rows:
+                    paths.append(file_path)
+                    paths.append(await BackupStore.release(session, backup_path))
+
+                last_id = rows[-1].id
+                await session.execute(delete(File).where(File.id.in_([row.id for row in rows])))
+                paths.extend(await FileCleanupService._drop_empty_archives(
+                    session, {row.archive_id for row in rows if row.archive_id}
+                ))
+                await JobStateService.set(session, FileCleanupService.WATERMARK, last_id)
+                await session.commit()
+
+                report.deleted += len(rows)
+                report.chunks += 1
+                await FileCleanupService._remove_files([path for path in paths if path], report)
+
+            # Проход завершен — следующий начнется с начала таблицы
+            await JobStateService.set(session, FileCleanupService.WATERMARK, 0)
+            await session.commit()
+
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             bot_logger.logger.error(f"Ошибка очистки файлов: {e}")
-            return 0
         finally:
-            session.close()
-    
+            await session.close()
+
+        report.elapsed = time.monotonic() - started
+        bot_logger.logger.info(
+            f"Удалено {report.deleted} старых файлов (старше {months} месяцев): "
+            f"с диска {report.removed_files} файлов, освобождено {report.bytes_freed / 1024 / 1024:.1f} МБ "
+            f"за {report.chunks} порций, {report.elapsed:.1f} с"
+        )
+        return report
+
+    @staticmethod
+    async def _drop_empty_archives(session, archive_ids: set) -> list:
+        """Удаляет записи пакетов, в которых не осталось билетов; возвращает пути пакетов"""
+        if not archive_ids:
+            return []
+        empty = (await session.execute(
+            select(TicketArchive.id, TicketArchive.path)
+            .where(
+                TicketArchive.id.in_(archive_ids),
+                ~exists().where(File.archive_id == TicketArchive.id)
+            )
+        )).all()
+        if empty:
+            await session.execute(delete(TicketArchive).where(TicketArchive.id.in_([row.id for row in empty])))
+        return [row.path for row in empty]
+
+    @staticmethod
+    async def _remove_files(paths: list, report: CleanupReport):
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *[loop.run_in_executor(_io_pool, FileLayout.remove, path) for path in paths],
+            return_exceptions=True
+        )
+        for path, result in zip(paths, results):
+            if isinstance(result, Exception):
+                bot_logger.logger.error(f"Ошибка удаления файла {path}: {result}")
+            elif result is not None:
+                report.removed_files += 1
+                report.bytes_freed += result
+
     @staticmethod
     async def schedule_cleanup_task(context):
-        FileCleanupService.delete_old_files()
+        await FileCleanupService.delete_old_files()
@@ -0,0 +1,222 @@
+import os
+from sqlalchemy import select, update
+from database.session import Session
+from database.models import BackupBlob, File
+from services.job_state import JobStateService
+from services.logger import bot_logger
+from config import Config
+
+class FileLayout:
+    """Раскладка файлов по подпапкам: ``<папка>/ab/cd/abcd….pdf``.
+
+    Первые четыре символа имени (hash_name билета или SHA-256 резервной
+    копии) задают две вложенные папки, поэтому в одной директории остается
+    немного файлов. Все пути к файлам строятся и разрешаются только здесь.
+    """
+
+    # Отметка в job_state: все записи БД переведены на пути в подпапках
+    MIGRATED = 'file_layout.migrated'
+
+    @staticmethod
+    def sharded_path(folder: str, file_name: str) -> str:
+        stem = os.path.splitext(file_name)[0].ljust(4, '_')
+        return os.path.join(folder, stem[:2], stem[2:4], file_name)
+
+    @staticmethod
+    def upload_path(hash_name: str, ext: str, folder: str = None) -> str:
+        """Путь нового билета; создает его папку"""
+        path = FileLayout.sharded_path(folder or Config.UPLOAD_FOLDER, f"{hash_name}{ext}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    @staticmethod
+    def backup_path(sha256: str, ext: str) -> str:
+        """Путь резервной копии; создает ее папку"""
+        path = FileLayout.sharded_path(Config.BACKUP_FOLDER, f"{sha256}{ext}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    @staticmethod
+    def resolve(path: str):
+        """Возвращает существующий путь к файлу из записи БД или None.
+
+        Пока идет миграция, файл из плоской папки мог уже переехать в
+        подпапку, а запись еще хранит старый путь — проверяются оба варианта.
+        """
+        if not path:
+            return None
+        if os.path.exists(path):
+            return path
+
+        folder, file_name = os.path.split(path)
+        sharded = FileLayout.sharded_path(folder, file_name)
+        if os.path.exists(sharded):
+            return sharded
+        return None
+
+    @staticmethod
+    def flat_path(path: str):
+        """Плоский путь для файла из подпапки (``<папка>/ab/cd/abcd.pdf`` -> ``<папка>/abcd.pdf``).
+
+        Для путей, которые не выглядят как путь в подпапке, возвращает None.
+        """
+        shard_dir, file_name = os.path.split(path)
+        folder = os.path.dirname(os.path.dirname(shard_dir))
+        if folder and FileLayout.sharded_path(folder, file_name) == path:
+            return os.path.join(folder, file_name)
+        return None
+
+    @staticmethod
+    def remove(path: str):
+        """Удаляет файл по пути из записи БД, возвращает освобожденные байты.
+
+        Если у файла есть другие жесткие ссылки (резервная копия), место не
+        освобождается и возвращается 0; если файла нет — None. Блокирующая
+        операция — для потоков.
+        """
+        path = FileLayout.resolve(path)
+        if not path:
+            return None
+        stat = os.stat(path)
+        os.remove(path)
+        return stat.st_size if stat.st_nlink == 1 else 0
+
+    @staticmethod
+    def _is_flat(path: str, folder: str) -> bool:
+        return bool(path) and os.path.normpath(os.path.dirname(path)) == os.path.normpath(folder)
+
+    @staticmethod
+    def _move(path: str) -> str:
+        """Переносит файл из плоской папки в подпапку, возвращает новый путь"""
+        folder, file_name = os.path.split(path)
+        target = FileLayout.sharded_path(folder, file_name)
+        if os.path.exists(path):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        return target
+
+    @staticmethod
+    def has_flat_files() -> bool:
+        """Есть ли файлы, лежащие прямо в UPLOAD_FOLDER или BACKUP_FOLDER"""
+        for folder in (Config.UPLOAD_FOLDER, Config.BACKUP_FOLDER):
+            with os.scandir(folder) as entries:
+                if any(entry.is_file() for entry in entries):
+                    return True
+        return False
+
+    @staticmethod
+    def is_migrated() -> bool:
+        """Отмечено ли в БД, что все записи указывают на пути в подпапках"""
+        session = Session()
+        try:
+            return JobStateService.get_sync(session, FileLayout.MIGRATED) == '1'
+        finally:
+            session.close()
+
+    @staticmethod
+    def needs_migration() -> bool:
+        """Нужен ли перенос: решает отметка в БД, а не только содержимое папок.
+
+        Записи с плоскими путями остаются и тогда, когда файлы уже переехали
+        (сбой между переносом и commit), поэтому пустые плоские папки не
+        означают, что миграция завершена.
+        """
+        return not FileLayout.is_migrated() or FileLayout.has_flat_files()
+
+    @staticmethod
+    def migrate(batch_size: int = 1000) -> int:
+        """Переносит файлы из плоских папок в подпапки без остановки бота.
+
+        Сначала файл перемещается, затем обновляется запись (до этого ее путь
+        находит ``resolve``). Если пачку не удалось зафиксировать, ее файлы
+        возвращаются на место. Проход по записям идет по БД, поэтому повторный
+        запуск исправляет и записи, чьи файлы уже перенесены. Отметка
+        MIGRATED ставится только после прохода без ошибок. Запускается в
+        отдельном потоке; возвращает число перенесенных файлов.
+        """
+        moved = 0
+        completed = True
+        for model, columns in (
+            (File, [(File.file_path, Config.UPLOAD_FOLDER), (File.backup_path, Config.BACKUP_FOLDER)]),
+            (BackupBlob, [(BackupBlob.path, Config.BACKUP_FOLDER)]),
+        ):
+            column_moved, column_completed = FileLayout._migrate_column(model, columns, batch_size)
+            moved += column_moved
+            completed = completed and column_completed
+
+        if completed:
+            # Файлы без записей в БД тоже убираем из плоских папок (после сбоя
+            # в плоской папке лежат и файлы откатившихся пачек — их не трогаем)
+            for folder in (Config.UPLOAD_FOLDER, Config.BACKUP_FOLDER):
+                with os.scandir(folder) as entries:
+                    flat_files = [entry.path for entry in entries if entry.is_file()]
+                for path in flat_files:
+                    FileLayout._move(path)
+                    moved += 1
+
+            session = Session()
+            try:
+                JobStateService.set_sync(session, FileLayout.MIGRATED, 1)
+                session.commit()
+            finally:
+                session.close()
+
+        if moved:
+            bot_logger.logger.info(f"Перенесено в подпапки путей к файлам: {moved}")
+        if not completed:
+            bot_logger.logger.warning("Перенос файлов в подпапки не завершен, он повторится при следующем запуске")
+        return moved
+
+    @staticmethod
+    def _migrate_column(model, columns: list, batch_size: int):
+        """Обходит таблицу пачками по id и переносит файлы из указанных колонок.
+
+        Возвращает (число перенесенных путей, пройдена ли таблица без ошибок).
+        """
+        moved = 0
+        last_id = 0
+        session = Session()
+        try:
+            while True:
+                rows = session.execute(
+                    select(model.id, *[column for column, _ in columns])
+                    .where(model.id > last_id)
+                    .order_by(model.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    return moved, True
+
+                batch_moves = []  # (откуда, куда) для отката пачки
+                try:
+                    for row in rows:
+                        values = {}
+                        for (column, folder), path in zip(columns, row[1:]):
+                            if FileLayout._is_flat(path, folder):
+                                existed = os.path.exists(path)
+                                values[column.key] = FileLayout._move(path)
+                                if existed:
+                                    batch_moves.append((path, values[column.key]))
+                        if values:
+                            session.execute(update(model).where(model.id == row[0]).values(**values))
+                    session.commit()
+                except Exception as e:
+                    session.rollback()
+                    FileLayout._undo_moves(batch_moves)
+                    bot_logger.logger.error(f"Ошибка переноса файлов {model.__tablename__} в подпапки: {e}")
+                    return moved, False
+
+                moved += len(batch_moves)
+                last_id = rows[-1][0]
+        finally:
+            session.close()
+
+    @staticmethod
+    def _undo_moves(moves: list):
+        """Возвращает файлы неудавшейся пачки в плоскую папку"""
+        for source, target in reversed(moves):
+            try:
+                if os.path.exists(target) and not os.path.exists(source):
+                    os.replace(target, source)
+            except OSError as e:
+                bot_logger.logger.error(f"Не удалось вернуть файл {target} в {source}: {e}")
@@ -1,88 +1,362 @@
 # services/file_manager.py
+import asyncio
 import os
-import shutil
 import hashlib
 import uuid
+import time
 from datetime import datetime
-from database.session import Session
+from sqlalchemy import select, update, func
+from telegram.error import BadRequest
+from database.session import AsyncSession
 from database.models import File, FileDelivery, User
 from services.logger import bot_logger
+from services.bot_api import send_with_retry, is_unreachable
+from services.reachability import ReachabilityService
+from services.backup_store import BackupStore
+from services.file_layout import FileLayout
 from config import Config
 
 class FileManager:
     """Сервис управления файлами"""
     
+    # Результат deliver_next_file: пользователь уже получил билет или его обслуживает другая рассылка
+    SKIPPED = 'skipped'
+    
+    # Число отправок и суммарное время по способу доставки: file_id или загрузка байтов
+    send_stats = {'file_id': [0, 0.0], 'upload': [0, 0.0]}
+
     @staticmethod
-    def create_backup_copy(file_path: str, user_hash: str) -> str:
-        """Создает резервную копию файла"""
+    def _record_latency(path: str, started: float):
+        stats = FileManager.send_stats[path]
+        stats[0] += 1
+        stats[1] += time.monotonic() - started
+    
+    @staticmethod
+    def latency_summary() -> str:
+        """Средняя задержка отправки по file_id и с загрузкой байтов"""
+        parts = []
+        for path, (count, total) in FileManager.send_stats.items():
+            if count:
+                parts.append(f"{path}: {count} шт., {total / count * 1000:.0f} мс в среднем")
+        return "; ".join(parts) or "нет отправок"
+    
+    @staticmethod
+    async def preupload_files(application) -> int:
+        """Загружает свободные файлы без file_id в служебный чат и сохраняет их file_id.
+        
+        После этого доставка пользователю идет по file_id без повторной загрузки байтов.
+        """
+        if not Config.STORAGE_CHAT_ID:
+            return 0
+        
+        uploaded = 0
+        last_id = 0
+        session = AsyncSession()
         try:
-            backup_filename = f"{user_hash}_backup{os.path.splitext(file_path)[1]}"
-            backup_path = os.path.join(Config.BACKUP_FOLDER, backup_filename)
-            shutil.copy2(file_path, backup_path)
-            return backup_path
+            while True:
+                files = (await session.scalars(
+                    select(File)
+                    .where(File.id > last_id, File.distributed == False, File.telegram_file_id == None)
+                    .order_by(File.id)
+                    .limit(Config.PREUPLOAD_BATCH_SIZE)
+                )).all()
+                if not files:
+                    break
+                
+                for file in files:
+                    last_id = file.id
+                    
+                    async def upload():
+                        with open(FileLayout.resolve(file.file_path) or file.file_path, 'rb') as file_data:
+                            return await application.bot.send_document(
+                                chat_id=Config.STORAGE_CHAT_ID,
+                                document=file_data,
+                                filename=os.path.basename(file.file_path),
+                                disable_notification=True
+                            )
+                    
+                    try:
+                        message = await send_with_retry(Config.STORAGE_CHAT_ID, upload)
+                        file.telegram_file_id = message.document.file_id
+                        uploaded += 1
+                    except Exception as e:
+                        bot_logger.logger.error(f"Ошибка предзагрузки файла {file.id}: {e}")
+                
+                await session.commit()
+            
+            bot_logger.logger.info(f"Предзагружено файлов в служебный чат: {uploaded}")
+            return uploaded
         except Exception as e:
-            bot_logger.logger.error(f"Ошибка при создании резервной копии: {e}")
-            return None
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка предзагрузки файлов: {e}")
+            return uploaded
+        finally:
+            await session.close()
     
     @staticmethod
-    async def send_file_to_user(user_obj: User, file: File, application) -> bool:
-        """Отправляет файл пользователю и обновляет статусы"""
-        session = Session()
+    async def claim_free_file(user_id: int):
+        """Атомарно закрепляет следующий свободный файл за пользователем.
+        
+        Выбор и пометка файла выполняются одним условным UPDATE по индексу
+        ix_files_distributed, поэтому один файл не достанется двум пользователям.
+        Возвращает File или None, если свободных файлов нет.
+        """
+        session = AsyncSession()
         try:
-            file_ext = os.path.splitext(file.file_path)[1]
-            
-            backup_path = FileManager.create_backup_copy(file.file_path, user_obj.file_hash)
-            
-            with open(file.file_path, 'rb') as file_data:
-                await application.bot.send_document(
-                    chat_id=user_obj.user_id,
-                    document=file_data,
-                    filename=f"{user_obj.file_hash}{file_ext}",
-                    caption=(
-                        f"🎫 Ваш уникальный файл!\n\n"
-                        f"🆔 Ваш ID: `{user_obj.file_hash}`\n"
-                        f"📁 Исходное название: {file.original_name}\n\n"
-                        f"💾 Сохраните файл в надежном месте!\n"
-                        f"🔧 Если файл будет утерян, используйте /recover для восстановления"
+            for _ in range(Config.CLAIM_ATTEMPTS):
+                next_free_id = (
+                    select(File.id)
+                    .where(File.distributed == False)
+                    .order_by(File.id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                    .scalar_subquery()
+                )
+                file = await session.scalar(
+                    update(File)
+                    .where(File.id == next_free_id, File.distributed == False)
+                    .values(
+                        distributed=True,
+                        distributed_to=user_id,
+                        distributed_at=datetime.utcnow()
                     )
+                    .returning(File)
+                    .execution_options(synchronize_session=False)
                 )
-            
-            file.distributed = True
-            file.distributed_to = user_obj.user_id
-            file.distributed_at = datetime.utcnow()
-            file.backup_path = backup_path
-            
-            delivery = FileDelivery(
-                user_id=user_obj.user_id,
-                file_id=file.id,
-                delivery_status='sent'
+                await session.commit()
+                
+                if file is not None:
+                    return file
+                
+                # Свободных файлов нет или файл перехватил другой процесс — проверяем еще раз
+                if not await session.scalar(select(File.id).where(File.distributed == False).limit(1)):
+                    return None
+            return None
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка резервирования файла для {user_id}: {e}")
+            return None
+        finally:
+            await session.close()
+    
+    @staticmethod
+    async def _set_pending(user_id: int, pending: bool) -> bool:
+        """Условно переключает pending_file у пользователя без билетов.
+        
+        Снятие флага резервирует пользователя за одной доставкой: из параллельных
+        рассылок UPDATE затронет строку только у одной. Возвращает True, если
+        флаг переключен.
+        """
+        session = AsyncSession()
+        try:
+            result = await session.execute(
+                update(User)
+                .where(User.user_id == user_id, User.pending_file == (not pending), User.files_received == 0)
+                .values(pending_file=pending)
             )
-            session.add(delivery)
-            
-            user_obj.files_received += 1
-            user_obj.last_file_sent = datetime.utcnow()
-            user_obj.pending_file = False
-            
-            session.commit()
-            return True
+            await session.commit()
+            return result.rowcount == 1
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка обновления ожидания билета у {user_id}: {e}")
+            return False
+        finally:
+            await session.close()
+    
+    @staticmethod
+    async def release_file(file_id: int):
+        """Возвращает зарезервированный файл в пул свободных"""
+        session = AsyncSession()
+        try:
+            await session.execute(
+                update(File)
+                .where(File.id == file_id)
+                .values(distributed=False, distributed_to=None, distributed_at=None)
+            )
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка освобождения файла {file_id}: {e}")
+        finally:
+            await session.close()
+    
+    @staticmethod
+    async def deliver_next_file(user_obj: User, application):
+        """Резервирует пользователя и свободный файл, затем отправляет файл.
+        
+        Возвращает True/False по результату отправки, None, если свободных файлов
+        нет, или SKIPPED, если пользователь уже получил билет или его файл
+        отправляет другая рассылка.
+        """
+        if not await FileManager._set_pending(user_obj.user_id, False):
+            return FileManager.SKIPPED
+        
+        file = await FileManager.claim_free_file(user_obj.user_id)
+        if file is None:
+            await FileManager._set_pending(user_obj.user_id, True)
+            return None
+        
+        success = await FileManager.send_file_to_user(user_obj, file, application)
+        if not success:
+            await FileManager.release_file(file.id)
+            await FileManager._set_pending(user_obj.user_id, True)
+        return success
+    
+    @staticmethod
+    async def send_file_to_user(user_obj: User, file: File, application) -> bool:
+        """Отправляет файл пользователю и обновляет статусы.
+        
+        False возвращается, только если не удалась сама отправка — тогда файл
+        можно вернуть в пул. После успешной отправки доставка окончательна:
+        ошибки учета в БД не приводят к освобождению уже выданного билета.
+        """
+        file_ext = os.path.splitext(file.file_path)[1]
+        file_path = FileLayout.resolve(file.file_path) or file.file_path
+
+        caption = (
+            f"🎫 Ваш уникальный файл!\n\n"
+            f"🆔 Ваш ID: `{user_obj.file_hash}`\n"
+            f"📁 Исходное название: {file.original_name}\n\n"
+            f"💾 Сохраните файл в надежном месте!\n"
+            f"🔧 Если файл будет утерян, используйте /recover для восстановления"
+        )
+        
+        try:
+            message = None
+            if file.telegram_file_id:
+                started = time.monotonic()
+                try:
+                    message = await send_with_retry(
+                        user_obj.user_id,
+                        lambda: application.bot.send_document(
+                            chat_id=user_obj.user_id,
+                            document=file.telegram_file_id,
+                            caption=caption
+                        )
+                    )
+                    FileManager._record_latency('file_id', started)
+                except BadRequest as e:
+                    if is_unreachable(e):
+                        raise
+                    bot_logger.logger.warning(f"file_id файла {file.id} недействителен ({e}), отправляем файл с диска")
             
+            if message is None:
+                async def upload():
+                    # Файл открывается заново на каждую попытку отправки
+                    with open(file_path, 'rb') as file_data:
+                        return await application.bot.send_document(
+                            chat_id=user_obj.user_id,
+                            document=file_data,
+                            filename=f"{user_obj.file_hash}{file_ext}",
+                            caption=caption
+                        )
+                
+                started = time.monotonic()
+                message = await send_with_retry(user_obj.user_id, upload)
+                FileManager._record_latency('upload', started)
         except Exception as e:
             bot_logger.logger.error(f"Ошибка отправки файла пользователю {user_obj.user_id}: {e}")
-            
-            delivery = FileDelivery(
+            await FileManager._record_failure(user_obj, file, e)
+            return False
+        
+        await FileManager._record_delivery(user_obj, file, message)
+        await FileManager._store_backup(file, file_path)
+        return True
+    
+    @staticmethod
+    async def _record_delivery(user_obj: User, file: File, message):
+        """Фиксирует успешную доставку; при ошибке БД повторяет попытку.
+        
+        Файл уже закреплен за пользователем при резервировании, поэтому даже
+        если записать доставку так и не удалось, билет не возвращается в пул.
+        """
+        telegram_file_id = message.document.file_id if message.document else None
+        for attempt in range(Config.DELIVERY_RECORD_ATTEMPTS):
+            session = AsyncSession()
+            try:
+                # Объекты могли быть загружены в другой сессии — обновляем их копии в текущей
+                db_file = await session.get(File, file.id)
+
+                db_file.distributed = True
+                db_file.distributed_to = user_obj.user_id
+                db_file.distributed_at = datetime.utcnow()
+                if telegram_file_id:
+                    db_file.telegram_file_id = telegram_file_id
+
+                session.add(FileDelivery(
+                    user_id=user_obj.user_id,
+                    file_id=file.id,
+                    delivery_status='sent',
+                    message_id=message.message_id,
+                    telegram_file_id=telegram_file_id
+                ))
+
+                # Счетчик увеличивается в SQL: параллельные доставки не затирают друг друга
+                await session.execute(
+                    update(User)
+                    .where(User.id == user_obj.id)
+                    .values(
+                        files_received=func.coalesce(User.files_received, 0) + 1,
+                        last_file_sent=datetime.utcnow(),
+                        pending_file=False
+                    )
+                )
+
+                await session.commit()
+                return
+            except Exception as e:
+                await session.rollback()
+                bot_logger.logger.error(
+                    f"Ошибка записи доставки файла {file.id} пользователю {user_obj.user_id} "
+                    f"(попытка {attempt + 1}): {e}"
+                )
+            finally:
+                await session.close()
+            await asyncio.sleep(Config.BOT_API_RETRY_BACKOFF * (2 ** attempt))
+        
+        bot_logger.logger.critical(
+            f"Файл {file.id} отправлен пользователю {user_obj.user_id} (message_id={message.message_id}), "
+            f"но доставка не записана в БД; файл остается закрепленным"
+        )
+    
+    @staticmethod
+    async def _store_backup(file: File, file_path: str):
+        """Создает резервную копию выданного файла отдельной транзакцией"""
+        session = AsyncSession()
+        try:
+            db_file = await session.get(File, file.id)
+            if db_file is None or db_file.backup_path:
+                return
+            db_file.backup_path = await BackupStore.store(session, file_path, db_file.sha256)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка при создании резервной копии файла {file.id}: {e}")
+        finally:
+            await session.close()
+    
+    @staticmethod
+    async def _record_failure(user_obj: User, file: File, error: Exception):
+        """Записывает неудачную отправку и отмечает недоступного пользователя"""
+        session = AsyncSession()
+        try:
+            if is_unreachable(error):
+                await ReachabilityService.mark_unreachable(session, [user_obj.user_id])
+            session.add(FileDelivery(
                 user_id=user_obj.user_id,
                 file_id=file.id,
                 delivery_status='failed',
-                error_message=str(e)
-            )
-            session.add(delivery)
-            session.commit()
-            return False
+                error_message=str(error)
+            ))
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка записи неудачной доставки файла {file.id}: {e}")
         finally:
-            session.close()
-    
+            await session.close()
+
     @staticmethod
     def generate_user_hash(user_id: int) -> str:
         """Генерирует уникальный хэш для пользователя"""
         hash_object = hashlib.sha256(f"{user_id}_{uuid.uuid4()}".encode())
-        return hash_object.hexdigest()[:16]
\ No newline at end of file
+        return hash_object.hexdigest()[:16]
@@ -0,0 +1,39 @@
+from datetime import datetime
+from sqlalchemy import select
+from database.models import JobState
+
+class JobStateService:
+    """Чтение и запись прогресса фоновых задач в таблице job_state.
+
+    Значение пишется в сессии вызывающего кода, чтобы фиксироваться в одной
+    транзакции с обработанной порцией данных.
+    """
+
+    @staticmethod
+    async def get(session, name: str, default: str = None) -> str:
+        value = await session.scalar(select(JobState.value).filter_by(name=name))
+        return default if value is None else value
+
+    @staticmethod
+    async def set(session, name: str, value):
+        state = await session.scalar(select(JobState).filter_by(name=name))
+        JobStateService._assign(session, state, name, value)
+
+    @staticmethod
+    def get_sync(session, name: str, default: str = None) -> str:
+        """То же, что get, для синхронной сессии (фоновые потоки)"""
+        value = session.scalar(select(JobState.value).filter_by(name=name))
+        return default if value is None else value
+
+    @staticmethod
+    def set_sync(session, name: str, value):
+        state = session.scalar(select(JobState).filter_by(name=name))
+        JobStateService._assign(session, state, name, value)
+
+    @staticmethod
+    def _assign(session, state, name: str, value):
+        if state is None:
+            state = JobState(name=name)
+            session.add(state)
+        state.value = None if value is None else str(value)
+        state.updated_at = datetime.utcnow()
@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict, deque
+
+class SlidingWindowRateLimiter:
+    """Скользящее окно запросов в памяти процесса.
+
+    Для каждого ключа хранится не больше ``limit`` отметок времени, поэтому
+    проверка стоит O(1). Ключи упорядочены по последнему обращению: простаивающие
+    окна вытесняются с начала словаря, а общее число окон ограничено ``max_keys``.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100_000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def hit(self, key, now: float = None) -> bool:
+        """Регистрирует действие. Возвращает False, если лимит уже исчерпан"""
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - self.window
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = deque(maxlen=self.limit)
+            self._buckets[key] = bucket
+        else:
+            self._buckets.move_to_end(key)
+            while bucket and bucket[0] <= cutoff:
+                bucket.popleft()
+
+        allowed = len(bucket) < self.limit
+        if allowed:
+            bucket.append(now)
+
+        self._evict(cutoff)
+        return allowed
+
+    def _evict(self, cutoff: float):
+        """Удаляет простаивающие окна и держит размер в пределах max_keys"""
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) > self.max_keys or not bucket or bucket[-1] <= cutoff:
+                self._buckets.popitem(last=False)
+            else:
+                break
+
+    def reset(self, key=None):
+        """Сбрасывает окно одного ключа или все окна"""
+        if key is None:
+            self._buckets.clear()
+        else:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
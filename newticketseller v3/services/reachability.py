@@ -0,0 +1,52 @@
+from datetime import datetime
+from sqlalchemy import update
+from database.session import AsyncSession
+from database.models import User
+from services.logger import bot_logger
+
+class ReachabilityService:
+    """Учет пользователей, до которых бот не может достучаться.
+
+    После постоянной ошибки отправки (бот заблокирован, чат не найден,
+    аккаунт удален) у пользователя заполняется ``unreachable_at``, и он
+    выпадает из выборок рассылок и доставки файлов. Когда пользователь
+    снова пишет боту, отметка снимается.
+    """
+
+    @staticmethod
+    def reachable():
+        """Условие для выборок получателей"""
+        return User.unreachable_at.is_(None)
+
+    @staticmethod
+    async def mark_unreachable(session, user_ids):
+        """Отмечает пользователей недоступными в сессии вызывающего кода (без commit)"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        await session.execute(
+            update(User)
+            .where(User.user_id.in_(user_ids), User.unreachable_at.is_(None))
+            .values(unreachable_at=datetime.utcnow())
+        )
+
+    @staticmethod
+    async def readmit(user_id: int) -> bool:
+        """Снимает отметку недоступности. Возвращает True, если она была"""
+        session = AsyncSession()
+        try:
+            result = await session.execute(
+                update(User)
+                .where(User.user_id == user_id, User.unreachable_at.is_not(None))
+                .values(unreachable_at=None)
+            )
+            await session.commit()
+            if result.rowcount:
+                bot_logger.logger.info(f"Пользователь {user_id} снова доступен для рассылок")
+            return result.rowcount > 0
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка снятия отметки недоступности {user_id}: {e}")
+            return False
+        finally:
+            await session.close()
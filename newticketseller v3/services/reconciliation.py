@@ -0,0 +1,198 @@
+import asyncio
+import os
+import time
+from sqlalchemy import select
+from database.session import AsyncSession
+from database.models import BackupBlob, File
+from services.file_layout import FileLayout
+from services.job_state import JobStateService
+from services.logger import bot_logger
+from config import Config
+
+# Размер списка в одном запросе IN (...)
+LOOKUP_CHUNK_SIZE = 500
+
+class ReconcileReport:
+    """Итог одного среза сверки диска и БД"""
+
+    def __init__(self):
+        self.scanned = 0  # файлов на диске
+        self.orphans = 0  # файлов без записи в БД
+        self.bytes_recovered = 0
+        self.checked_rows = 0  # записей File, проверенных на наличие файла
+        self.missing = []  # id записей File без файла на диске
+        self.cycle_completed = False
+        self.elapsed = 0.0
+
+class ReconciliationService:
+    """Сверка файлов на диске с записями в БД.
+
+    Работает срезами: каждый запуск обходит папки (через ``os.scandir`` в
+    отдельном потоке) и записи File не дольше ``RECONCILE_SLICE_BUDGET``
+    секунд и запоминает позицию в job_state. Файлы без записей старше
+    ``RECONCILE_GRACE`` считаются брошенными и удаляются (или только
+    попадают в отчет, если RECONCILE_DELETE_ORPHANS выключен).
+    """
+
+    DIR_CURSOR = 'reconcile.last_dir'
+    ROW_CURSOR = 'reconcile.last_file_id'
+
+    @staticmethod
+    def _leaf_dirs() -> list:
+        """Папки с файлами в порядке обхода: подпапки хранилищ и папка ZIP архивов"""
+        dirs = []
+        for folder in (Config.UPLOAD_FOLDER, Config.BACKUP_FOLDER):
+            with os.scandir(folder) as level1:
+                for first in sorted(entry.path for entry in level1 if entry.is_dir()):
+                    with os.scandir(first) as level2:
+                        dirs.extend(sorted(entry.path for entry in level2 if entry.is_dir()))
+        dirs.append(Config.ZIP_FOLDER)
+        return dirs
+
+    @staticmethod
+    def _scan(last_dir: str, deadline: float):
+        """Собирает файлы из папок после ``last_dir`` до истечения времени.
+
+        Возвращает (файлы [(путь, размер, время изменения)], последняя папка,
+        дошли ли до конца).
+        """
+        dirs = ReconciliationService._leaf_dirs()
+        start = dirs.index(last_dir) + 1 if last_dir in dirs else 0
+
+        files = []
+        for directory in dirs[start:]:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        # ctime меняется при создании жесткой ссылки — свежая копия не считается старой
+                        files.append((entry.path, stat.st_size, max(stat.st_mtime, stat.st_ctime)))
+            if time.monotonic() >= deadline and directory != dirs[-1]:
+                return files, directory, False
+        return files, None, True
+
+    @staticmethod
+    def _existing(paths: list, deadline: float) -> list:
+        """Проверяет наличие файлов, пока не истекло время; возвращает флаги для проверенных"""
+        flags = []
+        for path in paths:
+            flags.append(FileLayout.resolve(path) is not None)
+            if time.monotonic() >= deadline:
+                break
+        return flags
+
+    @staticmethod
+    def _remove(paths: list) -> int:
+        freed = 0
+        for path in paths:
+            try:
+                freed += FileLayout.remove(path) or 0
+            except OSError as e:
+                bot_logger.logger.error(f"Ошибка удаления брошенного файла {path}: {e}")
+        return freed
+
+    @staticmethod
+    async def _known_paths(session, paths: list) -> set:
+        """Пути из списка, на которые ссылаются записи БД (поиск по индексам).
+
+        Запись может хранить и путь в подпапке, и старый плоский путь к тому
+        же файлу (``FileLayout.resolve`` находит оба), поэтому ищутся обе
+        формы, а в результат попадает путь на диске.
+        """
+        forms = {}  # путь в БД -> путь на диске
+        for path in paths:
+            forms[path] = path
+            flat = FileLayout.flat_path(path)
+            if flat:
+                forms[flat] = path
+
+        candidates = list(forms)
+        known = set()
+        for i in range(0, len(candidates), LOOKUP_CHUNK_SIZE):
+            chunk = candidates[i:i + LOOKUP_CHUNK_SIZE]
+            for column in (File.file_path, File.backup_path, BackupBlob.path):
+                for stored in (await session.scalars(select(column).where(column.in_(chunk)))).all():
+                    known.add(forms[stored])
+        return known
+
+    @staticmethod
+    async def run_slice() -> ReconcileReport:
+        report = ReconcileReport()
+        started = time.monotonic()
+
+        session = AsyncSession()
+        try:
+            if (await JobStateService.get(session, FileLayout.MIGRATED) != '1'
+                    or await asyncio.to_thread(FileLayout.has_flat_files)):
+                # Пока перенос в подпапки не завершен, пути в БД и на диске расходятся
+                return report
+
+            # Диск -> БД: брошенные файлы
+            last_dir = await JobStateService.get(session, ReconciliationService.DIR_CURSOR)
+            deadline = time.monotonic() + Config.RECONCILE_SLICE_BUDGET
+            files, last_dir, report.cycle_completed = await asyncio.to_thread(
+                ReconciliationService._scan, last_dir, deadline
+            )
+            report.scanned = len(files)
+
+            known = await ReconciliationService._known_paths(session, [path for path, _, _ in files])
+            cutoff = time.time() - Config.RECONCILE_GRACE
+            orphans = [
+                (path, size) for path, size, changed_at in files
+                if path not in known and changed_at < cutoff
+            ]
+            report.orphans = len(orphans)
+            if orphans and Config.RECONCILE_DELETE_ORPHANS:
+                report.bytes_recovered = await asyncio.to_thread(
+                    ReconciliationService._remove, [path for path, _ in orphans]
+                )
+            elif orphans:
+                bot_logger.logger.warning(
+                    f"Брошенные файлы ({len(orphans)}, {sum(size for _, size in orphans)} байт): "
+                    f"{', '.join(path for path, _ in orphans[:10])}"
+                )
+
+            await JobStateService.set(session, ReconciliationService.DIR_CURSOR, last_dir)
+
+            # БД -> диск: записи без файлов
+            last_id = int(await JobStateService.get(session, ReconciliationService.ROW_CURSOR, 0))
+            rows = (await session.execute(
+                select(File.id, File.file_path)
+                .where(File.id > last_id, File.archive_id == None)
+                .order_by(File.id)
+                .limit(LOOKUP_CHUNK_SIZE)
+            )).all()
+            deadline = time.monotonic() + Config.RECONCILE_SLICE_BUDGET
+            flags = await asyncio.to_thread(
+                ReconciliationService._existing, [row.file_path for row in rows], deadline
+            )
+            report.checked_rows = len(flags)
+            report.missing = [row.id for row, exists in zip(rows, flags) if not exists]
+            if flags:
+                last_id = rows[len(flags) - 1].id
+            elif not rows:
+                last_id = 0
+            await JobStateService.set(session, ReconciliationService.ROW_CURSOR, last_id)
+
+            await session.commit()
+
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка сверки файлов: {e}")
+        finally:
+            await session.close()
+
+        report.elapsed = time.monotonic() - started
+        if report.cycle_completed:
+            bot_logger.logger.info("Сверка файлов: обход папок завершен, следующий начнется сначала")
+        if report.orphans or report.missing:
+            bot_logger.logger.warning(
+                f"Сверка файлов: просмотрено {report.scanned} файлов и {report.checked_rows} записей, "
+                f"брошенных {report.orphans} (освобождено {report.bytes_recovered / 1024 / 1024:.1f} МБ), "
+                f"записей без файла {len(report.missing)}: {report.missing[:20]}"
+            )
+        return report
+
+    @staticmethod
+    async def reconcile_task(context):
+        await ReconciliationService.run_slice()
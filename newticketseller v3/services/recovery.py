@@ -0,0 +1,132 @@
+import os
+from datetime import datetime
+from sqlalchemy import select
+from telegram.error import BadRequest
+from database.session import AsyncSession
+from database.models import File, FileDelivery, User
+from services.archive import ArchiveService
+from services.bot_api import send_with_retry
+from services.file_layout import FileLayout
+from services.logger import bot_logger
+from services.rate_limiter import SlidingWindowRateLimiter
+from config import Config
+
+class RecoveryService:
+    """Повторная отправка утерянного билета.
+
+    Сначала пробует скопировать доставленное сообщение (copy_message), затем
+    отправить документ по сохраненному file_id и только потом — загрузить
+    резервную копию с диска или билет из архивного пакета.
+    """
+
+    _limiter = SlidingWindowRateLimiter(
+        limit=Config.RECOVERY_LIMIT,
+        window=Config.RECOVERY_WINDOW
+    )
+
+    @staticmethod
+    async def recover_ticket(user_obj: User, application) -> str:
+        """Восстанавливает последний доставленный билет пользователя.
+
+        Возвращает способ восстановления: 'copy', 'file_id', 'backup', 'archive', либо
+        'not_found', 'rate_limited', 'failed'.
+        """
+        if not RecoveryService._limiter.hit(user_obj.user_id):
+            bot_logger.logger.warning(f"Превышен лимит восстановлений: user_id={user_obj.user_id}")
+            return 'rate_limited'
+
+        session = AsyncSession()
+        try:
+            delivery = await session.scalar(
+                select(FileDelivery)
+                .where(
+                    FileDelivery.user_id == user_obj.user_id,
+                    FileDelivery.delivery_status.in_(('sent', 'recovered'))
+                )
+                .order_by(FileDelivery.id.desc())
+                .limit(1)
+            )
+            if not delivery:
+                return 'not_found'
+
+            method, message = await RecoveryService._resend(session, user_obj, delivery, application)
+            if message is None:
+                return 'failed'
+
+            delivery.delivery_status = 'recovered'
+            delivery.recovery_attempts = (delivery.recovery_attempts or 0) + 1
+            delivery.last_recovery_attempt = datetime.utcnow()
+            delivery.message_id = message.message_id
+            if getattr(message, 'document', None):
+                delivery.telegram_file_id = message.document.file_id
+
+            await session.commit()
+            bot_logger.logger.info(f"Билет восстановлен для {user_obj.user_id} ({method})")
+            return method
+
+        except Exception as e:
+            await session.rollback()
+            bot_logger.logger.error(f"Ошибка восстановления билета для {user_obj.user_id}: {e}")
+            return 'failed'
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def _resend(session, user_obj: User, delivery: FileDelivery, application):
+        """Пробует способы восстановления от самого дешевого к самому дорогому"""
+        chat_id = user_obj.user_id
+
+        if delivery.message_id:
+            try:
+                message = await send_with_retry(chat_id, lambda: application.bot.copy_message(
+                    chat_id=chat_id,
+                    from_chat_id=chat_id,
+                    message_id=delivery.message_id
+                ))
+                return 'copy', message
+            except BadRequest as e:
+                bot_logger.logger.info(f"Сообщение {delivery.message_id} недоступно для копирования: {e}")
+
+        caption = (
+            f"🔁 Восстановленный билет\n\n"
+            f"🆔 Ваш ID: `{user_obj.file_hash}`"
+        )
+
+        if delivery.telegram_file_id:
+            try:
+                message = await send_with_retry(chat_id, lambda: application.bot.send_document(
+                    chat_id=chat_id,
+                    document=delivery.telegram_file_id,
+                    caption=caption
+                ))
+                return 'file_id', message
+            except BadRequest as e:
+                bot_logger.logger.info(f"file_id доставки {delivery.id} недействителен: {e}")
+
+        file = await session.get(File, delivery.file_id)
+        if file is None:
+            return None, None
+
+        path = FileLayout.resolve(file.backup_path) or FileLayout.resolve(file.file_path)
+        if not path:
+            # Старый билет перенесен в пакет ticket_archives — читаем только его
+            data = await ArchiveService.read_ticket(file)
+            if data is None:
+                return None, None
+            return 'archive', await send_with_retry(chat_id, lambda: application.bot.send_document(
+                chat_id=chat_id,
+                document=data,
+                filename=f"{user_obj.file_hash}{os.path.splitext(file.file_path)[1]}",
+                caption=caption
+            ))
+
+        async def upload():
+            with open(path, 'rb') as file_data:
+                return await application.bot.send_document(
+                    chat_id=chat_id,
+                    document=file_data,
+                    filename=f"{user_obj.file_hash}{os.path.splitext(path)[1]}",
+                    caption=caption
+                )
+
+        return 'backup', await send_with_retry(chat_id, upload)
@@ -0,0 +1,86 @@
+import contextvars
+from sqlalchemy import event, select
+from sqlalchemy.orm.attributes import set_committed_value
+from database.session import AsyncSession, engine, async_engine
+from database.models import User
+from services.auth import AuthService
+from services.reachability import ReachabilityService
+from services.logger import bot_logger
+
+# Контекст текущего апдейта — через него считаются запросы к БД
+_current_request = contextvars.ContextVar('current_request', default=None)
+
+class RequestContext:
+    """Данные одного апдейта, общие для middleware и обработчиков.
+
+    Запись пользователя и флаг администратора загружаются один раз и
+    сохраняются в ``context.request``; обработчики берут их оттуда вместо
+    повторных запросов к БД. Загруженный ``user`` отсоединен от сессии и
+    годится только для чтения.
+    """
+
+    # Накопительная статистика запросов к БД по апдейтам
+    total_updates = 0
+    total_db_queries = 0
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.user = None
+        self.is_admin = False
+        self.db_queries = 0
+
+    @property
+    def has_access(self) -> bool:
+        return bool(self.user and self.user.has_access)
+
+    @staticmethod
+    async def resolve(update, context) -> "RequestContext":
+        """Возвращает контекст апдейта, загружая его при первом обращении"""
+        request = getattr(context, 'request', None)
+        if request is not None:
+            return request
+
+        request = RequestContext(update.effective_user.id)
+        context.request = request
+        _current_request.set(request)
+        RequestContext.total_updates += 1
+
+        session = AsyncSession()
+        try:
+            request.user = await session.scalar(select(User).filter_by(user_id=request.user_id))
+        except Exception as e:
+            bot_logger.logger.error(f"Ошибка загрузки пользователя {request.user_id}: {e}")
+        finally:
+            await session.close()
+
+        if request.user is not None and request.user.unreachable_at is not None:
+            # Пользователь снова пишет боту — возвращаем его в рассылки
+            # Колонка уже очищена в БД, поэтому отсоединенную копию обновляем без
+            # отметки об изменении — иначе session.merge(..., load=False) упадет
+            await ReachabilityService.readmit(request.user_id)
+            set_committed_value(request.user, 'unreachable_at', None)
+
+        request.is_admin = await AuthService.is_admin(request.user_id)
+        return request
+
+    @staticmethod
+    async def log_stats(update, context):
+        """Пишет в лог число запросов к БД за апдейт (подключается последним обработчиком)"""
+        request = getattr(context, 'request', None)
+        if request is None:
+            return
+
+        average = RequestContext.total_db_queries / max(RequestContext.total_updates, 1)
+        bot_logger.logger.info(
+            f"Апдейт {update.update_id}: запросов к БД {request.db_queries} "
+            f"(в среднем {average:.2f})"
+        )
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    request = _current_request.get()
+    if request is not None:
+        request.db_queries += 1
+        RequestContext.total_db_queries += 1
+
+event.listen(engine, 'before_cursor_execute', _count_query)
+event.listen(async_engine.sync_engine, 'before_cursor_execute', _count_query)
@@ -1,9 +1,13 @@
 import hashlib
 import uuid
 from datetime import datetime
-from database.session import Session
-from database.models import User, SubscriptionLink, File, FileDelivery
+from sqlalchemy import select, update, literal_column
+from database.session import AsyncSession
+from database.streaming import stream_keyset
+from database.models import User, SubscriptionLink
 from services.logger import bot_logger
+from config import Config
+from services.reachability import ReachabilityService
 # УБЕРИТЕ этот импорт: from services.file_manager import FileManager
 
 class SubscriptionService:
@@ -21,9 +25,9 @@ class SubscriptionService:
         return hash_object.hexdigest()[:16]
     
     @staticmethod
-    def create_subscription_link(seller_id: int) -> str:
+    async def create_subscription_link(seller_id: int) -> str:
         """Создает уникальную одноразовую ссылку для подписки"""
-        session = Session()
+        session = AsyncSession()
         try:
             token = SubscriptionService.generate_subscription_token()
             
@@ -32,7 +36,7 @@ class SubscriptionService:
                 created_by=seller_id
             )
             session.add(link)
-            session.commit()
+            await session.commit()
             
             # Получаем username бота (это будет исправлено позже)
             subscription_link = f"https://t.me/your_bot?start={token}"
@@ -40,20 +44,24 @@ class SubscriptionService:
             
         except Exception as e:
             bot_logger.logger.error(f"Ошибка при создании ссылки: {e}")
-            session.rollback()
+            await session.rollback()
             return None
         finally:
-            session.close()
+            await session.close()
     
     @staticmethod
-    def activate_subscription(user_id: int, token: str) -> bool:
-        """Активирует подписку по токену"""
-        session = Session()
+    async def activate_subscription(user_id: int, token: str, username: str = "", first_name: str = "", request=None) -> bool:
+        """Активирует подписку по токену
+        
+        Если передан контекст апдейта (RequestContext), запись пользователя берется из него
+        без повторного запроса к БД.
+        """
+        session = AsyncSession()
         try:
             bot_logger.logger.info(f"Активация подписки для {user_id} с токеном: {token}")
             
             # Ищем ссылку по токену
-            link = session.query(SubscriptionLink).filter_by(token=token).first()
+            link = await session.scalar(select(SubscriptionLink).filter_by(token=token))
             
             if not link:
                 bot_logger.logger.error(f"Ссылка с токеном {token} не найдена")
@@ -64,7 +72,10 @@ class SubscriptionService:
                 return False
             
             # Проверяем существующего пользователя
-            existing_user = session.query(User).filter_by(user_id=user_id).first()
+            if request is not None:
+                existing_user = await session.merge(request.user, load=False) if request.user else None
+            else:
+                existing_user = await session.scalar(select(User).filter_by(user_id=user_id))
             
             if existing_user and existing_user.has_access:
                 bot_logger.logger.error(f"Пользователь уже имеет активную подписку")
@@ -75,8 +86,8 @@ class SubscriptionService:
                 user_hash = SubscriptionService.generate_user_hash(user_id)
                 user = User(
                     user_id=user_id,
-                    username="",
-                    first_name="",
+                    username=username,
+                    first_name=first_name,
                     file_hash=user_hash,
                     has_access=True,
                     subscription_date=datetime.utcnow(),
@@ -85,68 +96,110 @@ class SubscriptionService:
                 session.add(user)
                 bot_logger.logger.info(f"Создан новый пользователь: {user_id}")
             else:
-                existing_user.has_access = True
-                existing_user.subscription_date = datetime.utcnow()
-                existing_user.pending_file = True
+                user = existing_user
+                user.has_access = True
+                user.subscription_date = datetime.utcnow()
+                user.pending_file = True
+                if username or first_name:
+                    user.username = username
+                    user.first_name = first_name
                 bot_logger.logger.info(f"Обновлен существующий пользователь: {user_id}")
             
-            # Обновляем статус ссылки
-            link.is_used = True
-            link.used_by = user_id
-            link.used_at = datetime.utcnow()
+            # Занимаем ссылку условным UPDATE: апдейты разных пользователей
+            # обрабатываются параллельно, и одну ссылку могут открыть двое
+            claimed = await session.execute(
+                update(SubscriptionLink)
+                .where(SubscriptionLink.id == link.id, SubscriptionLink.is_used == False)
+                .values(is_used=True, used_by=user_id, used_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            if claimed.rowcount != 1:
+                bot_logger.logger.error("Ссылка уже использована")
+                await session.rollback()
+                return False
             
-            session.commit()
+            await session.commit()
+            if request is not None:
+                request.user = user
             bot_logger.logger.info(f"Подписка активирована для пользователя {user_id}")
             return True
             
         except Exception as e:
             bot_logger.logger.error(f"Ошибка при активации подписки: {e}")
-            session.rollback()
+            await session.rollback()
             return False
         finally:
-            session.close()
+            await session.close()
+    
+    # Фильтры списка подписчиков в админ-панели
+    SUBSCRIBER_FILTERS = {
+        'all': "Все подписчики",
+        'pending': "Ожидают билет",
+        'received': "Получили билет",
+        'blocked': "Заблокированные",
+    }
+    
+    @staticmethod
+    def _subscriber_filter(name: str) -> tuple:
+        if name == 'pending':
+            return (User.has_access == True, User.files_received == 0)
+        if name == 'received':
+            # Литерал, а не параметр: иначе SQLite не применит частичный индекс ix_users_received_id
+            return (User.files_received > literal_column('0'),)
+        if name == 'blocked':
+            return (User.is_blocked == True,)
+        return (User.has_access == True,)
+    
+    @staticmethod
+    async def get_subscribers_page(filter_name: str, cursor: int = 0, forward: bool = True, page_size: int = None):
+        """Страница подписчиков по keyset-курсору (id пользователя в таблице).
+        
+        Вперед — записи с id больше ``cursor``, назад — с id меньше. Каждая
+        страница — один индексный запрос с LIMIT, без OFFSET и подсчета всех
+        строк. Возвращает (пользователи, есть_предыдущая, есть_следующая).
+        """
+        page_size = page_size or Config.SUBSCRIBERS_PAGE_SIZE
+        query = select(User).filter(*SubscriptionService._subscriber_filter(filter_name))
+        if forward:
+            query = query.filter(User.id > cursor).order_by(User.id)
+        else:
+            query = query.filter(User.id < cursor).order_by(User.id.desc())
+        
+        session = AsyncSession()
+        try:
+            users = list((await session.scalars(query.limit(page_size + 1))).all())
+        finally:
+            await session.close()
+        
+        has_more = len(users) > page_size
+        users = users[:page_size]
+        if forward:
+            return users, cursor > 0, has_more
+        users.reverse()
+        return users, has_more, True
     
     @staticmethod
     async def auto_send_to_new_users(application):
         """Автоматически отправляет файлы новым пользователям"""
-        session = Session()
         try:
-            new_users = session.query(User).filter(
+            new_users = stream_keyset(select(User).filter(
                 User.has_access == True,
                 User.files_received == 0,
-                User.pending_file == True
-            ).all()
+                User.pending_file == True,
+                ReachabilityService.reachable()
+            ), User.id)
             
-            if not new_users:
-                return
+            # Импортируем DeliveryEngine здесь, чтобы избежать циклического импорта
+            from services.delivery import DeliveryEngine
             
-            free_files = session.query(File).filter_by(distributed=False).all()
+            report = await DeliveryEngine(application).run(new_users)
+            sent_count = report.sent
             
-            if not free_files:
+            if report.no_file_users:
                 bot_logger.logger.info("Нет свободных файлов для автоматической отправки")
-                return
-            
-            # Импортируем FileManager здесь, чтобы избежать циклического импорта
-            from services.file_manager import FileManager
-            
-            sent_count = 0
-            for user_obj, file in zip(new_users, free_files):
-                if len(free_files) <= sent_count:
-                    break
-                    
-                try:
-                    success = await FileManager.send_file_to_user(user_obj, file, application)
-                    if success:
-                        sent_count += 1
-                        bot_logger.logger.info(f"Автоматически отправлен файл пользователю {user_obj.user_id}")
-                except Exception as e:
-                    bot_logger.logger.error(f"Ошибка автоматической отправки: {e}")
-                    continue
             
             if sent_count > 0:
                 bot_logger.logger.info(f"Автоматически отправлено {sent_count} файлов")
                 
         except Exception as e:
-            bot_logger.logger.error(f"Ошибка в auto_send_to_new_users: {e}")
-        finally:
-            session.close()
\ No newline at end of file
+            bot_logger.logger.error(f"Ошибка в auto_send_to_new_users: {e}")
\ No newline at end of file
@@ -0,0 +1,48 @@
+import asyncio
+import sys
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов разных пользователей.
+
+    Апдейты одного пользователя по-прежнему идут строго по очереди, поэтому
+    обработчикам не нужно защищаться от двойного нажатия кнопки или повторной
+    команды: гонки возможны только между разными пользователями, а общие
+    ресурсы (билеты, ссылки подписки) резервируются условным UPDATE в БД.
+
+    Общий лимит ``max_concurrent_updates`` применяется уже под замком
+    пользователя. Семафор базового класса берется в ``process_update`` до
+    замка, и апдейты, ждущие своей очереди у одного пользователя, занимали бы
+    все слоты и задерживали остальных — поэтому он фактически безлимитный.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._semaphore = asyncio.BoundedSemaphore(sys.maxsize)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}  # user_id -> [asyncio.Lock, число апдейтов в очереди]
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                # Замок больше никто не ждет — не копим их для всех пользователей
+                del self._locks[user.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
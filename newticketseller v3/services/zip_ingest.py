@@ -0,0 +1,216 @@
+import hashlib
+import math
+import multiprocessing
+import os
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from sqlalchemy import insert, select
+from database.session import Session
+from database.models import File
+from services.file_layout import FileLayout
+from services.logger import bot_logger
+from config import Config
+
+# Расширения билетов, которые принимаются из архива
+ALLOWED_EXTENSIONS = ('.pdf', '.txt', '.doc', '.docx')
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class IngestReport:
+    """Итог загрузки ZIP архива"""
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.processed = 0
+        self.done = 0  # распаковано или отклонено
+        self.errors = []  # (имя файла в архиве, текст ошибки)
+        self.duplicates = []  # (имя файла в архиве, причина пропуска)
+        self.elapsed = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+def _eligible(info: zipfile.ZipInfo) -> bool:
+    return not info.is_dir() and info.filename.lower().endswith(ALLOWED_EXTENSIONS)
+
+def _extract_member(zip_ref: zipfile.ZipFile, info: zipfile.ZipInfo, upload_folder: str) -> dict:
+    """Распаковывает файл архива сразу под хэшированным именем, считая SHA-256 содержимого.
+
+    Возвращает поля записи File. Недописанный файл удаляется при ошибке.
+    """
+    hash_name = hashlib.sha256(f"{uuid.uuid4()}".encode()).hexdigest()[:16]
+    file_path = FileLayout.upload_path(hash_name, os.path.splitext(info.filename)[1], upload_folder)
+
+    digest = hashlib.sha256()
+    try:
+        with zip_ref.open(info) as source, open(file_path, 'xb') as target:
+            for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    return {
+        'original_name': os.path.basename(info.filename),
+        'hash_name': hash_name,
+        'file_path': file_path,
+        'sha256': digest.hexdigest(),
+    }
+
+def _extract_members(zip_ref: zipfile.ZipFile, names: list, upload_folder: str):
+    """Распаковывает файлы архива, возвращает (записи File, ошибки)"""
+    rows, errors = [], []
+    for name in names:
+        try:
+            rows.append(_extract_member(zip_ref, zip_ref.getinfo(name), upload_folder))
+        except Exception as e:
+            errors.append((name, str(e)))
+    return rows, errors
+
+def _extract_chunk(zip_path: str, names: list, upload_folder: str):
+    """Задача для процесса пула: открывает архив самостоятельно и распаковывает свою порцию"""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return _extract_members(zip_ref, names, upload_folder)
+
+class ZipIngestService:
+    """Загрузка билетов из ZIP архива.
+
+    Работает синхронно и предназначена для запуска в отдельном потоке
+    (``asyncio.to_thread``), чтобы не блокировать event loop. Записи File
+    вставляются пачками по ``Config.INGEST_BATCH_SIZE``.
+    """
+
+    @staticmethod
+    def ingest(zip_path: str, progress=None) -> IngestReport:
+        """Загружает билеты из архива.
+
+        Большие архивы распаковываются параллельно в ``Config.INGEST_WORKERS``
+        процессах, по ``Config.INGEST_CHUNK_SIZE`` файлов на задачу; запись в БД
+        всегда идет из текущего потока. ``progress(report)`` вызывается после
+        каждой обработанной порции файлов.
+        """
+        started = time.monotonic()
+        report = IngestReport()
+
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            names = [info.filename for info in zip_ref.infolist() if _eligible(info)]
+        report.total = len(names)
+
+        chunks = math.ceil(len(names) / Config.INGEST_CHUNK_SIZE)
+        workers = min(Config.INGEST_WORKERS, chunks)
+        if workers > 1:
+            results = ZipIngestService._extract_parallel(zip_path, names, workers)
+        else:
+            results = ZipIngestService._extract_serial(zip_path, names)
+
+        batch = []
+        seen = set()
+        for rows, errors in results:
+            for name, error in errors:
+                bot_logger.logger.error(f"Ошибка при обработке файла {name}: {error}")
+            report.errors.extend(errors)
+            report.done += len(rows) + len(errors)
+
+            for row in rows:
+                if row['sha256'] in seen:
+                    ZipIngestService._skip_duplicate(row, "повтор в архиве", report)
+                else:
+                    seen.add(row['sha256'])
+                    batch.append(row)
+            if len(batch) >= Config.INGEST_BATCH_SIZE:
+                ZipIngestService._insert_batch(batch, report)
+                batch = []
+
+            if progress:
+                progress(report)
+
+        if batch:
+            ZipIngestService._insert_batch(batch, report)
+
+        report.elapsed = time.monotonic() - started
+        bot_logger.logger.info(
+            f"Загрузка архива: {report.processed}/{report.total} файлов, "
+            f"дубликатов {len(report.duplicates)}, ошибок {len(report.errors)}, {report.elapsed:.1f} с ({report.rate:.0f} файлов/с, "
+            f"процессов: {max(workers, 1)})"
+        )
+        return report
+
+    @staticmethod
+    def _extract_serial(zip_path: str, names: list):
+        """Распаковывает файлы в текущем потоке, по одному"""
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for name in names:
+                yield _extract_members(zip_ref, [name], Config.UPLOAD_FOLDER)
+
+    @staticmethod
+    def _extract_parallel(zip_path: str, names: list, workers: int):
+        """Распаковывает порции файлов в пуле процессов по мере готовности"""
+        size = Config.INGEST_CHUNK_SIZE
+        # spawn: процесс бота многопоточный, fork из него небезопасен
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {
+                pool.submit(_extract_chunk, zip_path, names[i:i + size], Config.UPLOAD_FOLDER): names[i:i + size]
+                for i in range(0, len(names), size)
+            }
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield [], [(name, f"сбой процесса распаковки: {e}") for name in futures[future]]
+
+    @staticmethod
+    def _skip_duplicate(member: dict, reason: str, report: IngestReport):
+        if os.path.exists(member['file_path']):
+            os.remove(member['file_path'])
+        report.duplicates.append((member['original_name'], reason))
+
+    @staticmethod
+    def _insert_batch(batch: list, report: IngestReport):
+        """Вставляет пачку записей одним executemany; при ошибке удаляет файлы пачки.
+
+        Файлы, содержимое которых уже есть в базе, пропускаются — поиск идет
+        по уникальному индексу ix_files_sha256.
+        """
+        uploaded_at = datetime.utcnow()
+        session = Session()
+        try:
+            existing = set(session.scalars(
+                select(File.sha256).where(File.sha256.in_([member['sha256'] for member in batch]))
+            ))
+            fresh = []
+            for member in batch:
+                if member['sha256'] in existing:
+                    ZipIngestService._skip_duplicate(member, "уже загружен", report)
+                else:
+                    fresh.append(member)
+            batch = fresh
+
+            rows = [
+                {
+                    'original_name': member['original_name'],
+                    'hash_name': member['hash_name'],
+                    'file_path': member['file_path'],
+                    'sha256': member['sha256'],
+                    'distributed': False,
+                    'upload_date': uploaded_at,
+                }
+                for member in batch
+            ]
+            if rows:
+                session.execute(insert(File), rows)
+            session.commit()
+            report.processed += len(rows)
+        except Exception as e:
+            session.rollback()
+            bot_logger.logger.error(f"Ошибка сохранения пачки из {len(batch)} файлов: {e}")
+            for member in batch:
+                if os.path.exists(member['file_path']):
+                    os.remove(member['file_path'])
+                report.errors.append((member['original_name'], str(e)))
+        finally:
+            session.close()
@@ -0,0 +1,184 @@
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# Бот читает настройки из окружения при импорте config — поэтому они задаются
+# до импорта модулей бота
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+WORKDIR = tempfile.mkdtemp(prefix='ticketbot-tests-')
+os.environ['DATABASE_URL'] = os.environ.get(
+    'TEST_DATABASE_URL', f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+)
+# Каждый asyncio.run — новый event loop, а соединения asyncpg привязаны к своему
+os.environ['DB_POOL_SIZE'] = '0'
+
+import pytest
+from sqlalchemy import delete
+from config import Config
+from database.session import Base, engine, init_db
+
+# Логгер открывает файл при импорте сервисов, еще до фикстур — его папку
+# задаем абсолютной, чтобы тесты не писали в bot_logs репозитория
+Config.LOG_FOLDER = os.path.join(WORKDIR, Config.LOG_FOLDER)
+init_db()
+
+@pytest.fixture(scope='session', autouse=True)
+def workdir():
+    """Папки с файлами бот создает относительно текущего каталога.
+
+    Каталог меняется на время сессии, а не при импорте conftest: иначе pytest
+    ищет testpaths уже во временном каталоге и не находит их.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(WORKDIR)
+        Config.create_folders()
+        yield WORKDIR
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    """Каждый тест начинается с пустых таблиц"""
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(delete(table))
+    yield
+
+@pytest.fixture
+def no_rate_limit(monkeypatch):
+    """Убирает задержки лимитера Bot API, чтобы тесты не ждали.
+
+    Лимитер создается заново: его asyncio.Lock привязывается к event loop,
+    а каждый asyncio.run в тестах — новый loop.
+    """
+    from services import bot_api
+    monkeypatch.setattr(bot_api, 'api_limiter', bot_api.BotApiLimiter(rate=1_000_000, per_chat_interval=0))
+
+class FakeBot:
+    """Локальная замена Bot API: запоминает отправки, может падать для выбранных чатов"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = []  # (chat_id, что отправлено)
+        self.uploads = []  # (chat_id, содержимое загруженного документа)
+        self.errors = {}  # chat_id -> исключение или список исключений для первых попыток
+        self.gate = None  # asyncio.Event: пока не установлен, отправки ждут
+        self._message_ids = itertools.count(1)
+
+    async def _send(self, chat_id, payload):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.gate is not None:
+            await self.gate.wait()
+        error = self.errors.get(chat_id)
+        if isinstance(error, list):
+            error = error.pop(0) if error else None
+        if error is not None:
+            raise error
+        self.sent.append((chat_id, payload))
+        file_id = payload if isinstance(payload, str) else None
+        message = FakeMessage(chat_id, document=SimpleNamespace(file_id=file_id or f"file-{chat_id}"))
+        message.message_id = next(self._message_ids)
+        return message
+
+    async def send_document(self, chat_id, document, **kwargs):
+        if isinstance(document, str):
+            return await self._send(chat_id, document)
+        content = document if isinstance(document, bytes) else document.read()
+        message = await self._send(chat_id, 'upload')
+        self.uploads.append((chat_id, content))
+        return message
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        return await self._send(chat_id, f"copy:{message_id}")
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._send(chat_id, text)
+
+    async def edit_message_text(self, *args, **kwargs):
+        return None
+
+class FakeMessage:
+    """Сообщение чата: ответы и правки текста запоминаются в ``texts``"""
+
+    def __init__(self, chat_id: int = 1, texts: list = None, document=None):
+        self.chat_id = chat_id
+        self.message_id = 1
+        self.document = document
+        self.texts = texts if texts is not None else []
+
+    async def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+        return FakeMessage(self.chat_id, self.texts)
+
+    async def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+        return self
+
+    async def delete(self):
+        return True
+
+    async def reply_document(self, document, **kwargs):
+        self.texts.append(f"document:{os.path.basename(getattr(document, 'name', str(document)))}")
+        return self
+
+class FakeQuery:
+    """Нажатие inline-кнопки в сообщении ``message``"""
+
+    def __init__(self, data: str, user_id: int = 1):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, first_name="Admin", username="admin")
+        self.message = FakeMessage(user_id)
+        self.texts = self.message.texts
+        self.reply_markup = None
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        self.texts.append(text)
+        self.reply_markup = kwargs.get('reply_markup')
+
+    def button(self, text: str) -> str:
+        """callback_data кнопки последнего показанного сообщения"""
+        for row in self.reply_markup.inline_keyboard:
+            for button in row:
+                if button.text == text:
+                    return button.callback_data
+        raise KeyError(text)
+
+def fake_update(user_id: int = 1, message=None, callback_query=None):
+    user = SimpleNamespace(id=user_id, first_name="Admin", username="admin")
+    return SimpleNamespace(
+        update_id=1, effective_user=user, effective_chat=SimpleNamespace(id=user_id),
+        message=message, callback_query=callback_query,
+        effective_message=message or (callback_query.message if callback_query else None)
+    )
+
+def admin_context(application):
+    """Контекст апдейта администратора без обращения к БД за правами"""
+    return SimpleNamespace(application=application, bot=application.bot, args=[],
+                           request=SimpleNamespace(is_admin=True, user=None, has_access=False))
+
+class FakeApplication:
+    """Минимум Application, нужный сервисам: bot и create_task"""
+
+    def __init__(self, bot=None):
+        self.bot = bot or FakeBot()
+        self.tasks = []
+
+    def create_task(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.append(task)
+        return task
+
+    async def wait_tasks(self):
+        """Ждет все фоновые задачи, включая запущенные из других задач"""
+        while any(not task.done() for task in self.tasks):
+            await asyncio.gather(*self.tasks)
+
+@pytest.fixture
+def fake_app():
+    return FakeApplication()
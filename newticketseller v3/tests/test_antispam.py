@@ -0,0 +1,57 @@
+import asyncio
+from collections import deque
+from sqlalchemy import select
+from database.session import Session
+from database.models import UserActivity
+from services.antispam import AntiSpamService
+from services.rate_limiter import SlidingWindowRateLimiter
+from config import Config
+
+def test_window_frees_slot_exactly_at_boundary():
+    limiter = SlidingWindowRateLimiter(limit=3, window=10)
+    assert [limiter.hit('u', now) for now in (0, 1, 2)] == [True] * 3
+    assert limiter.hit('u', 5) is False
+    # Отметка ровно window секунд назад уже не считается
+    assert limiter.hit('u', 10) is True
+    assert limiter.hit('u', 10.5) is False
+    assert limiter.hit('u', 11) is True
+
+def test_least_recently_used_window_is_evicted():
+    limiter = SlidingWindowRateLimiter(limit=1, window=100, max_keys=2)
+    limiter.hit('a', 0)
+    limiter.hit('b', 1)
+    assert limiter.hit('a', 2) is False  # 'a' становится самым свежим
+    limiter.hit('c', 3)
+
+    assert list(limiter._buckets) == ['a', 'c']
+    # Окно 'b' вытеснено: лимит для него начинается заново
+    assert limiter.hit('b', 4) is True
+    assert len(limiter) == 2
+
+def test_idle_windows_are_dropped():
+    limiter = SlidingWindowRateLimiter(limit=2, window=10)
+    limiter.hit('a', 0)
+    limiter.hit('b', 5)
+    limiter.hit('c', 12)
+    assert list(limiter._buckets) == ['b', 'c']
+
+def test_audit_buffer_is_flushed_in_one_batch(monkeypatch):
+    monkeypatch.setattr(Config, 'ANTISPAM_AUDIT_ENABLED', True)
+    monkeypatch.setattr(AntiSpamService, '_limiter', SlidingWindowRateLimiter(limit=2, window=60))
+    monkeypatch.setattr(AntiSpamService, '_audit_buffer', deque(maxlen=10))
+
+    results = [AntiSpamService.check_spam(7, "user_action") for _ in range(3)]
+    results.append(AntiSpamService.check_spam(8, "user_action"))
+    # Отклоненное действие в аудит не попадает
+    assert results == [False, False, True, False]
+
+    assert asyncio.run(AntiSpamService.flush_audit()) == 3
+    assert not AntiSpamService._audit_buffer
+    assert asyncio.run(AntiSpamService.flush_audit()) == 0
+
+    session = Session()
+    try:
+        rows = session.execute(select(UserActivity.user_id, UserActivity.action_type)).all()
+    finally:
+        session.close()
+    assert sorted(rows) == [(7, "user_action"), (7, "user_action"), (8, "user_action")]
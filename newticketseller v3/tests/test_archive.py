@@ -0,0 +1,40 @@
+import asyncio
+import os
+from sqlalchemy import select
+from database.session import Session
+from database.models import BackupBlob, File, TicketArchive
+from services.archive import ArchiveService
+from test_file_cleanup import add_backup, days_ago
+from test_recovery import add_ticket
+from config import Config
+
+def test_packed_tickets_read_back_unchanged(monkeypatch):
+    monkeypatch.setattr(Config, 'ARCHIVE_PACK_SIZE', 2)
+    old = Config.ARCHIVE_AFTER_DAYS + 1
+    contents = {}
+    for i in range(1, 4):
+        content = b"%PDF ticket " + bytes([i]) * (100 * i)
+        contents[add_ticket(f"aaaa000{i}", content, distributed=True, distributed_at=days_ago(old))] = content
+    recent = add_ticket("bbbb0001", b"%PDF recent", distributed=True, distributed_at=days_ago(1))
+    for file_id in contents:
+        add_backup(file_id)
+
+    report = asyncio.run(ArchiveService.pack_old_tickets())
+    assert (report.packs, report.files) == (2, 3)
+
+    session = Session()
+    try:
+        files = {file.id: file for file in session.scalars(select(File))}
+        archives = {archive.id: archive for archive in session.scalars(select(TicketArchive))}
+        assert not session.scalars(select(BackupBlob)).all()
+    finally:
+        session.close()
+
+    for file_id, content in contents.items():
+        file = files[file_id]
+        assert file.backup_path is None and not os.path.exists(file.file_path)
+        pack = archives[file.archive_id]
+        assert ArchiveService.read_member(pack.path, file.archive_offset, file.archive_size) == content
+        assert asyncio.run(ArchiveService.read_ticket(file)) == content
+
+    assert files[recent].archive_id is None and os.path.exists(files[recent].file_path)
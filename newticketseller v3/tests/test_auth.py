@@ -0,0 +1,81 @@
+import asyncio
+import time
+import pytest
+from database.session import Session
+from database.models import Admin
+from services.auth import AuthService
+from config import Config
+
+@pytest.fixture(autouse=True)
+def empty_admin_cache(monkeypatch):
+    """Кэш админов живет в классе — каждый тест начинает с пустого"""
+    monkeypatch.setattr(AuthService, '_admin_ids', None)
+    monkeypatch.setattr(AuthService, '_admin_ids_loaded_at', 0.0)
+    monkeypatch.setattr(AuthService, '_admin_lock', asyncio.Lock())
+
+def count_loads(monkeypatch) -> list:
+    loads = []
+    load_admins = AuthService.load_admins
+
+    async def counted():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return await load_admins()
+
+    monkeypatch.setattr(AuthService, 'load_admins', counted)
+    return loads
+
+def add_admin_row(user_id: int):
+    """Админ, добавленный в БД в обход кэша (например, другим процессом)"""
+    session = Session()
+    try:
+        session.add(Admin(user_id=user_id, added_by=1))
+        session.commit()
+    finally:
+        session.close()
+
+def test_cache_is_reloaded_after_ttl():
+    assert asyncio.run(AuthService.is_admin(555)) is False
+    add_admin_row(555)
+    assert asyncio.run(AuthService.is_admin(555)) is False  # еще действует кэш
+
+    AuthService._admin_ids_loaded_at = time.monotonic() - Config.ADMIN_CACHE_TTL - 1
+    assert asyncio.run(AuthService.is_admin(555)) is True
+
+def test_add_and_remove_update_cache_without_reload(monkeypatch):
+    async def scenario():
+        assert await AuthService.is_admin(556) is False
+        loads = count_loads(monkeypatch)
+
+        assert await AuthService.add_admin(556, added_by=1)
+        assert await AuthService.is_admin(556) is True
+        assert await AuthService.remove_admin(556)
+        assert await AuthService.is_admin(556) is False
+
+        # Админ из Config.ADMIN_IDS остается админом и после удаления из БД
+        owner = Config.ADMIN_IDS[0]
+        assert await AuthService.add_admin(owner, added_by=1)
+        assert await AuthService.remove_admin(owner)
+        assert await AuthService.is_admin(owner) is True
+        return loads
+
+    assert asyncio.run(scenario()) == []
+
+def test_invalidate_forces_reload():
+    async def scenario():
+        await AuthService.is_admin(557)
+        add_admin_row(557)
+        AuthService.invalidate_admins()
+        return await AuthService.is_admin(557)
+
+    assert asyncio.run(scenario()) is True
+
+def test_concurrent_lookups_load_cache_once(monkeypatch):
+    loads = count_loads(monkeypatch)
+    add_admin_row(558)
+
+    async def scenario():
+        return await asyncio.gather(*(AuthService.is_admin(558) for _ in range(20)))
+
+    assert asyncio.run(scenario()) == [True] * 20
+    assert loads == [1]
@@ -0,0 +1,58 @@
+import asyncio
+import os
+from sqlalchemy import select
+from telegram.error import BadRequest
+from database.session import AsyncSession, Session
+from database.models import BackupBlob, File
+from services.backup_store import BackupStore
+from services.file_manager import FileManager
+from services.rate_limiter import SlidingWindowRateLimiter
+from services.recovery import RecoveryService
+from test_delivery import add_users
+from test_recovery import add_ticket, TICKET
+
+def test_same_content_is_stored_once_and_restored(fake_app, no_rate_limit, monkeypatch):
+    monkeypatch.setattr(RecoveryService, '_limiter', SlidingWindowRateLimiter(limit=10, window=60))
+    first, second = add_users(2)
+    ids = [add_ticket("aaaa0001"), add_ticket("bbbb0002"), add_ticket("cccc0003", b"%PDF other")]
+
+    async def deliver():
+        for user in (first, second):
+            assert await FileManager.deliver_next_file(user, fake_app) is True
+
+    asyncio.run(deliver())
+    session = Session()
+    try:
+        files = [session.get(File, file_id) for file_id in ids]
+        blobs = session.scalars(select(BackupBlob)).all()
+    finally:
+        session.close()
+
+    # Две доставки одинакового содержимого — одна копия с двумя ссылками
+    assert files[0].backup_path == files[1].backup_path
+    assert files[2].backup_path is None
+    assert [(blob.path, blob.ref_count) for blob in blobs] == [(files[0].backup_path, 2)]
+    assert BackupStore.file_sha256(files[0].backup_path) == BackupStore.file_sha256(files[0].file_path)
+
+    for file in files[:2]:
+        os.remove(file.file_path)
+    fake_app.bot.errors = {second.user_id: [BadRequest("Message to copy not found"), BadRequest("Wrong file identifier")]}
+    assert asyncio.run(RecoveryService.recover_ticket(second, fake_app)) == 'backup'
+    assert fake_app.bot.uploads[-1] == (second.user_id, TICKET)
+
+    async def release():
+        session = AsyncSession()
+        try:
+            released = [await BackupStore.release(session, files[0].backup_path) for _ in range(2)]
+            await session.commit()
+            return released
+        finally:
+            await session.close()
+
+    # Файл копии можно удалять, только когда снята последняя ссылка
+    assert asyncio.run(release()) == [None, files[0].backup_path]
+    session = Session()
+    try:
+        assert not session.scalars(select(BackupBlob)).all()
+    finally:
+        session.close()
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from sqlalchemy.ext.asyncio import AsyncSession as OrmAsyncSession
+from database.session import Session
+from database.models import User, BroadcastJob, BroadcastRecipient
+from services import bot_api
+from services.broadcast import BroadcastEngine, BroadcastJobService, BroadcastMessage
+from config import Config
+
+def add_users(count: int):
+    session = Session()
+    try:
+        session.add_all([User(user_id=1000 + i, file_hash=f"hash{i}", has_access=True) for i in range(count)])
+        session.commit()
+    finally:
+        session.close()
+
+def test_resume_while_runner_stops_is_not_lost(fake_app, no_rate_limit, monkeypatch):
+    add_users(5)
+    original_get = OrmAsyncSession.get
+    resumed = []
+
+    async def get(self, entity, ident, **kwargs):
+        job = await original_get(self, entity, ident, **kwargs)
+        if entity is BroadcastJob and job is not None and job.status == 'paused' and not resumed:
+            # /bresume приходит, когда раннер уже увидел паузу, но еще не завершился
+            resumed.append(await BroadcastJobService.resume(fake_app, ident))
+        return job
+
+    async def scenario():
+        job = await BroadcastJobService.create(1, BroadcastMessage('text', text="hi"))
+        await BroadcastJobService.pause(job.id)
+        BroadcastJobService._tasks[job.id] = fake_app.create_task(BroadcastJobService._run(fake_app, job.id))
+        await fake_app.wait_tasks()
+        return job.id
+
+    monkeypatch.setattr(OrmAsyncSession, 'get', get)
+    job_id = asyncio.run(scenario())
+
+    assert resumed == [True]
+    assert sorted(chat_id for chat_id, _ in fake_app.bot.sent) == [1000 + i for i in range(5)]
+    session = Session()
+    try:
+        assert session.get(BroadcastJob, job_id).status == 'done'
+        assert not session.scalars(select(BroadcastRecipient).filter_by(status='pending')).all()
+    finally:
+        session.close()
+    assert not BroadcastJobService._tasks
+
+def test_engine_retries_flood_limit_and_classifies_failures(fake_app, no_rate_limit):
+    fake_app.bot.errors = {
+        1: [RetryAfter(0.05)],
+        2: Forbidden("Forbidden: bot was blocked by the user"),
+        3: BadRequest("Chat not found"),
+        4: BadRequest("Message is too long"),
+    }
+
+    report = asyncio.run(BroadcastEngine(fake_app.bot).run([1, 2, 3, 4, 5], BroadcastMessage('text', text="hi")))
+
+    assert sorted(report.sent_users) == [1, 5]
+    assert sorted(report.unreachable_users) == [2, 3]
+    assert report.failed_users == [4]
+
+@pytest.mark.benchmark
+def test_broadcast_throughput_benchmark(fake_app, no_rate_limit):
+    """Сквозная рассылка через BroadcastJobService на локальном фейковом Bot API"""
+    count = 1000 * int(os.getenv('BENCHMARK_SCALE', '1'))
+    fake_app.bot.latency = 0.05  # время ответа Bot API
+    add_users(count)
+
+    async def scenario():
+        started = time.monotonic()
+        job = await BroadcastJobService.create(1, BroadcastMessage('text', text="hi"))
+        BroadcastJobService.start(fake_app, job.id)
+        await fake_app.wait_tasks()
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+    print(f"\n{count} сообщений за {elapsed:.2f} с ({count / elapsed:.0f} в секунду, "
+          f"{Config.BROADCAST_CONCURRENCY} отправителей, ответ API {fake_app.bot.latency * 1000:.0f} мс)")
+    assert len(fake_app.bot.sent) == count
+    # Последовательная рассылка заняла бы count * latency
+    assert elapsed < count * fake_app.bot.latency / 4
+
+@pytest.mark.benchmark
+def test_broadcast_respects_bot_api_rate(fake_app, monkeypatch):
+    """С настоящим лимитером рассылка не превышает BOT_API_RATE сообщений в секунду"""
+    monkeypatch.setattr(bot_api, 'api_limiter', bot_api.BotApiLimiter(
+        rate=Config.BOT_API_RATE, per_chat_interval=Config.BOT_API_PER_CHAT_INTERVAL
+    ))
+    count = 3 * Config.BOT_API_RATE
+    sent_at = []
+    send = fake_app.bot.send_message
+
+    async def timed_send(chat_id, text, **kwargs):
+        sent_at.append(time.monotonic())
+        return await send(chat_id, text, **kwargs)
+
+    monkeypatch.setattr(fake_app.bot, 'send_message', timed_send)
+    report = asyncio.run(BroadcastEngine(fake_app.bot).run(range(count), BroadcastMessage('text', text="hi")))
+
+    assert report.sent == count
+    # Первые BOT_API_RATE сообщений уходят сразу (емкость ведра), остальные — по rate в секунду
+    elapsed = sent_at[-1] - sent_at[0]
+    print(f"\n{count} сообщений за {elapsed:.2f} с при лимите {Config.BOT_API_RATE}/с")
+    assert elapsed >= (count - Config.BOT_API_RATE) / Config.BOT_API_RATE * 0.95
+
+def test_job_leased_by_another_instance_is_not_resent(fake_app, no_rate_limit, monkeypatch):
+    add_users(3)
+
+    async def scenario():
+        job = await BroadcastJobService.create(1, BroadcastMessage('text', text="hi"))
+        monkeypatch.setattr(BroadcastJobService, 'owner', 'instance-a')
+        assert await BroadcastJobService._claim() == [job.id]
+
+        # Второй экземпляр не берет задачу, пока аренда первого действует
+        monkeypatch.setattr(BroadcastJobService, 'owner', 'instance-b')
+        assert await BroadcastJobService.resume_all(fake_app) == 0
+        BroadcastJobService.start(fake_app, job.id)
+        await fake_app.wait_tasks()
+        assert not fake_app.bot.sent
+
+        # Первый экземпляр упал: после истечения аренды задачу подхватывает второй
+        session = Session()
+        try:
+            session.get(BroadcastJob, job.id).lease_until = datetime.utcnow() - timedelta(seconds=1)
+            session.commit()
+        finally:
+            session.close()
+        assert await BroadcastJobService.resume_all(fake_app) == 1
+        await fake_app.wait_tasks()
+        return job.id
+
+    job_id = asyncio.run(scenario())
+
+    assert sorted(chat_id for chat_id, _ in fake_app.bot.sent) == [1000, 1001, 1002]
+    session = Session()
+    try:
+        job = session.get(BroadcastJob, job_id)
+        assert job.status == 'done'
+        assert job.owner is None and job.lease_until is None
+    finally:
+        session.close()
+    assert not BroadcastJobService._tasks
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import pytest
+from types import SimpleNamespace
+from collections import Counter
+from sqlalchemy import select, func
+from database.session import Session
+from database.models import User, File, FileDelivery
+from services.backup_store import BackupStore
+from services.delivery import DeliveryEngine
+from services.file_manager import FileManager
+from services.subscription import SubscriptionService
+from config import Config
+
+def add_users(count: int) -> list:
+    session = Session()
+    try:
+        users = [
+            User(user_id=1000 + i, file_hash=f"hash{i}", has_access=True, files_received=0, pending_file=True)
+            for i in range(count)
+        ]
+        session.add_all(users)
+        session.commit()
+        for user in users:
+            session.refresh(user)
+        session.expunge_all()
+        return users
+    finally:
+        session.close()
+
+def add_files(count: int):
+    session = Session()
+    try:
+        session.add_all([
+            File(
+                original_name=f"ticket{i}.pdf",
+                hash_name=f"file{i}",
+                file_path=f"pdf_files/file{i}.pdf",
+                distributed=False,
+                telegram_file_id=f"tg-file-{i}"
+            )
+            for i in range(count)
+        ])
+        session.commit()
+    finally:
+        session.close()
+
+def test_bookkeeping_failure_keeps_ticket_claimed(fake_app, no_rate_limit, monkeypatch):
+    """Ошибка учета после успешной отправки не возвращает билет в пул"""
+    async def broken_store(*args, **kwargs):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(BackupStore, 'store', broken_store)
+
+    first, second = add_users(2)
+    add_files(1)
+
+    assert asyncio.run(FileManager.deliver_next_file(first, fake_app)) is True
+    assert asyncio.run(FileManager.deliver_next_file(second, fake_app)) is None
+
+    assert [chat_id for chat_id, _ in fake_app.bot.sent] == [first.user_id]
+    session = Session()
+    try:
+        ticket = session.scalar(select(File))
+        assert ticket.distributed and ticket.distributed_to == first.user_id
+    finally:
+        session.close()
+
+def test_failed_send_releases_ticket(fake_app, no_rate_limit):
+    first, second = add_users(2)
+    add_files(1)
+    fake_app.bot.errors[first.user_id] = RuntimeError("timeout")
+
+    assert asyncio.run(FileManager.deliver_next_file(first, fake_app)) is False
+    assert asyncio.run(FileManager.deliver_next_file(second, fake_app)) is True
+    assert [chat_id for chat_id, _ in fake_app.bot.sent] == [second.user_id]
+
+def test_concurrent_delivery_sells_each_ticket_once(fake_app, no_rate_limit):
+    """Параллельные воркеры не выдают один билет двум пользователям"""
+    fake_app.bot.latency = 0.01
+    users = add_users(20)
+    add_files(12)
+
+    report = asyncio.run(DeliveryEngine(fake_app, concurrency=8).run(users))
+
+    assert report.sent == 12
+    assert len(report.no_file_users) == 8
+    documents = Counter(payload for _, payload in fake_app.bot.sent)
+    assert len(documents) == 12 and set(documents.values()) == {1}
+
+    session = Session()
+    try:
+        owners = session.scalars(select(File.distributed_to)).all()
+        assert len(set(owners)) == 12
+        assert session.scalar(select(func.count()).select_from(FileDelivery)) == 12
+    finally:
+        session.close()
+
+def test_concurrent_sweeps_deliver_one_ticket_per_user(fake_app, no_rate_limit):
+    """Перекрывающиеся рассылки (/start, send_pending) не выдают пользователю второй билет"""
+    fake_app.bot.latency = 0.01
+    add_users(1)
+    add_files(3)
+
+    async def sweeps():
+        await asyncio.gather(*(SubscriptionService.auto_send_to_new_users(fake_app) for _ in range(3)))
+
+    asyncio.run(sweeps())
+
+    assert len(fake_app.bot.sent) == 1
+    session = Session()
+    try:
+        assert session.scalar(select(func.count()).select_from(File).filter_by(distributed=True)) == 1
+        user = session.scalar(select(User))
+        assert (user.files_received, user.pending_file) == (1, False)
+    finally:
+        session.close()
+
+def test_failed_send_keeps_user_pending(fake_app, no_rate_limit):
+    first, = add_users(1)
+    add_files(1)
+    fake_app.bot.errors[first.user_id] = [RuntimeError("timeout")]
+
+    assert asyncio.run(FileManager.deliver_next_file(first, fake_app)) is False
+    assert asyncio.run(FileManager.deliver_next_file(first, fake_app)) is True
+    assert asyncio.run(FileManager.deliver_next_file(first, fake_app)) == FileManager.SKIPPED
+
+def test_delivery_counter_is_incremented_in_sql(fake_app, no_rate_limit):
+    """Параллельные записи доставок одному пользователю не теряют приращения счетчика"""
+    user, = add_users(1)
+    add_files(4)
+    session = Session()
+    try:
+        files = session.scalars(select(File)).all()
+        session.expunge_all()
+    finally:
+        session.close()
+    message = SimpleNamespace(message_id=1, document=None)
+
+    async def record():
+        await asyncio.gather(*(FileManager._record_delivery(user, file, message) for file in files))
+
+    asyncio.run(record())
+    session = Session()
+    try:
+        assert session.scalar(select(User.files_received)) == 4
+    finally:
+        session.close()
+
+@pytest.mark.benchmark
+def test_delivery_throughput_benchmark(fake_app, no_rate_limit):
+    """Выдача билетов воркерами DeliveryEngine против последовательной на фейковом Bot API"""
+    count = 50 * int(os.getenv('BENCHMARK_SCALE', '1'))
+    fake_app.bot.latency = 0.1  # время ответа Bot API
+    add_files(2 * count)
+    os.makedirs('pdf_files', exist_ok=True)
+    for i in range(2 * count):
+        with open(f"pdf_files/file{i}.pdf", 'wb') as f:
+            f.write(b"%PDF ticket " + str(i).encode())
+
+    def deliver(concurrency: int, first_user: int) -> float:
+        session = Session()
+        try:
+            users = [
+                User(user_id=first_user + i, file_hash=f"bench{first_user + i}",
+                     has_access=True, files_received=0, pending_file=True)
+                for i in range(count)
+            ]
+            session.add_all(users)
+            session.commit()
+            for user in users:
+                session.refresh(user)
+            session.expunge_all()
+        finally:
+            session.close()
+
+        async def run():
+            return await DeliveryEngine(fake_app, concurrency).run(users)
+
+        report = asyncio.run(run())
+        assert report.sent == count
+        return report.rate
+
+    sequential = deliver(1, 10_000)
+    parallel = deliver(Config.DELIVERY_CONCURRENCY, 20_000)
+    print(f"\n{count} билетов: последовательно {sequential:.0f}/с, "
+          f"{Config.DELIVERY_CONCURRENCY} воркеров {parallel:.0f}/с "
+          f"(ответ API {fake_app.bot.latency * 1000:.0f} мс)")
+    assert len(fake_app.bot.sent) == 2 * count
+    assert parallel > sequential * 2
@@ -0,0 +1,37 @@
+import asyncio
+import csv
+import openpyxl
+from database.session import Session
+from database.models import User
+from utils.excel_generator import ReportExporter
+
+NAMES = ["=HYPERLINK(\"http://evil\",\"x\")", "+1+2", "-3", "@SUM(A1)", "Иван"]
+
+def add_users():
+    session = Session()
+    try:
+        session.add_all([
+            User(user_id=1000 + i, username=name, first_name=name, file_hash=f"hash{i}")
+            for i, name in enumerate(NAMES)
+        ])
+        session.commit()
+    finally:
+        session.close()
+
+def test_csv_cells_are_not_formulas():
+    add_users()
+    report, _ = asyncio.run(ReportExporter.export('users', 'csv'))
+
+    with open(report.path, newline='', encoding='utf-8-sig') as report_file:
+        rows = list(csv.reader(report_file, delimiter=';'))
+    names = [row[3] for row in rows[1:]]
+    assert names == ["'" + name for name in NAMES[:4]] + ["Иван"]
+    assert rows[1][1] == "1000"  # числа не экранируются
+
+def test_xlsx_cells_are_not_formulas():
+    add_users()
+    report, _ = asyncio.run(ReportExporter.export('users', 'xlsx'))
+
+    sheet = openpyxl.load_workbook(report.path).active
+    names = [row[3] for row in sheet.iter_rows(min_row=2, values_only=True)]
+    assert names == ["'" + name for name in NAMES[:4]] + ["Иван"]
@@ -0,0 +1,56 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from database.session import AsyncSession, Session
+from database.models import BackupBlob, File
+from services.backup_store import BackupStore
+from services.file_cleanup import FileCleanupService
+from test_recovery import add_ticket
+from config import Config
+
+def days_ago(days: int) -> datetime:
+    return datetime.utcnow() - timedelta(days=days)
+
+def add_backup(file_id: int):
+    async def store():
+        session = AsyncSession()
+        try:
+            file = await session.get(File, file_id)
+            file.backup_path = await BackupStore.store(session, file.file_path)
+            await session.commit()
+        finally:
+            await session.close()
+
+    asyncio.run(store())
+
+def test_retention_keeps_recently_distributed_tickets(monkeypatch):
+    monkeypatch.setattr(Config, 'CLEANUP_CHUNK_SIZE', 2)
+    expired = add_ticket("aaaa0001", b"%PDF a", upload_date=days_ago(200))
+    distributed_long_ago = add_ticket(
+        "bbbb0002", b"%PDF b", upload_date=days_ago(200), distributed=True, distributed_at=days_ago(60)
+    )
+    in_grace = add_ticket(
+        "cccc0003", b"%PDF c", upload_date=days_ago(200), distributed=True,
+        distributed_at=days_ago(Config.CLEANUP_GRACE_DAYS - 1)
+    )
+    fresh = add_ticket("dddd0004", b"%PDF d", upload_date=days_ago(10))
+    add_backup(distributed_long_ago)
+    add_backup(in_grace)
+
+    report = asyncio.run(FileCleanupService.delete_old_files(months=6))
+
+    assert report.deleted == 2
+    # Два билета и резервная копия второго (жесткая ссылка место не освобождает)
+    assert report.removed_files == 3
+    assert report.bytes_freed == len(b"%PDF a") + len(b"%PDF b")
+    session = Session()
+    try:
+        kept = {file.id: file for file in session.scalars(select(File))}
+        blobs = session.scalars(select(BackupBlob)).all()
+    finally:
+        session.close()
+    assert sorted(kept) == [in_grace, fresh]
+    assert all(os.path.exists(file.file_path) for file in kept.values())
+    assert [blob.path for blob in blobs] == [kept[in_grace].backup_path]
+    assert os.path.exists(kept[in_grace].backup_path)
@@ -0,0 +1,70 @@
+import os
+import shutil
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session as OrmSession
+from database.session import Session
+from database.models import File
+from services.file_layout import FileLayout
+from config import Config
+
+def write(path: str, data: bytes = b"%PDF ticket"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def add_file(hash_name: str, file_path: str) -> int:
+    session = Session()
+    try:
+        file = File(original_name="t.pdf", hash_name=hash_name, file_path=file_path, distributed=False)
+        session.add(file)
+        session.commit()
+        return file.id
+    finally:
+        session.close()
+
+def stored_path(file_id: int) -> str:
+    session = Session()
+    try:
+        return session.scalar(select(File.file_path).where(File.id == file_id))
+    finally:
+        session.close()
+
+@pytest.fixture(autouse=True)
+def empty_folders():
+
+    for folder in (Config.UPLOAD_FOLDER, Config.BACKUP_FOLDER):
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+def test_failed_batch_moves_files_back(monkeypatch):
+    flat = os.path.join(Config.UPLOAD_FOLDER, "abcd1234.pdf")
+    write(flat)
+    file_id = add_file("abcd1234", flat)
+
+    def failing_commit(self):
+        raise RuntimeError("database is locked")
+    with monkeypatch.context() as patch:
+        patch.setattr(OrmSession, 'commit', failing_commit)
+        FileLayout.migrate()
+
+    assert os.path.exists(flat)
+    assert stored_path(file_id) == flat
+    assert FileLayout.needs_migration()
+
+    FileLayout.migrate()
+    sharded = FileLayout.sharded_path(Config.UPLOAD_FOLDER, "abcd1234.pdf")
+    assert stored_path(file_id) == sharded and os.path.exists(sharded)
+    assert not FileLayout.needs_migration()
+
+def test_rerun_fixes_rows_left_flat_after_crash():
+    """Файл уже в подпапке, запись еще с плоским путем (сбой между переносом и commit)"""
+    flat = os.path.join(Config.UPLOAD_FOLDER, "beef0001.pdf")
+    sharded = FileLayout.sharded_path(Config.UPLOAD_FOLDER, "beef0001.pdf")
+    write(sharded)
+    file_id = add_file("beef0001", flat)
+
+    assert not FileLayout.has_flat_files()
+    assert FileLayout.needs_migration()
+    FileLayout.migrate()
+    assert stored_path(file_id) == sharded
@@ -0,0 +1,198 @@
+import asyncio
+import re
+import threading
+import zipfile
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import select, update
+from conftest import FakeMessage, FakeQuery, fake_update, admin_context
+from test_delivery import add_users, add_files
+from database.session import Session
+from database.models import User, SubscriptionLink
+from handlers.admin import AdminHandler
+from handlers.callbacks import CallbackHandler
+from handlers.files import FileHandler
+from handlers.start import StartHandler
+from services.zip_ingest import ZipIngestService
+from utils.excel_generator import ReportExporter
+from config import Config
+
+class FakeDocument:
+    file_name = "tickets.zip"
+    file_id = "zip-1"
+
+    async def get_file(self):
+        async def download_to_drive(path):
+            with zipfile.ZipFile(path, 'w') as archive:
+                archive.writestr("a.pdf", b"%PDF a")
+                archive.writestr("b.pdf", b"%PDF b")
+        return SimpleNamespace(download_to_drive=download_to_drive)
+
+def test_zip_ingest_runs_outside_the_handler(fake_app, monkeypatch):
+    release = threading.Event()
+    ingest = ZipIngestService.ingest
+
+    def slow_ingest(zip_path, progress=None):
+        release.wait(5)
+        return ingest(zip_path, progress)
+
+    monkeypatch.setattr(ZipIngestService, 'ingest', slow_ingest)
+    message = FakeMessage(document=FakeDocument())
+
+    async def scenario():
+        await asyncio.wait_for(
+            FileHandler.handle_document(fake_update(message=message), admin_context(fake_app)), 1
+        )
+        assert message.texts == ["📦 Начинаю обработку ZIP архива..."]
+        release.set()
+        await fake_app.wait_tasks()
+
+    asyncio.run(scenario())
+    assert message.texts[-1].startswith("✅ ZIP архив обработан!\n📄 Загружено файлов: 2 из 2")
+
+def test_send_pending_reports_when_delivery_finishes(fake_app, no_rate_limit):
+    add_users(3)
+    add_files(3)
+    query = FakeQuery("send_pending")
+
+    async def scenario():
+        fake_app.bot.gate = asyncio.Event()
+        await asyncio.wait_for(
+            CallbackHandler.button_handler(fake_update(callback_query=query), admin_context(fake_app)), 1
+        )
+        assert query.texts[-1] == "🔄 Начинаю отправку файлов 3 пользователям..."
+
+        # Повторное нажатие не запускает вторую отправку
+        again = FakeQuery("send_pending")
+        await CallbackHandler.button_handler(fake_update(callback_query=again), admin_context(fake_app))
+        assert again.texts[-1].startswith("⏳")
+
+        fake_app.bot.gate.set()
+        await fake_app.wait_tasks()
+
+    asyncio.run(scenario())
+    assert query.texts[-1].startswith("✅ Автоматическая отправка завершена!\n\n📨 Успешно отправлено: 3/3")
+    assert len(fake_app.bot.sent) == 3
+
+def test_report_export_runs_once_in_the_background(fake_app, monkeypatch):
+    release = threading.Event()
+    builds = []
+    build = ReportExporter._build
+
+    def slow_build(kind, fmt):
+        builds.append(kind)
+        release.wait(5)
+        return build(kind, fmt)
+
+    monkeypatch.setattr(ReportExporter, '_build', slow_build)
+
+    async def scenario():
+        for _ in range(2):
+            context = admin_context(fake_app)
+            context.args = ['users', 'csv']
+            await asyncio.wait_for(AdminHandler.export_report(fake_update(message=FakeMessage()), context), 1)
+        while len(fake_app.bot.sent) < 2:  # оба запроса ответили и ждут сборку
+            await asyncio.sleep(0.01)
+        release.set()
+        await fake_app.wait_tasks()
+
+    asyncio.run(scenario())
+    assert builds == ['users']
+    documents = [payload for _, payload in fake_app.bot.sent if payload == 'upload']
+    assert len(documents) == 2
+
+def test_start_delivers_only_to_the_activating_user(fake_app, no_rate_limit):
+    waiting, = add_users(1)
+    add_files(2)
+    session = Session()
+    try:
+        session.add(SubscriptionLink(token="tok", created_by=1))
+        session.commit()
+    finally:
+        session.close()
+    message = FakeMessage(500)
+    context = SimpleNamespace(application=fake_app, bot=fake_app.bot, args=["tok"])
+
+    async def scenario():
+        fake_app.bot.gate = asyncio.Event()
+        # Ответ приходит, не дожидаясь отправки билета
+        await asyncio.wait_for(StartHandler.start(fake_update(500, message=message), context), 1)
+        assert message.texts[-1].startswith("🎉 Подписка успешно активирована!")
+        fake_app.bot.gate.set()
+        await fake_app.wait_tasks()
+
+    asyncio.run(scenario())
+    assert [chat_id for chat_id, _ in fake_app.bot.sent] == [500]
+    session = Session()
+    try:
+        assert session.scalar(select(User.pending_file).filter_by(user_id=waiting.user_id)) is True
+    finally:
+        session.close()
+
+def press(application, data: str) -> FakeQuery:
+    query = FakeQuery(data)
+    asyncio.run(CallbackHandler.button_handler(fake_update(callback_query=query), admin_context(application)))
+    return query
+
+def shown_users(query) -> list:
+    return [int(user_id) for user_id in re.findall(r"👤 (\d+)", query.texts[-1])]
+
+def add_subscribers():
+    """Пять подписчиков 1000-1004, билет уже получили 1001 и 1003"""
+    add_users(5)
+    session = Session()
+    try:
+        session.execute(
+            update(User).where(User.user_id.in_([1001, 1003])).values(files_received=1, pending_file=False)
+        )
+        session.commit()
+    finally:
+        session.close()
+
+def test_subscribers_pager_moves_forward_and_back(fake_app, monkeypatch):
+    monkeypatch.setattr(Config, 'SUBSCRIBERS_PAGE_SIZE', 2)
+    add_subscribers()
+
+    first = press(fake_app, "subscribers_list")
+    assert shown_users(first) == [1000, 1001]
+    with pytest.raises(KeyError):
+        first.button("⬅️ Назад")
+
+    second = press(fake_app, first.button("Вперед ➡️"))
+    assert shown_users(second) == [1002, 1003]
+    last = press(fake_app, second.button("Вперед ➡️"))
+    assert shown_users(last) == [1004]
+    with pytest.raises(KeyError):
+        last.button("Вперед ➡️")
+
+    back = press(fake_app, last.button("⬅️ Назад"))
+    assert shown_users(back) == [1002, 1003]
+    assert shown_users(press(fake_app, back.button("⬅️ Назад"))) == [1000, 1001]
+
+def test_subscribers_pager_switches_filters(fake_app, monkeypatch):
+    monkeypatch.setattr(Config, 'SUBSCRIBERS_PAGE_SIZE', 2)
+    add_subscribers()
+    first = press(fake_app, "subscribers_list")
+
+    received = press(fake_app, first.button("Получили билет"))
+    assert received.texts[-1].startswith("👥 Получили билет")
+    assert shown_users(received) == [1001, 1003]
+    with pytest.raises(KeyError):
+        received.button("Вперед ➡️")
+
+    pending = press(fake_app, received.button("Ожидают билет"))
+    assert shown_users(pending) == [1000, 1002]
+    assert shown_users(press(fake_app, pending.button("Вперед ➡️"))) == [1004]
+
+    # Пустая страница: ни подписчиков, ни кнопок навигации
+    blocked = press(fake_app, pending.button("Заблокированные"))
+    assert blocked.texts[-1] == "👥 Заблокированные:\n\nНет подписчиков"
+    assert len(blocked.reply_markup.inline_keyboard) == 3
+
+def test_back_button_returns_to_admin_panel(fake_app):
+    """У callback-апдейта нет update.message: панель открывается правкой сообщения"""
+    add_subscribers()
+    for menu in ("subscribers_list", "reports"):
+        query = press(fake_app, press(fake_app, menu).button("🔙 В панель"))
+        assert query.texts[-1].startswith("👑 Панель управления")
+        assert query.button("👥 Список подписчиков") == "subscribers_list"
@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import inspect, select, text
+from database.session import Session, engine
+from database.models import BroadcastJob
+from database.migrations import add_column, create_indexes, check_query_plans
+
+def test_add_column_restores_model_column_with_default():
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE broadcast_jobs DROP COLUMN skipped"))
+        add_column(conn, 'broadcast_jobs', 'skipped')
+        add_column(conn, 'broadcast_jobs', 'skipped')  # повторный вызов ничего не меняет
+        conn.execute(text("INSERT INTO broadcast_jobs (created_by, status) VALUES (1, 'done')"))
+
+    columns = {column['name']: column for column in inspect(engine).get_columns('broadcast_jobs')}
+    assert columns['skipped']['type'].python_type is int
+    session = Session()
+    try:
+        assert session.scalar(select(BroadcastJob.skipped)) == 0
+    finally:
+        session.close()
+
+@pytest.mark.skipif(engine.dialect.name != 'sqlite', reason="EXPLAIN QUERY PLAN есть только в SQLite")
+def test_hot_queries_use_indexes():
+    assert check_query_plans(engine) == {}
+
+@pytest.mark.skipif(engine.dialect.name != 'sqlite', reason="EXPLAIN QUERY PLAN есть только в SQLite")
+def test_query_plan_check_reports_missing_index():
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_file_deliveries_user_id"))
+    engine.dispose()  # в кэше запросов соединения остался план со старым индексом
+    try:
+        assert list(check_query_plans(engine)) == ['user_deliveries']
+    finally:
+        with engine.begin() as conn:
+            create_indexes(conn, 'file_deliveries', 'ix_file_deliveries_user_id')
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import shutil
+import pytest
+from database.session import Session
+from database.models import File
+from services.file_layout import FileLayout
+from services.reconciliation import ReconciliationService
+from config import Config
+
+def write(path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b"%PDF ticket")
+
+def add_file(hash_name: str, file_path: str):
+    session = Session()
+    try:
+        session.add(File(original_name="t.pdf", hash_name=hash_name, file_path=file_path, distributed=False))
+        session.commit()
+    finally:
+        session.close()
+
+@pytest.fixture(autouse=True)
+def empty_folders():
+    for folder in (Config.UPLOAD_FOLDER, Config.BACKUP_FOLDER):
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+def test_reconciliation_keeps_files_referenced_by_flat_path(monkeypatch):
+    monkeypatch.setattr(Config, 'RECONCILE_DELETE_ORPHANS', True)
+    # ctime только что созданных файлов не состарить, поэтому окно отключено
+    monkeypatch.setattr(Config, 'RECONCILE_GRACE', -60)
+    flat = os.path.join(Config.UPLOAD_FOLDER, "cafe0001.pdf")
+    sharded = FileLayout.sharded_path(Config.UPLOAD_FOLDER, "cafe0001.pdf")
+    orphan = FileLayout.sharded_path(Config.UPLOAD_FOLDER, "dead0001.pdf")
+    write(sharded)
+    write(orphan)
+    add_file("cafe0001", flat)
+
+    # Перенос не отмечен как завершенный — сверка ничего не удаляет
+    report = asyncio.run(ReconciliationService.run_slice())
+    assert report.orphans == 0 and os.path.exists(orphan)
+
+    FileLayout.migrate()
+    # Имитируем запись, оставшуюся с плоским путем уже после отметки
+    session = Session()
+    try:
+        session.query(File).update({File.file_path: flat})
+        session.commit()
+    finally:
+        session.close()
+
+    report = asyncio.run(ReconciliationService.run_slice())
+    assert os.path.exists(sharded)
+    assert not os.path.exists(orphan)
+    assert report.orphans == 1
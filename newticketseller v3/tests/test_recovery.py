@@ -0,0 +1,73 @@
+import asyncio
+import os
+import pytest
+from sqlalchemy import select
+from telegram.error import BadRequest, NetworkError
+from database.session import Session
+from database.models import File, FileDelivery
+from services.file_layout import FileLayout
+from services.file_manager import FileManager
+from services.rate_limiter import SlidingWindowRateLimiter
+from services.recovery import RecoveryService
+from test_delivery import add_users
+from config import Config
+
+TICKET = b"%PDF-1.4 ticket 0001"
+
+def add_ticket(hash_name: str = "abcd0001", content: bytes = TICKET, **fields) -> int:
+    """Билет на диске и его запись в files"""
+    path = FileLayout.upload_path(hash_name, ".pdf")
+    with open(path, 'wb') as f:
+        f.write(content)
+    session = Session()
+    try:
+        file = File(original_name=f"{hash_name}.pdf", hash_name=hash_name, file_path=path, **fields)
+        session.add(file)
+        session.commit()
+        return file.id
+    finally:
+        session.close()
+
+@pytest.fixture(autouse=True)
+def fast_recovery(monkeypatch):
+    monkeypatch.setattr(RecoveryService, '_limiter', SlidingWindowRateLimiter(limit=10, window=60))
+    monkeypatch.setattr(Config, 'BOT_API_RETRY_BACKOFF', 0.01)
+
+def last_delivery() -> FileDelivery:
+    session = Session()
+    try:
+        return session.scalar(select(FileDelivery).order_by(FileDelivery.id.desc()))
+    finally:
+        session.close()
+
+def test_recovery_replays_crashed_upload_from_backup(fake_app, no_rate_limit):
+    user, = add_users(1)
+    file_id = add_ticket()
+    assert asyncio.run(FileManager.deliver_next_file(user, fake_app)) is True
+    delivered = last_delivery()
+    assert fake_app.bot.uploads == [(user.user_id, TICKET)]
+
+    # Исходный файл потерян: остается только резервная копия
+    session = Session()
+    try:
+        os.remove(session.get(File, file_id).file_path)
+    finally:
+        session.close()
+
+    # Сообщение удалено, file_id недействителен, первая загрузка обрывается
+    fake_app.bot.errors = {user.user_id: [
+        BadRequest("Message to copy not found"),
+        BadRequest("Wrong file identifier/http url specified"),
+        NetworkError("Connection reset by peer"),
+    ]}
+    assert asyncio.run(RecoveryService.recover_ticket(user, fake_app)) == 'backup'
+    assert fake_app.bot.uploads[-1] == (user.user_id, TICKET)
+
+    recovered = last_delivery()
+    assert recovered.id == delivered.id
+    assert recovered.delivery_status == 'recovered' and recovered.recovery_attempts == 1
+    assert recovered.message_id != delivered.message_id
+
+    # Следующее восстановление копирует уже новое сообщение
+    assert asyncio.run(RecoveryService.recover_ticket(user, fake_app)) == 'copy'
+    assert fake_app.bot.sent[-1] == (user.user_id, f"copy:{recovered.message_id}")
@@ -0,0 +1,57 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from database.session import Session
+from database.models import User, SubscriptionLink
+from conftest import FakeMessage, fake_update
+from main import antispam_middleware
+from handlers.start import StartHandler
+from services.auth import AuthService
+from services.request_context import RequestContext
+from services.subscription import SubscriptionService
+
+def test_readmitted_user_can_activate_subscription():
+    session = Session()
+    try:
+        session.add(User(user_id=42, file_hash="hash42", has_access=False, unreachable_at=datetime.utcnow()))
+        session.add(SubscriptionLink(token="tok", created_by=1))
+        session.commit()
+    finally:
+        session.close()
+
+    async def scenario():
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=42))
+        request = await RequestContext.resolve(update, SimpleNamespace())
+        assert request.user.unreachable_at is None
+        return await SubscriptionService.activate_subscription(42, "tok", request=request)
+
+    assert asyncio.run(scenario()) is True
+
+    session = Session()
+    try:
+        user = session.query(User).filter_by(user_id=42).one()
+        assert user.has_access and user.unreachable_at is None
+    finally:
+        session.close()
+
+def test_start_update_costs_one_query():
+    """Middleware загружает пользователя, /start берет его из context.request"""
+    session = Session()
+    try:
+        session.add(User(user_id=4242, file_hash="hash4242", has_access=True, files_received=1))
+        session.commit()
+    finally:
+        session.close()
+    message = FakeMessage(4242)
+    update = fake_update(4242, message=message)
+    context = SimpleNamespace(args=[])
+
+    async def scenario():
+        await AuthService.load_admins()  # кэш админов загружается при запуске бота
+        await antispam_middleware(update, context)
+        await StartHandler.start(update, context)
+        return context.request
+
+    request = asyncio.run(scenario())
+    assert message.texts[-1].startswith("👋 Добро пожаловать")
+    assert request.db_queries == 1
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import time
+import pytest
+from sqlalchemy import text, select, func
+from database.session import Session, engine, async_engine
+from database.models import SubscriptionLink, User, UserActivity
+from services.antispam import AntiSpamService
+from services.subscription import SubscriptionService
+from config import Config
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != 'sqlite', reason="настройки только для SQLite")
+
+EXPECTED = {
+    'journal_mode': Config.SQLITE_JOURNAL_MODE.lower(),
+    'busy_timeout': Config.SQLITE_BUSY_TIMEOUT,
+    'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}[Config.SQLITE_SYNCHRONOUS.upper()],
+    'cache_size': Config.SQLITE_CACHE_SIZE,
+    'mmap_size': Config.SQLITE_MMAP_SIZE,
+}
+
+def test_pragmas_applied_to_sync_and_async_connections():
+    with engine.connect() as conn:
+        assert {name: conn.execute(text(f"PRAGMA {name}")).scalar() for name in EXPECTED} == EXPECTED
+
+    async def read_async():
+        async with async_engine.connect() as conn:
+            return {name: (await conn.execute(text(f"PRAGMA {name}"))).scalar() for name in EXPECTED}
+
+    assert asyncio.run(read_async()) == EXPECTED
+
+@pytest.mark.benchmark
+def test_concurrent_writers_benchmark(monkeypatch):
+    """Параллельные активации подписок и сбросы аудита антиспама не получают 'database is locked'"""
+    writers = 200 * int(os.getenv('BENCHMARK_SCALE', '1'))
+    monkeypatch.setattr(Config, 'ANTISPAM_AUDIT_ENABLED', True)
+
+    session = Session()
+    try:
+        session.add_all([SubscriptionLink(token=f"token{i}", created_by=1) for i in range(writers)])
+        session.commit()
+    finally:
+        session.close()
+
+    # Столько апдейтов бот обрабатывает одновременно (PerUserUpdateProcessor)
+    slots = None
+
+    async def activate(i: int) -> bool:
+        async with slots:
+            return await SubscriptionService.activate_subscription(5000 + i, f"token{i}")
+
+    async def audit(user_id: int) -> int:
+        async with slots:
+            AntiSpamService.check_spam(user_id, "user_action")
+            return await AntiSpamService.flush_audit()
+
+    async def scenario():
+        nonlocal slots
+        slots = asyncio.Semaphore(Config.MAX_CONCURRENT_UPDATES)
+        started = time.monotonic()
+        results = await asyncio.gather(
+            *(activate(i) for i in range(writers)),
+            *(audit(9000 + i) for i in range(writers))
+        )
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(scenario())
+    print(f"\n{2 * writers} параллельных транзакций записи за {elapsed:.2f} с ({2 * writers / elapsed:.0f} в секунду)")
+
+    assert all(results[:writers])
+    session = Session()
+    try:
+        assert session.scalar(select(func.count()).select_from(User).filter_by(has_access=True)) == writers
+        assert session.scalar(select(func.count()).select_from(UserActivity)) == writers
+    finally:
+        session.close()
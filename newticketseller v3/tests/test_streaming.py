@@ -0,0 +1,64 @@
+import asyncio
+import os
+import tracemalloc
+import pytest
+from sqlalchemy import select
+from database.session import Session
+from database.models import User
+from database.streaming import stream_keyset
+
+def add_users(start: int, stop: int):
+    if start >= stop:
+        return  # пустой список параметров вставил бы одну строку со значениями по умолчанию
+    session = Session()
+    try:
+        session.execute(User.__table__.insert(), [
+            {'user_id': 1000 + i, 'file_hash': f"hash{i}", 'has_access': i % 2 == 0, 'files_received': 0}
+            for i in range(start, stop)
+        ])
+        session.commit()
+    finally:
+        session.close()
+
+async def collect(statement, key_column, batch_size: int) -> list:
+    return [row async for row in stream_keyset(statement, key_column, batch_size)]
+
+@pytest.mark.parametrize('count', [0, 9, 10, 25])
+def test_stream_keyset_yields_every_row_once(count):
+    add_users(0, count)
+
+    users = asyncio.run(collect(select(User).filter(User.has_access == True), User.id, 5))
+    ids = asyncio.run(collect(select(User.user_id), User.user_id, 5))
+    rows = asyncio.run(collect(select(User.id, User.file_hash), User.id, 5))
+
+    assert [user.user_id for user in users] == [1000 + i for i in range(0, count, 2)]
+    assert ids == [1000 + i for i in range(count)]
+    assert [row.file_hash for row in rows] == [f"hash{i}" for i in range(count)]
+
+@pytest.mark.benchmark
+def test_stream_memory_benchmark():
+    """Пиковая память при обходе пользователей не растет вместе с их числом"""
+    sizes = [10_000 * int(os.getenv('BENCHMARK_SCALE', '1')) * factor for factor in (1, 10)]
+
+    async def walk() -> int:
+        count = 0
+        async for _ in stream_keyset(select(User), User.id):
+            count += 1
+        return count
+
+    peaks = {}
+    inserted = 0
+    for size in sizes:
+        add_users(inserted, size)
+        inserted = size
+        tracemalloc.start()
+        try:
+            assert asyncio.run(walk()) == size
+            peaks[size] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    print()
+    for size, peak in peaks.items():
+        print(f"  пользователей {size}: пик памяти {peak / 1024 / 1024:.1f} MB")
+    assert peaks[sizes[-1]] < peaks[sizes[0]] * 1.5
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import pytest
+from telegram import Update, User as TelegramUser, Message, Chat
+from database.session import Session
+from database.models import SubscriptionLink
+from services.subscription import SubscriptionService
+from services.update_processor import PerUserUpdateProcessor
+
+def make_update(update_id: int, user_id: int) -> Update:
+    user = TelegramUser(id=user_id, first_name="U", is_bot=False)
+    message = Message(message_id=update_id, date=None, chat=Chat(id=user_id, type='private'), from_user=user)
+    return Update(update_id=update_id, message=message)
+
+def test_users_run_in_parallel_but_each_user_in_order():
+    processor = PerUserUpdateProcessor(8)
+    events = []
+
+    async def handle(name: str, delay: float):
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+
+    async def scenario():
+        await asyncio.gather(
+            processor.process_update(make_update(1, 10), handle("a1", 0.05)),
+            processor.process_update(make_update(2, 10), handle("a2", 0)),
+            processor.process_update(make_update(3, 20), handle("b1", 0)),
+        )
+
+    asyncio.run(scenario())
+    # Апдейт другого пользователя не ждет медленный апдейт первого...
+    assert events.index("end b1") < events.index("end a1")
+    # ...а второй апдейт того же пользователя начинается только после первого
+    assert events.index("start a2") > events.index("end a1")
+    assert not processor._locks
+
+def test_link_is_redeemed_once_by_concurrent_users():
+    session = Session()
+    try:
+        session.add(SubscriptionLink(token="shared", created_by=1))
+        session.commit()
+    finally:
+        session.close()
+
+    async def scenario():
+        return await asyncio.gather(*(
+            SubscriptionService.activate_subscription(100 + i, "shared") for i in range(5)
+        ))
+
+    assert sorted(asyncio.run(scenario())) == [False] * 4 + [True]
+
+def test_global_limit_still_applies():
+    processor = PerUserUpdateProcessor(2)
+    running = peak = 0
+
+    async def handle():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def scenario():
+        await asyncio.gather(*(
+            processor.process_update(make_update(i, 100 + i), handle()) for i in range(6)
+        ))
+
+    asyncio.run(scenario())
+    assert peak == 2
+    assert processor.max_concurrent_updates == 2
+
+class SemaphoreFirstProcessor(PerUserUpdateProcessor):
+    """Прежний порядок: общий лимит берется до замка пользователя"""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._outer = asyncio.Semaphore(max_concurrent_updates)
+
+    async def process_update(self, update, coroutine):
+        async with self._outer:
+            await PerUserUpdateProcessor.do_process_update(self, update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+async def other_user_latency(processor, backlog: int) -> float:
+    """Сколько ждет апдейт пользователя B, пока у пользователя A очередь"""
+    loop = asyncio.get_running_loop()
+
+    async def handle(delay: float):
+        await asyncio.sleep(delay)
+
+    async def measured():
+        nonlocal finished
+        finished = loop.time()
+
+    finished = None
+    tasks = [
+        asyncio.create_task(processor.process_update(make_update(i, 10), handle(0.5 if i == 0 else 0)))
+        for i in range(backlog)
+    ]
+    await asyncio.sleep(0)
+    started = loop.time()
+    await processor.process_update(make_update(backlog, 20), measured())
+    await asyncio.gather(*tasks)
+    return finished - started
+
+@pytest.mark.benchmark
+def test_other_user_latency_benchmark():
+    """Очередь апдейтов одного пользователя не задерживает других"""
+    backlog = 6 * int(os.getenv('BENCHMARK_SCALE', '1'))
+    before = asyncio.run(other_user_latency(SemaphoreFirstProcessor(4), backlog))
+    after = asyncio.run(other_user_latency(PerUserUpdateProcessor(4), backlog))
+    print()
+    print(f"  апдейт второго пользователя: до {before * 1000:.0f} ms, после {after * 1000:.0f} ms")
+    assert before >= 0.4
+    assert after < 0.05
@@ -0,0 +1,126 @@
+import os
+import shutil
+import time
+import zipfile
+import pytest
+from sqlalchemy import select, func, text
+from database.session import Session
+from database.models import File
+from services.zip_ingest import ZipIngestService
+from config import Config
+
+@pytest.fixture(autouse=True)
+def empty_upload_folder():
+    shutil.rmtree(Config.UPLOAD_FOLDER, ignore_errors=True)
+    os.makedirs(Config.UPLOAD_FOLDER)
+
+def make_archive(path: str, count: int, size: int = 1024, start: int = 0) -> str:
+    """Синтетический архив: ``count`` билетов с разным содержимым"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(start, start + count):
+            archive.writestr(f"tickets/ticket{i}.pdf", f"%PDF ticket {i}\n".encode() + os.urandom(size))
+        archive.writestr("tickets/readme.md", b"not a ticket")
+    return path
+
+def stored_files() -> list:
+    session = Session()
+    try:
+        return session.execute(select(File.file_path, File.sha256)).all()
+    finally:
+        session.close()
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_ingest_stores_every_ticket(workers, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'INGEST_WORKERS', workers)
+    monkeypatch.setattr(Config, 'INGEST_CHUNK_SIZE', 40)
+    progress = []
+
+    report = ZipIngestService.ingest(make_archive(str(tmp_path / "a.zip"), 100), lambda r: progress.append(r.done))
+
+    assert (report.total, report.processed, report.errors) == (100, 100, [])
+    assert progress[-1] == 100
+    files = stored_files()
+    assert len(files) == 100 and len({sha256 for _, sha256 in files}) == 100
+    assert all(os.path.exists(path) for path, _ in files)
+
+@pytest.mark.benchmark
+def test_parallel_ingest_benchmark(tmp_path, monkeypatch):
+    """Скорость загрузки синтетического архива в зависимости от числа процессов"""
+    count = 2000 * int(os.getenv('BENCHMARK_SCALE', '1'))
+    monkeypatch.setattr(Config, 'INGEST_CHUNK_SIZE', max(count // 16, 1))
+    cores = os.cpu_count() or 1
+
+    results = {}
+    for round_number, workers in enumerate(sorted({1, 2, 4, cores})):
+        monkeypatch.setattr(Config, 'INGEST_WORKERS', workers)
+        archive = make_archive(str(tmp_path / f"{workers}.zip"), count, size=16 * 1024, start=round_number * count)
+        started = time.monotonic()
+        report = ZipIngestService.ingest(archive)
+        results[workers] = time.monotonic() - started
+        assert report.processed == count
+
+    print(f"\n{count} файлов, ядер: {cores}")
+    for workers, elapsed in results.items():
+        print(f"  процессов {workers}: {elapsed:.2f} с ({count / elapsed:.0f} файлов/с, x{results[1] / elapsed:.2f})")
+
+    session = Session()
+    try:
+        assert session.scalar(select(func.count()).select_from(File)) == count * len(results)
+    finally:
+        session.close()
+
+def test_duplicates_are_skipped_and_reported(tmp_path):
+    ZipIngestService.ingest(make_archive(str(tmp_path / "first.zip"), 3))
+
+    second = str(tmp_path / "second.zip")
+    with zipfile.ZipFile(str(tmp_path / "first.zip")) as first, zipfile.ZipFile(second, 'w') as archive:
+        archive.writestr("old.pdf", first.read("tickets/ticket0.pdf"))  # уже в инвентаре
+        archive.writestr("new.pdf", b"%PDF new")
+        archive.writestr("copy/new.pdf", b"%PDF new")  # повтор внутри архива
+    report = ZipIngestService.ingest(second)
+
+    assert report.processed == 1
+    assert sorted(report.duplicates) == [("new.pdf", "повтор в архиве"), ("old.pdf", "уже загружен")]
+    files = stored_files()
+    assert len(files) == 4
+    # Файлы пропущенных дубликатов не остаются на диске
+    on_disk = sum(len(names) for _, _, names in os.walk(Config.UPLOAD_FOLDER))
+    assert on_disk == len({path for path, _ in files})
+
+@pytest.mark.benchmark
+def test_duplicate_lookup_benchmark():
+    """Поиск дубликатов по ix_files_sha256 не замедляется с ростом инвентаря"""
+    sizes = [10_000 * int(os.getenv('BENCHMARK_SCALE', '1')) * factor for factor in (1, 10)]
+    batch = [f"{i:064x}" for i in range(Config.INGEST_BATCH_SIZE)]  # половина найдется, половина нет
+    batch = batch[::2] + [f"missing{i}" for i in range(len(batch) // 2)]
+
+    timings = {}
+    inserted = 0
+    session = Session()
+    try:
+        for size in sizes:
+            session.execute(File.__table__.insert(), [
+                {'original_name': 't.pdf', 'hash_name': f"h{i}", 'file_path': f"p{i}", 'sha256': f"{i:064x}",
+                 'distributed': False}
+                for i in range(inserted, size)
+            ])
+            session.commit()
+            inserted = size
+            if session.bind.dialect.name == 'postgresql':
+                session.execute(text("ANALYZE files"))  # статистика планировщика после массовой вставки
+
+            runs = []
+            for _ in range(30):
+                started = time.perf_counter()
+                found = set(session.scalars(select(File.sha256).where(File.sha256.in_(batch))))
+                runs.append(time.perf_counter() - started)
+            assert len(found) == len(batch) // 2
+            timings[size] = min(runs)  # минимум меньше всего зависит от шума машины
+    finally:
+        session.close()
+
+    print()
+    for size, elapsed in timings.items():
+        print(f"  инвентарь {size}: пачка из {len(batch)} проверяется за {elapsed * 1000:.2f} мс")
+    # Индексный поиск — O(log n) на файл: рост инвентаря в 10 раз почти не сказывается
+    assert timings[sizes[-1]] < timings[sizes[0]] * 3
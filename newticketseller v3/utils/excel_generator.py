@@ -0,0 +1,209 @@
+import asyncio
+import csv
+import glob
+import os
+import time
+from datetime import datetime
+from sqlalchemy import select
+from database.session import Session
+from database.models import User, FileDelivery, File, SubscriptionLink
+from services.logger import bot_logger
+from config import Config
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # без openpyxl отчеты выгружаются в CSV
+    Workbook = None
+
+# Строк на листе XLSX (лимит Excel 1 048 576 с учетом заголовка)
+XLSX_MAX_ROWS = 1_048_575
+
+# Начала строк, которые Excel и LibreOffice считают формулой
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def safe_cell(value):
+    """Экранирует строку, похожую на формулу (имя или username пользователя вида
+    ``=HYPERLINK(...)``), чтобы таблица показала ее как текст"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+class ReportSpec:
+    """Описание отчета: заголовки и колонки запроса, id — ключ keyset-пагинации"""
+
+    def __init__(self, title: str, key, columns: list, headers: list, join=None):
+        self.title = title
+        self.key = key
+        self.columns = columns
+        self.headers = headers
+        self.join = join
+
+    def statement(self):
+        statement = select(*self.columns)
+        if self.join is not None:
+            statement = statement.outerjoin(*self.join)
+        return statement
+
+REPORTS = {
+    'users': ReportSpec(
+        "Подписчики",
+        User.id,
+        [User.id, User.user_id, User.username, User.first_name, User.has_access, User.subscription_date,
+         User.files_received, User.pending_file, User.last_file_sent, User.is_blocked, User.blocked_at,
+         User.unreachable_at, User.file_hash],
+        ["id", "user_id", "username", "Имя", "Доступ", "Подписка с", "Получено файлов", "Ожидает файл",
+         "Последний файл", "Заблокирован", "Дата блокировки", "Недоступен с", "Хэш"]
+    ),
+    'deliveries': ReportSpec(
+        "Доставки",
+        FileDelivery.id,
+        [FileDelivery.id, FileDelivery.user_id, FileDelivery.file_id, File.original_name, FileDelivery.sent_at,
+         FileDelivery.delivery_status, FileDelivery.recovery_attempts, FileDelivery.error_message],
+        ["id", "user_id", "file_id", "Файл", "Отправлено", "Статус", "Восстановлений", "Ошибка"],
+        join=(File, File.id == FileDelivery.file_id)
+    ),
+    'links': ReportSpec(
+        "Ссылки",
+        SubscriptionLink.id,
+        [SubscriptionLink.id, SubscriptionLink.token, SubscriptionLink.created_by, SubscriptionLink.created_at,
+         SubscriptionLink.is_used, SubscriptionLink.used_by, SubscriptionLink.used_at],
+        ["id", "Токен", "Создал", "Создана", "Использована", "Кем", "Когда"]
+    ),
+}
+
+class ExportReport:
+    """Итог выгрузки отчета"""
+
+    def __init__(self, kind: str, path: str):
+        self.kind = kind
+        self.path = path
+        self.rows = 0
+        self.size = 0
+        self.elapsed = 0.0
+
+class ReportExporter:
+    """Потоковая выгрузка отчетов из БД в XLSX (openpyxl, write-only) или CSV.
+
+    Строки читаются keyset-порциями по ``EXPORT_CHUNK_SIZE`` в фоновом
+    потоке и сразу пишутся в файл, поэтому память не зависит от числа
+    строк. Одновременные запросы одного и того же отчета ждут одну сборку.
+    """
+
+    _builds = {}  # (отчет, формат) -> asyncio.Task текущей сборки
+
+    @staticmethod
+    def default_format() -> str:
+        return 'xlsx' if Workbook is not None else 'csv'
+
+    @staticmethod
+    async def export(kind: str, fmt: str = None):
+        """Собирает отчет или присоединяется к уже идущей сборке.
+
+        Возвращает (ExportReport, True, если сборка уже шла).
+        """
+        fmt = fmt or ReportExporter.default_format()
+        if fmt == 'xlsx' and Workbook is None:
+            fmt = 'csv'
+        key = (kind, fmt)
+
+        build = ReportExporter._builds.get(key)
+        joined = build is not None
+        if build is None:
+            build = asyncio.ensure_future(asyncio.to_thread(ReportExporter._build, kind, fmt))
+            ReportExporter._builds[key] = build
+            build.add_done_callback(lambda _: ReportExporter._builds.pop(key, None))
+        return await asyncio.shield(build), joined
+
+    @staticmethod
+    def _rows(spec: ReportSpec):
+        """Строки отчета порциями по keyset, каждая порция — в своей короткой сессии"""
+        last_id = 0
+        while True:
+            session = Session()
+            try:
+                rows = session.execute(
+                    spec.statement()
+                    .where(spec.key > last_id)
+                    .order_by(spec.key)
+                    .limit(Config.EXPORT_CHUNK_SIZE)
+                ).all()
+            finally:
+                session.close()
+
+            yield from rows
+            if len(rows) < Config.EXPORT_CHUNK_SIZE:
+                return
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def _remove_old(kind: str):
+        """Удаляет прошлые выгрузки отчета старше EXPORT_KEEP секунд"""
+        cutoff = time.time() - Config.EXPORT_KEEP
+        for path in glob.glob(os.path.join(Config.EXCEL_FOLDER, f"{kind}_*")):
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                os.remove(path)
+            except OSError as e:
+                bot_logger.logger.warning(f"Не удалось удалить старый отчет {path}: {e}")
+
+    @staticmethod
+    def _build(kind: str, fmt: str) -> ExportReport:
+        spec = REPORTS[kind]
+        started = time.monotonic()
+        ReportExporter._remove_old(kind)
+
+        path = os.path.join(Config.EXCEL_FOLDER, f"{kind}_{datetime.utcnow():%Y%m%d_%H%M%S}.{fmt}")
+        report = ExportReport(kind, path)
+        temp_path = f"{path}.tmp"
+        try:
+            if fmt == 'xlsx':
+                report.rows = ReportExporter._write_xlsx(spec, temp_path)
+            else:
+                report.rows = ReportExporter._write_csv(spec, temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        report.size = os.path.getsize(path)
+        report.elapsed = time.monotonic() - started
+        bot_logger.logger.info(
+            f"Отчет {kind}: {report.rows} строк, {report.size / 1024 / 1024:.1f} MB, {report.elapsed:.1f} с"
+        )
+        return report
+
+    @staticmethod
+    def _write_csv(spec: ReportSpec, path: str) -> int:
+        rows = 0
+        # utf-8-sig — чтобы Excel правильно открыл кириллицу
+        with open(path, 'w', newline='', encoding='utf-8-sig') as output:
+            writer = csv.writer(output, delimiter=';')
+            writer.writerow(spec.headers)
+            for row in ReportExporter._rows(spec):
+                writer.writerow([safe_cell(value) for value in row])
+                rows += 1
+        return rows
+
+    @staticmethod
+    def _write_xlsx(spec: ReportSpec, path: str) -> int:
+        workbook = Workbook(write_only=True)
+        sheet = None
+        sheet_rows = XLSX_MAX_ROWS
+        rows = 0
+        for row in ReportExporter._rows(spec):
+            if sheet_rows >= XLSX_MAX_ROWS:
+                # Лист заполнен — продолжаем на следующем
+                title = spec.title if sheet is None else f"{spec.title} ({len(workbook.worksheets) + 1})"
+                sheet = workbook.create_sheet(title)
+                sheet.append(spec.headers)
+                sheet_rows = 0
+            sheet.append([safe_cell(value) for value in row])
+            sheet_rows += 1
+            rows += 1
+
+        if sheet is None:
+            workbook.create_sheet(spec.title).append(spec.headers)
+        workbook.save(path)
+        return rows